@@ -0,0 +1,156 @@
+"""合成语料 - 用固定的随机种子生成，同样的参数每次生成同样的数据。
+
+包括：中英文混合的长篇（书籍）、短问答、论坛帖子，并按比例加入完全重复与近似重复的文档。
+generate_inputs 把语料写成样例转换需要的输入格式（jsonl、JSON 数组、很多小文件）。
+"""
+
+import json
+import random
+from pathlib import Path
+from typing import Dict, List, Union
+
+# 常用汉字与英文单词，用于生成中英文混合的文字
+CHINESE_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所"
+    "民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那"
+    "社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通"
+)
+ENGLISH_WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which but have an they "
+    "data model corpus text language training market report company price growth policy research system"
+).split()
+PUNCTUATION = "，。；：！？"
+
+
+def mixed_sentence(rng: random.Random, min_len: int = 8, max_len: int = 40, english_ratio: float = 0.15) -> str:
+    """生成一句中英文混合的句子。"""
+    parts = []
+    for _ in range(rng.randint(min_len, max_len)):
+        if rng.random() < english_ratio:
+            parts.append(f" {rng.choice(ENGLISH_WORDS)} ")
+        else:
+            parts.append(rng.choice(CHINESE_CHARS))
+    parts.append(rng.choice(PUNCTUATION))
+    return "".join(parts).strip()
+
+
+def mixed_paragraph(rng: random.Random, sentences: int) -> str:
+    return "".join(mixed_sentence(rng) for _ in range(sentences))
+
+
+def make_book(rng: random.Random, paragraphs: int = 2000) -> str:
+    """一本书：很多段落，用换行分隔。"""
+    return "\n".join(mixed_paragraph(rng, rng.randint(2, 8)) for _ in range(paragraphs))
+
+
+def make_qa(rng: random.Random) -> Dict[str, str]:
+    """一条短问答。"""
+    return {
+        "question": mixed_sentence(rng, 6, 30),
+        "answer": mixed_paragraph(rng, rng.randint(1, 3)),
+    }
+
+
+def make_forum_thread(rng: random.Random, idx: int) -> dict:
+    """一个论坛帖子（与 examples/newsdialog2forum.py 的输入格式相同）。"""
+    replies = rng.randint(2, 30)
+    speakers = [f"user{rng.randint(0, 999)}" for _ in range(rng.randint(2, 5))]
+    return {
+        "id": f"BENCH-{idx}",
+        "program": rng.choice(["news", "talk", "finance"]),
+        "date": f"20{rng.randint(10, 23)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "url": f"https://example.com/thread/{idx}",
+        "title": mixed_sentence(rng, 5, 15),
+        "summary": mixed_sentence(rng),
+        "utt": [mixed_paragraph(rng, rng.randint(1, 4)) for _ in range(replies)],
+        "speaker": [rng.choice(speakers) for _ in range(replies)],
+    }
+
+
+def near_duplicate(rng: random.Random, text: str, edits: int = 3) -> str:
+    """随机替换 edits 个字符，得到近似重复的文本。"""
+    chars = list(text)
+    for _ in range(edits):
+        if not chars:
+            break
+        chars[rng.randrange(len(chars))] = rng.choice(CHINESE_CHARS)
+    return "".join(chars)
+
+
+def inject_duplicates(
+    rng: random.Random,
+    texts: List[str],
+    duplicate_ratio: float = 0.05,
+    near_duplicate_ratio: float = 0.05,
+) -> List[str]:
+    """在 texts 后面加入完全重复与近似重复的文本（各占原数量的一定比例）。"""
+    result = list(texts)
+    for _ in range(int(len(texts) * duplicate_ratio)):
+        result.append(rng.choice(texts))
+    for _ in range(int(len(texts) * near_duplicate_ratio)):
+        result.append(near_duplicate(rng, rng.choice(texts)))
+    return result
+
+
+def make_documents(seed: int = 0, scale: float = 1.0) -> Dict[str, List[str]]:
+    """生成各类文档的文本：{"books": [...], "qa": [...], "forum": [...]}，都包含重复与近似重复。"""
+    rng = random.Random(seed)
+    books = [make_book(rng, paragraphs=int(500 * scale) or 1) for _ in range(4)]
+    qa = [
+        f"{item['question']}\n{item['answer']}"
+        for item in (make_qa(rng) for _ in range(int(5000 * scale) or 1))
+    ]
+    forum = [
+        "\n".join(thread["utt"])
+        for thread in (make_forum_thread(rng, idx) for idx in range(int(500 * scale) or 1))
+    ]
+    return {
+        "books": inject_duplicates(rng, books, 0.25, 0.25),
+        "qa": inject_duplicates(rng, qa),
+        "forum": inject_duplicates(rng, forum),
+    }
+
+
+def generate_inputs(folder: Union[Path, str], seed: int = 0, scale: float = 1.0) -> Dict[str, Path]:
+    """生成样例转换的输入，返回 {样例: 输入路径}。
+
+    cmb：jsonl（每行 {"text", "meta"}）；newsdialog：JSON 数组；bloomberg：每篇新闻一个小文件。
+    """
+    rng = random.Random(seed)
+    folder = Path(folder)
+    paths = {}
+
+    cmb_folder = folder / "cmb"
+    cmb_folder.mkdir(parents=True, exist_ok=True)
+    for file_idx in range(4):
+        with open(cmb_folder / f"{file_idx:03d}.jsonl", "w", encoding="utf-8") as fp:
+            for idx in range(int(2000 * scale) or 1):
+                data = {
+                    "text": mixed_paragraph(rng, rng.randint(3, 30)).replace("。", "。\n"),
+                    "meta": {"title": f"doc-{file_idx}-{idx}", "dump": "CC-MAIN-2023-06"},
+                }
+                fp.write(json.dumps(data, ensure_ascii=False) + "\n")
+    paths["cmb"] = cmb_folder
+
+    threads = [make_forum_thread(rng, idx) for idx in range(int(2000 * scale) or 1)]
+    newsdialog_path = folder / "news_dialogue.json"
+    with open(newsdialog_path, "w", encoding="utf-8") as fp:
+        json.dump(threads, fp, ensure_ascii=False)
+    paths["newsdialog"] = newsdialog_path
+
+    bloomberg_folder = folder / "bloomberg"
+    for idx in range(int(2000 * scale) or 1):
+        sub_folder = bloomberg_folder / f"{idx // 500:03d}"
+        sub_folder.mkdir(parents=True, exist_ok=True)
+        body = " ".join(rng.choice(ENGLISH_WORDS) for _ in range(rng.randint(100, 800)))
+        news = (
+            f"-- {mixed_sentence(rng, 5, 10)}\n"
+            f"-- By  Bench  Writer{idx % 7}\n"
+            f"-- 2013-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z\n"
+            f"-- https://example.com/news/{idx}\n\n"
+            f"{body}\n\nTo contact the reporter on this story: bench@example.com\n"
+        )
+        (sub_folder / f"news-{idx:06d}").write_text(news, encoding="utf-8")
+    paths["bloomberg"] = bloomberg_folder
+
+    return paths
@@ -0,0 +1,304 @@
+"""基准测试 - 分别测量通用语料转换、simhash、写入、序列化以及样例转换的耗时。
+
+运行方式：命令行到此文件上一层目录，执行
+PYTHONPATH=. python benchmarks/run.py --output results.json
+PYTHONPATH=. python benchmarks/run.py --output new.json --baseline results.json
+
+每个测试重复 --repeat 次，记录最短与中位数耗时以及每秒处理的数量，结果保存为 JSON。
+指定 --baseline 时与之前的结果比较，变慢超过 --threshold 的测试会列出来，并以状态码 1 退出。
+
+样例转换的测试（e2e_*）使用样例 main 的 input_folder、output_folder 等参数，
+之前的样例不支持这些参数，因此只能与加入基准测试之后的版本比较。
+缺少依赖的包（例如样例使用的 tqdm）时跳过对应的测试，结果中记录为 skipped。
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "examples"))
+
+from corpus import generate_inputs, make_documents  # noqa: E402
+
+from mnbvc.formats.general import convert_to_general_corpus  # noqa: E402
+from mnbvc.utils.simhash import Simhash, SimhashIndex  # noqa: E402
+from mnbvc.utils.writer import SizeLimitedFileWriter, serialize_record  # noqa: E402
+
+# 测试名 -> 函数（参数为 context，返回处理的数量）
+BENCHMARKS: Dict[str, Callable[[dict], int]] = {}
+
+
+def benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def all_texts(context: dict) -> List[str]:
+    documents = context["documents"]
+    return documents["books"] + documents["qa"] + documents["forum"]
+
+
+def corpora(context: dict) -> list:
+    """转换好的通用语料（只生成一次，供序列化与写入的测试使用）。"""
+    if "corpora" not in context:
+        context["corpora"] = [
+            convert_to_general_corpus(f"bench-{idx}", text, create_time="20240101")
+            for idx, text in enumerate(all_texts(context))
+        ]
+    return context["corpora"]
+
+
+def simhashes(context: dict) -> List[Simhash]:
+    if "simhashes" not in context:
+        context["simhashes"] = [Simhash(text.split("\n")) for text in all_texts(context)]
+    return context["simhashes"]
+
+
+@benchmark("convert_to_general_corpus")
+def bench_convert(context: dict) -> int:
+    texts = all_texts(context)
+    for idx, text in enumerate(texts):
+        convert_to_general_corpus(f"bench-{idx}", text, create_time="20240101")
+    return len(texts)
+
+
+@benchmark("simhash")
+def bench_simhash(context: dict) -> int:
+    texts = all_texts(context)
+    for text in texts:
+        Simhash(text.split("\n"))
+    return len(texts)
+
+
+@benchmark("simhash_index_add")
+def bench_simhash_index_add(context: dict) -> int:
+    hashes = simhashes(context)
+    index = SimhashIndex([], k=3)
+    for idx, simhash in enumerate(hashes):
+        index.add(str(idx), simhash)
+    context["simhash_index"] = index
+    return len(hashes)
+
+
+@benchmark("simhash_index_query")
+def bench_simhash_index_query(context: dict) -> int:
+    hashes = simhashes(context)
+    index = context.get("simhash_index", None)
+    if index is None:
+        index = SimhashIndex([(str(idx), simhash) for idx, simhash in enumerate(hashes)], k=3)
+        context["simhash_index"] = index
+    for simhash in hashes:
+        index.get_near_dups(simhash)
+    return len(hashes)
+
+
+@benchmark("serialize")
+def bench_serialize(context: dict) -> int:
+    """model_dump + JSON 序列化（与写入时相同，包括 simhash 的计算）。"""
+    items = corpora(context)
+    for corpus in items:
+        serialize_record(corpus)
+    return len(items)
+
+
+def _bench_writer(context: dict, filename_fmt: str) -> int:
+    records = [corpus.model_dump(by_alias=True) for corpus in corpora(context)]
+    with tempfile.TemporaryDirectory() as folder:
+        writer = SizeLimitedFileWriter(
+            folder, filename_fmt=filename_fmt, file_size_limit_mb=64, stats_interval=None)
+        writer.write_many(records)
+        writer.close()
+    return len(records)
+
+
+@benchmark("writer_plain")
+def bench_writer_plain(context: dict) -> int:
+    return _bench_writer(context, "{}.jsonl")
+
+
+@benchmark("writer_gzip")
+def bench_writer_gzip(context: dict) -> int:
+    return _bench_writer(context, "{}.jsonl.gz")
+
+
+def _count_lines(folder: Path) -> int:
+    count = 0
+    for path in folder.glob("*.jsonl*"):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as fp:
+            count += sum(1 for _ in fp)
+    return count
+
+
+@benchmark("e2e_cmb")
+def bench_e2e_cmb(context: dict) -> int:
+    import cmb2general
+
+    with tempfile.TemporaryDirectory() as folder:
+        cmb2general.main(
+            input_folder=context["inputs"]["cmb"],
+            output_folder=folder,
+            log_path=str(Path(folder) / "log.txt"),
+            workers=context["workers"],
+            resume=False,
+        )
+        return _count_lines(Path(folder))
+
+
+@benchmark("e2e_newsdialog")
+def bench_e2e_newsdialog(context: dict) -> int:
+    import newsdialog2forum
+
+    with tempfile.TemporaryDirectory() as folder:
+        newsdialog2forum.main(
+            input_path=context["inputs"]["newsdialog"],
+            output_folder=folder,
+            log_path=str(Path(folder) / "log.txt"),
+        )
+        return _count_lines(Path(folder))
+
+
+@benchmark("e2e_bloomberg")
+def bench_e2e_bloomberg(context: dict) -> int:
+    import bloomberg2general
+
+    with tempfile.TemporaryDirectory() as folder:
+        bloomberg2general.main(
+            input_folder=context["inputs"]["bloomberg"],
+            output_folder=folder,
+            log_path=str(Path(folder) / "log.txt"),
+        )
+        return _count_lines(Path(folder))
+
+
+def _remove_log_handlers():
+    """样例的 main 每次都会添加写入临时文件夹的日志文件，测试结束后移除。"""
+    for logger in [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]:
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.FileHandler):
+                logger.removeHandler(handler)
+                handler.close()
+
+
+def run_benchmark(func: Callable[[dict], int], context: dict, repeat: int) -> dict:
+    seconds = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            items = func(context)
+        finally:
+            _remove_log_handlers()
+        seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    return {
+        "items": items,
+        "repeat": repeat,
+        "seconds_min": best,
+        "seconds_median": statistics.median(seconds),
+        "items_per_second": items / best if best > 0 else None,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """返回比 baseline 慢超过 threshold（比例）的测试。"""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name, None)
+        if (base is None) or ("skipped" in base) or ("skipped" in result):
+            continue
+        ratio = result["seconds_min"] / max(base["seconds_min"], 1e-12)
+        result["baseline_seconds_min"] = base["seconds_min"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MNBVC 基准测试")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果保存的位置")
+    parser.add_argument("--baseline", help="之前的结果，用于比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="比 baseline 慢多少算变慢，默认 0.1（10%%）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个测试重复的次数")
+    parser.add_argument("--seed", type=int, default=0, help="生成语料的随机种子")
+    parser.add_argument("--scale", type=float, default=1.0, help="语料规模的倍数")
+    parser.add_argument("--workers", type=int, default=4, help="样例转换使用的进程数")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="只运行这些测试")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("simhash").setLevel(logging.WARNING)
+
+    names = args.only or list(BENCHMARKS)
+    with tempfile.TemporaryDirectory() as input_folder:
+        context = {
+            "documents": make_documents(args.seed, args.scale),
+            "inputs": generate_inputs(input_folder, args.seed, args.scale),
+            "workers": args.workers,
+        }
+        results = {
+            "meta": {
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "scale": args.scale,
+                "workers": args.workers,
+            },
+            "benchmarks": {},
+        }
+        for name in names:
+            try:
+                result = run_benchmark(BENCHMARKS[name], context, args.repeat)
+            except ModuleNotFoundError as e:
+                results["benchmarks"][name] = {"skipped": str(e)}
+                print(f"{name:<28}skipped: {e} (pip install -r requirements.txt)", file=sys.stderr)
+                continue
+            results["benchmarks"][name] = result
+            print(
+                f"{name:<28}{result['seconds_min']:>10.3f}s"
+                f"{result['items_per_second'] or 0:>14.1f} items/s", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.threshold)
+        results["regressions"] = regressions
+        for name in regressions:
+            ratio = results["benchmarks"][name]["ratio"]
+            print(f"Slower than baseline: {name} ({ratio:.2f}x)", file=sys.stderr)
+
+    with open(args.output, "w") as fp:
+        json.dump(results, fp, indent=2, ensure_ascii=False)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
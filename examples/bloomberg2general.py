@@ -5,18 +5,27 @@ PYTHONPATH=. python examples/bloomberg2general.py
 """
 
 import json
+import logging
 import re
+from multiprocessing import Process
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 from tqdm import tqdm
 
 from mnbvc.formats.general import convert_to_general_corpus
 from mnbvc.utils import get_logger
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.memory import ByteBoundedQueue
+from mnbvc.utils.smallfiles import iter_file_batches, walk_files
+from mnbvc.utils.writer import RecordBatchSender, update_writer_kwargs, writer_worker
 
-log_path = "data/bloomberg_log.txt"
-logger = get_logger(log_path)
+# 修改指向数据文件夹、输出文件夹与 log 的保存位置
+DATA_INPUT_FOLDER = "data/bloomberg_news"
+DATA_OUTPUT_FOLDER = "data/bloomberg"
+LOG_PATH = "data/bloomberg_log.txt"
+
+# 与 get_logger 返回的是同一个 logger，在 main 中设置日志文件
+logger = logging.getLogger("mnbvc.utils")
 
 
 def parse_headers(lines: list[str]):
@@ -99,13 +108,15 @@ def parse_news(news: str) -> dict:
 
 
 def convert_news_to_general_corpus(
-    path: Union[Path, str]
+    path: Union[Path, str],
+    news: Optional[str] = None,
 ) -> dict:
-    """将彭博社新闻转化成通用语料格式。"""
+    """将彭博社新闻转化成通用语料格式。news 为 None 时读取 path。"""
     logger.debug(f"处理文件: {path}")
 
-    with open(path, "r") as fp:
-        news = fp.read()
+    if news is None:
+        with open(path, "r") as fp:
+            news = fp.read()
     if not news.strip():
         logger.warning(f"Empty file: {path}")
         return None
@@ -132,36 +143,56 @@ def convert_news_to_general_corpus(
     return corpus
 
 
-if __name__ == "__main__":
-    # 修改指向数据文件夹
-    path = "data/bloomberg_news"
-    input_folder = Path(path)
-
-    # 输出文件夹
-    output_folder = "data/bloomberg"
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    limit: Optional[int] = None,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的新闻。limit 为处理的文件数量，writer_options 覆盖写入参数。"""
+    get_logger(log_path)
 
     # 写入
-    writer = SizeLimitedFileWriter(
+    writer_kwargs = dict(
         output_folder=output_folder,
         filename_idx_first=0,  # 从 0 开始
         filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
         filename_idx_stride=1,  # 下一个文件的数字增量
         filename_fmt="{}.jsonl"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
     )
+    writer_kwargs = update_writer_kwargs(writer_kwargs, writer_options)
+
+    # 压缩与写入在单独的进程中进行：主进程解析并序列化，按批发送给写入进程，
+    # 队列中最多 64 MB 的数据，写入跟不上时主进程等待
+    queue = ByteBoundedQueue(64 << 20)
+    writer_process = Process(target=writer_worker, args=(writer_kwargs, queue))
+    writer_process.start()
+
+    # 用 os.scandir 遍历（跳过隐藏文件），在线程池中预读文件内容，按批转换
+    paths = list(walk_files(input_folder))[:limit]
+    try:
+        with RecordBatchSender(queue) as sender, tqdm(total=len(paths)) as progress:
+            for batch in iter_file_batches(paths, batch_size=256, threads=16):
+                for small_file in batch:
+                    try:
+                        if small_file.error is not None:
+                            raise small_file.error
+                        corpus = convert_news_to_general_corpus(
+                            small_file.path, small_file.data.decode())
+                    except Exception as e:
+                        logger.error(f"Error processing {small_file.path}: {e}")
+                        continue
+                    if corpus is not None:
+                        sender.send(corpus)
+                progress.update(len(batch))
+    finally:
+        # 结束标记：写入进程写完队列中的数据后关闭文件
+        queue.put(None)
+        writer_process.join()
+    if writer_process.exitcode != 0:
+        raise Exception(f"Writer process failed with exit code {writer_process.exitcode}")
 
-    count = 0
-    files = sorted(input_folder.glob("**/*"))
-    for text_path in tqdm(files):
-        if text_path.is_dir() or text_path.name.startswith("."):
-            continue
-        try:
-            corpus = convert_news_to_general_corpus(text_path)
-            if corpus is None:
-                continue
-        except Exception as e:
-            logger.error(f"Error processing {text_path}: {e}")
-        
-        if corpus is not None:
-            writer.writeline(corpus.model_dump(by_alias=True))
-
-    writer.close()
+
+if __name__ == "__main__":
+    main()
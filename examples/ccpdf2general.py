@@ -6,39 +6,38 @@ PYTHONPATH=. python examples/ccpdf2general.py
 
 import re
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 import datetime
 import json
-
-import pandas as pd
+import logging
 
 from mnbvc.formats.general import GeneralCorpus, convert_to_general_corpus
 from mnbvc.utils import get_logger
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.memory import AdaptiveBatchSize, MemoryBudget
+from mnbvc.utils.parquet import ParquetRowConverter
+from mnbvc.utils.runner import run_conversion
+from mnbvc.utils.scheduler import schedule
+from mnbvc.utils.writer import update_writer_kwargs
+
+# 修改指向数据文件夹、输出文件夹与 log 的保存位置
+DATA_INPUT_FOLDER = "data/ccpdf"
+DATA_OUTPUT_FOLDER = "data/ccpdf/output"
+LOG_PATH = "data/ccpdf/log.txt"
+NUM_WORKERS = 4
+
+# 与 get_logger 返回的是同一个 logger，在 main 中设置日志文件
+logger = logging.getLogger("mnbvc.utils")
 
 
-def get_writer_from_path(path: Path, output_folder: Union[Path, str], writers: dict[str, SizeLimitedFileWriter]) -> SizeLimitedFileWriter:
-    """根据路径找到相对应的writer。
+def get_lang_from_path(path: Union[Path, str]) -> str:
+    """根据路径找出语言信息。
     """
-    # 根据路径找出语言信息
     lang_ptn = r"([a-z]*)_Hani"
     found = re.search(lang_ptn, str(path))
     lang = "default"
     if found:
         lang = found.group(1)
-
-    # 增加相应语言写入工具
-    if lang not in writers:
-        writer = SizeLimitedFileWriter(
-            output_folder=output_folder,
-            filename_idx_first=0,  # 从 0 开始
-            filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
-            filename_idx_stride=1,  # 下一个文件的数字增量
-            filename_fmt=lang + "_{}.jsonl"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
-        )
-        writers[lang] = writer
-
-    return writers[lang]
+    return lang
 
 
 def break_text(text: str) -> list[str]:
@@ -50,57 +49,99 @@ def break_text(text: str) -> list[str]:
     return lines
 
 
-def process_parquet(path: Path, output_folder: Union[Path, str], writers: dict[str, SizeLimitedFileWriter]):
-    """处理一个parquet文件。"""
+# 不是 ISO 格式时，取开头的 年-月-日（分隔符可以是 -、/、.、年月日 或者没有分隔符，例如 PDF 元数据中的 D:20200102）
+DATE_PTN = re.compile(r"(?:D:)?(\d{4})[-/.年]?(\d{1,2})[-/.月]?(\d{1,2})")
 
-    df_data = pd.read_parquet(path)
-    writer = get_writer_from_path(path, output_folder, writers)
 
-    for _, row in df_data.iterrows():
-        data = row.to_dict()
-        text = data.pop("text", None)
-        if text is None:
-            continue
-        text_id = data["id"]
-        create_time = f"{datetime.datetime.now():%Y%m%d}"
+def get_create_time(date) -> str:
+    """将日期转换成 yyyymmdd，没有日期或无法解析时使用当天日期。"""
+    today = f"{datetime.datetime.now():%Y%m%d}"
+    if (date is None) or (date != date):  # None 或 NaN
+        return today
+    if isinstance(date, datetime.date):
+        return f"{date:%Y%m%d}"
+    date = str(date).strip()
+    try:
+        return f"{datetime.datetime.fromisoformat(date):%Y%m%d}"
+    except ValueError:
+        pass
+    found = DATE_PTN.match(date)
+    if found:
         try:
-            date = pd.to_datetime(data["date"])
-            create_time = f"{date:%Y%m%d}"
-        except:
+            return f"{datetime.date(*map(int, found.groups())):%Y%m%d}"
+        except ValueError:
             pass
-        texts = break_text(text)
-        corpus = convert_to_general_corpus(
-            text_id=text_id,
-            text=texts,
-            create_time=create_time
+    logger.warning(f"Cannot parse date {date!r}, using {today}")
+    return today
+
+
+def convert_row(data: dict) -> Optional[GeneralCorpus]:
+    """处理parquet文件中的一行。"""
+    text = data.pop("text", None)
+    if text is None:
+        return None
+    text_id = data["id"]
+    create_time = get_create_time(data.get("date", None))
+    texts = break_text(text)
+    corpus = convert_to_general_corpus(
+        text_id=text_id,
+        text=texts,
+        create_time=create_time
+    )
+    corpus.extension_fields = json.dumps(data, default=str)
+    return corpus
+
+
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    workers: int = NUM_WORKERS,
+    limit: Optional[int] = None,
+    resume: bool = True,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的 parquet。limit 为处理的文件数量，writer_options 覆盖写入参数。
+
+    resume 为 True 时跳过已经转换并且没有改变的 parquet，只转换新的与改变了的 parquet。
+    """
+    input_folder = Path(input_folder)
+    get_logger(log_path)
+
+    # 不同的语言写入不同的文件来保证文件名包含语言种类信息。
+    # 语言由文件路径决定，一个 parquet 中的所有行属于同一种语言，
+    # 因此按语言分组后分别运行 run_conversion，不需要 RoutingWriter 按行选择输出文件
+    paths_by_lang: dict[str, list[Path]] = {}
+    for path in sorted(input_folder.glob("**/*.parquet"))[:limit]:
+        paths_by_lang.setdefault(get_lang_from_path(path), []).append(path)
+
+    # 每个进程的批大小根据内存预算（--memory-limit 或者可用内存）与每行的大小调整
+    budget = MemoryBudget(workers=workers)
+    batch_size = AdaptiveBatchSize(65536, budget=budget)
+
+    for lang, paths in paths_by_lang.items():
+        # 写入
+        writer_kwargs = dict(
+            output_folder=output_folder,
+            filename_idx_first=0,  # 从 0 开始
+            filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
+            filename_idx_stride=1,  # 下一个文件的数字增量
+            filename_fmt=lang + "_{}.jsonl"  # 如果想要压缩好的输出可以修改成 lang + "_{}.jsonl.gz"
+        )
+        writer_kwargs = update_writer_kwargs(writer_kwargs, writer_options)
+        # 大的 parquet 按 row group 拆分，由 workers 个进程并行处理
+        summary = run_conversion(
+            schedule(paths),
+            ParquetRowConverter(convert_row, batch_size=batch_size),
+            writer_kwargs=writer_kwargs,
+            workers=workers,
+            resume=resume,
+            memory_budget=budget,
+            manifest_name=f"manifest.{lang}.json",
         )
-        corpus.extension_fields = json.dumps(data, default=str)
-        writer.writeline(corpus.model_dump(by_alias=True))
+        for item in summary["failed"]:
+            logger.error(f"Error processing {item}")
 
 
 if __name__ == "__main__":
-    # 修改指向数据文件夹
-    path = "data/ccpdf"
-    input_folder = Path(path)
-
-    # 输出文件夹
-    output_folder = Path("data/ccpdf/output")
-
-    # 修改 log 的保存位置
-    log_path = "data/ccpdf/log.txt"
-    logger = get_logger(log_path)
-
-    # 写入
-    # 不同的语言用不一样的writer来保证文件名包含语言种类信息
-    writers: dict[str, SizeLimitedFileWriter] = {}
-
-    parquet_files = input_folder.glob("**/*.parquet")
-    for path in parquet_files:
-        try:
-            process_parquet(path, output_folder, writers)
-        except Exception as e:
-            logger.error(f"Error processing {path}: {e}")
-
-    # 结束写入
-    for writer in writers.values():
-        writer.close()
+    main()
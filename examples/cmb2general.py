@@ -6,13 +6,21 @@ PYTHONPATH=. python examples/cmb2general.py
 
 import json
 import logging
+from functools import partial
 from pathlib import Path
-from typing import Iterator, Union
-
-import jsonlines
+from typing import Iterator, Optional, Union
 
 from mnbvc.formats.general import GeneralCorpus, convert_to_general_corpus
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.jsonl import iter_work_item_lines
+from mnbvc.utils.runner import run_conversion
+from mnbvc.utils.scheduler import WorkItem, schedule
+from mnbvc.utils.writer import update_writer_kwargs
+
+# 修改指向数据文件夹、输出文件夹与 log 的保存位置
+DATA_INPUT_FOLDER = "data/CMB_FinDataSet_sample"
+DATA_OUTPUT_FOLDER = "data/cmb"
+LOG_PATH = "data/cmb_log.txt"
+NUM_WORKERS = 4
 
 
 def get_logger(log_path: str) -> logging.Logger:
@@ -30,62 +38,75 @@ def get_logger(log_path: str) -> logging.Logger:
 
 
 def convert_jsonl_to_general_corpus(
-    path: Union[Path, str],
+    path: Union[WorkItem, Path, str],
     logger: logging.Logger
 ) -> Iterator[GeneralCorpus]:
     """将 jsonl 转化成通用语料格式。"""
     logger.debug(f"处理文件: {path}")
 
-    with jsonlines.open(path, "r") as reader:
-        for data in reader:
-            # 获取创建时间
-            create_time = None
-            try:
-                dump = data["meta"]["dump"]
-                year = dump.split("-")[0]
-                create_time = f"{year}0101"
-            except:
-                logger.debug(f"Cannot find create time in {data.get('meta', {})}")
-
-            # 转换成通用语料格式
-            try:
-                corpus = convert_to_general_corpus(
-                    text_id=data["meta"].get("title", "").strip(),
-                    text=data["text"],
-                    create_time=create_time
-                )
-                corpus.extension_fields = json.dumps(data["meta"])
-                yield corpus
-            except Exception as e:
-                logger.error(f"Cannot process [{e}]: {data}")
-                continue
+    # 读取整个文件，或者由 schedule 拆分出的一个字节范围
+    for data in iter_work_item_lines(path):
+        # 获取创建时间
+        create_time = None
+        try:
+            dump = data["meta"]["dump"]
+            year = dump.split("-")[0]
+            create_time = f"{year}0101"
+        except:
+            logger.debug(f"Cannot find create time in {data.get('meta', {})}")
+
+        # 转换成通用语料格式
+        try:
+            corpus = convert_to_general_corpus(
+                text_id=data["meta"].get("title", "").strip(),
+                text=data["text"],
+                create_time=create_time
+            )
+            corpus.extension_fields = json.dumps(data["meta"])
+            yield corpus
+        except Exception as e:
+            logger.error(f"Cannot process [{e}]: {data}")
+            continue
 
     logger.debug(f"转换结束: {path}")
 
 
-if __name__ == "__main__":
-    # 修改指向数据文件夹
-    path = "data/CMB_FinDataSet_sample"
-    input_folder = Path(path)
-
-    # 输出文件夹
-    output_folder = "data/cmb"
-
-    # 修改 log 的保存位置
-    log_path = "data/cmb_log.txt"
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    workers: int = NUM_WORKERS,
+    limit: Optional[int] = None,
+    resume: bool = True,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的 jsonl。limit 为处理的文件数量，writer_options 覆盖写入参数。"""
+    input_folder = Path(input_folder)
     logger = get_logger(log_path)
 
     # 写入
-    writer = SizeLimitedFileWriter(
+    writer_kwargs = dict(
         output_folder=output_folder,
         filename_idx_first=0,  # 从 0 开始
         filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
         filename_idx_stride=1,  # 下一个文件的数字增量
-        filename_fmt="{}.jsonl"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
+        filename_fmt="{}.jsonl",  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
+    )
+    writer_kwargs = update_writer_kwargs(writer_kwargs, writer_options)
+
+    # 使用 workers 个进程转换，每个进程写入自己的文件
+    # 大的 jsonl 按字节范围拆分，多个进程同时处理同一个文件
+    # resume=True：中断后再次运行会跳过已经处理完的任务（记录在 output_folder/manifest.json）
+    paths = sorted(input_folder.glob("**/*.jsonl"))[:limit]
+    summary = run_conversion(
+        schedule(paths),
+        partial(convert_jsonl_to_general_corpus, logger=logger),
+        writer_kwargs=writer_kwargs,
+        workers=workers,
+        resume=resume,
     )
+    logger.info(f"转换结束: {summary}")
 
-    for jsonl_path in input_folder.glob("**/*.jsonl"):
-        for corpus in convert_jsonl_to_general_corpus(jsonl_path, logger):
-            writer.writeline(corpus.model_dump(by_alias=True))
 
-    writer.close()
+if __name__ == "__main__":
+    main()
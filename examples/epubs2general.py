@@ -8,136 +8,65 @@ EPUB数据实际上是多个 HTML 文件的压缩包。其他 HTML 的清洗任
 
 import json
 import logging
-import re
 from functools import cached_property
-from html.parser import HTMLParser
-from multiprocessing import Process, Queue
 from pathlib import Path
-from threading import Thread
 from typing import Dict, Iterator, List, Optional, Tuple, Union
 
-import ebooklib
-from ebooklib import epub
-
-from mnbvc.formats.general import convert_to_general_corpus
-from mnbvc.utils.writer import SizeLimitedFileWriter, writer_worker_for_thread
+from mnbvc.formats.general import GeneralCorpus, convert_to_general_corpus
+from mnbvc.utils.epub import EpubReader
+from mnbvc.utils.html_text import extract_article
+from mnbvc.utils.runner import run_conversion
+from mnbvc.utils.scheduler import FileGroupConverter, schedule
+from mnbvc.utils.writer import update_writer_kwargs
 
 DATA_INPUT_FOLDER = "data/52pojie-2008-2021"
+NUM_WORKERS = 4
+# HTML 分词器，安装了 lxml 时可以改为 "lxml"（更快）
+HTML_BACKEND = "html.parser"
 
 
 logger = logging.getLogger(__name__)
 
 
-def get_epub_paths(limit: Optional[int] = None):
-    """获取 DATA_INPUT_FOLDER 中 epub 文件。
+def get_epub_paths(limit: Optional[int] = None, folder: Union[Path, str] = DATA_INPUT_FOLDER):
+    """获取 folder（默认为 DATA_INPUT_FOLDER）中 epub 文件。
 
     如果设置 limit, 则取前 limit 数量的文件。"""
-    folder = Path(DATA_INPUT_FOLDER)
+    folder = Path(folder)
     paths = list(folder.glob("*.epub"))
     if limit:
         paths = paths[:limit]
     return paths
 
 
-class ArticleParser(HTMLParser):
-    """从 HTML 中提取文章。保留代码区块。
-    """
-
-    def __init__(self):
-        self.texts: List[str] = []
-        self.current_text: str = ""
-        self.in_pre: bool = False
-        self.img_count = 0
-        super().__init__()
-
-    def add_text(self):
-        """保存当前文字。
-        """
-        if self.current_text:
-            self.texts.append(self.current_text)
-        self.current_text = ""
-
-    def handle_starttag(self, tag: str, attrs: List[Tuple[Union[str, None]]]) -> None:
-        if tag == "pre":
-            self.in_pre = True
-        elif tag == "img":
-            self.img_count += 1
-
-    def handle_endtag(self, tag: str) -> None:
-        if tag in ["p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote"]:
-            self.add_text()
-        elif tag == "br":
-            if self.in_pre:
-                self.current_text += "\n"
-            else:
-                self.add_text()
-        elif tag == "pre":
-            self.in_pre = False
-            self.add_text()
-
-    def handle_data(self, data: str) -> None:
-        if not self.in_pre:
-            data = data.strip()
-        self.current_text += data
-
-    def handle_startendtag(self, tag: str, attrs: List[Tuple[Union[str, None]]]) -> None:
-        if tag == "br":
-            if self.in_pre:
-                self.current_text += "\n"
-            else:
-                self.add_text()
-        elif tag == "img":
-            self.img_count += 1
-
-    def feed(self, data: str) -> None:
-        self.clear()
-        super().feed(data)
-        self.add_text()
-
-    def clear(self):
-        self.texts.clear()
-        self.current_text = ""
-        self.img_count = 0
-
-
 class EpubConverter:
 
     def __init__(self, book_path: Union[str, Path]):
         self.book_path = book_path
-        self.ebook = epub.read_epub(book_path, {"ignore_ncx": True})
+        # 只解析目录与元数据，章节在转换时才读取
+        self.book = EpubReader(book_path)
 
     @cached_property
     def publish_date(self):
-        return self.ebook.get_metadata("DC", "date")[0][0].replace("-", "")
+        return self.book.get_metadata("date")[0].replace("-", "")
 
     @cached_property
     def book_title(self):
-        return self.ebook.get_metadata("DC", "title")[0][0]
+        return self.book.title
 
     @cached_property
     def contents(self) -> List[Tuple[str, str]]:
-        """使用正则表达式获取 epub 文件内容目录。返回列表，每个元素为 (文件名，文件链接)。
+        """epub 文件内容目录。返回列表，每个元素为 (文件名，文件在 epub 中的路径)。
+
+        目录中指向同一个文件不同锚点的条目（c1.html、c1.html#s1、c1.html#s2）只保留第一个，
+        每个文件只转换一次，标题使用第一个条目的标题。
         """
-        nav = list(self.ebook.get_items_of_type(ebooklib.ITEM_NAVIGATION))[0]
-        nav = nav.get_content().decode()
-        start_idx = [
-            m.end()
-            for m in re.finditer(r"\<navpoint .*\>", nav, flags=re.IGNORECASE)
-        ]
-        end_idx = [
-            m.start()
-            for m in re.finditer(r"\</navpoint\>", nav, flags=re.IGNORECASE)
-        ]
-        assert len(start_idx) == len(end_idx)
         contents = []
-        for s, e in zip(start_idx, end_idx):
-            navpoint = nav[s: e].strip()
-            i = navpoint.find("<text>") + 6
-            j = navpoint.find("</text>")
-            title = navpoint[i: j].strip()
-            i = navpoint.find("<content src=") + 13
-            j = navpoint.find("/>", i)
-            src = navpoint[i: j].strip('"')
+        seen = set()
+        for title, src in self.book.toc:
+            if src in seen:
+                continue
+            seen.add(src)
             contents.append((title, src))
         return contents
 
@@ -145,20 +74,18 @@ class EpubConverter:
         """提取一篇文章。"""
         title, src = self.contents[idx]
         title = title.replace("\n", " ").strip()
-        item = self.ebook.get_item_with_href(src)
-        if item is None:
+        if not self.book.has(src):
             logger.warning(
                 f"Cannot find {title}({src}) in book ({self.book_path})")
             return None
-        html = item.get_content().decode()
-        parser = ArticleParser()
-        parser.feed(html)
+        html = self.book.read(src).decode()
+        article = extract_article(html, backend=HTML_BACKEND)
         data = {
             "title": title,
-            "texts": parser.texts,
+            "texts": article.texts,
             "date": self.publish_date,
             "html": html,
-            "img_count": parser.img_count
+            "img_count": article.img_count
         }
         data = self.post_process(data)
         return data
@@ -171,6 +98,12 @@ class EpubConverter:
 
     def convert(self) -> Iterator[Dict[str, str]]:
         """转换一个epub文件。调用self.convert_article来转换每一篇文章。"""
+        try:
+            yield from self._convert()
+        finally:
+            self.book.close()
+
+    def _convert(self) -> Iterator[Dict[str, str]]:
         for idx in range(len(self.contents)):
             data = self.convert_article(idx)
             if data is None:
@@ -190,45 +123,45 @@ class EpubConverter:
             yield corpus
 
 
-def epub_converter_worker(epub_paths: List[Union[Path, str]], output_queue: Queue):
-    """将给定的 epub 清洗成通用格式并输出到 output_queue"""
-
-    for path in epub_paths:
-        book = EpubConverter(path)
-        for corpus in book.convert():
-            output_queue.put(corpus)
+def convert_epub(path: Union[Path, str]) -> Iterator[GeneralCorpus]:
+    """将给定的 epub 清洗成通用格式"""
+    book = EpubConverter(path)
+    return book.convert()
 
 
-def main():
-    input_folder = Path(DATA_INPUT_FOLDER)
-    # 我们将结果放在 DATA_INPUT_FOLDER 下的 output 文件夹
-    output_folder = input_folder / "output"
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Optional[Union[Path, str]] = None,
+    workers: int = NUM_WORKERS,
+    limit: Optional[int] = 10,
+    resume: bool = True,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的 epub。limit 为处理的文件数量，writer_options 覆盖写入参数。"""
+    input_folder = Path(input_folder)
+    # 默认将结果放在 input_folder 下的 output 文件夹
+    if output_folder is None:
+        output_folder = input_folder / "output"
 
-    # 作为样例，这里只处理前 10 个 epub 文件。
-    epub_paths = get_epub_paths(limit=10)
-    queue = Queue()
+    # 作为样例，默认只处理前 10 个 epub 文件。
+    epub_paths = get_epub_paths(limit=limit, folder=input_folder)
 
-    # 设置 worker 进程处理文件 - 这里只用了一个进程
-    worker_proc = Process(target=epub_converter_worker,
-                          args=(epub_paths, queue))
+    # 先处理大的 epub，很小的 epub 合并成一个任务
+    work_items = schedule(epub_paths, splitters={})
 
-    # 在主进程中使用一个线程进行写入操作
+    # 使用 workers 个进程转换，每个进程都有自己独立的 SizeLimitedFileWriter，文件名互不冲突
     # 注意：SizeLimitedFileWriter 并不可以直接用于多线程或者多进程
-    # 如果需要，则每个线程/进程需要有自己独立的 SizeLimitedFileWriter
-    # 而且要保证每个 SizeLimitedFileWriter 写入的文件并不冲突
-    writer = SizeLimitedFileWriter(output_folder)
-    writer_thread = Thread(target=writer_worker_for_thread, args=(writer, queue))
-
-    # 开始转换
-    worker_proc.start()
-    writer_thread.start()
-
-    # 先确保清洗进程全部结束
-    worker_proc.join()
-
-    # 停止写入操作
-    queue.put(None)
-    writer_thread.join()
+    # 写入的文件信息会合并到 output_folder / "manifest.json"
+    # resume=True：中断后再次运行会跳过已经处理完的任务
+    summary = run_conversion(
+        work_items,
+        FileGroupConverter(convert_epub),
+        writer_kwargs=update_writer_kwargs(dict(output_folder=output_folder), writer_options),
+        workers=workers,
+        resume=resume,
+    )
+    if summary["failed"]:
+        logger.warning(f"Failed tasks: {summary['failed']}")
 
 
 if __name__ == "__main__":
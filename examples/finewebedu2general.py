@@ -6,19 +6,24 @@ PYTHONPATH=. python examples/finewebedu2general.py
 
 import json
 import logging
-import uuid
+from functools import partial
 from pathlib import Path
-from typing import Iterator, Union
-
-import pyarrow.parquet as pq
+from typing import Iterator, Optional, Union
 
 from mnbvc.formats.general import GeneralCorpus, convert_to_general_corpus
-from mnbvc.utils.writer import SizeLimitedFileWriter
-
+from mnbvc.utils.ids import content_id
+from mnbvc.utils.memory import AdaptiveBatchSize, MemoryBudget
+from mnbvc.utils.parquet import BatchSize, iter_work_item_rows
+from mnbvc.utils.runner import run_conversion
+from mnbvc.utils.scheduler import WorkItem, schedule
+from mnbvc.utils.writer import update_writer_kwargs
 
-def get_uuid() -> str:
-    """获取一个 uuid。"""
-    return uuid.uuid4().hex
+# 修改指向数据文件夹、输出文件夹与 log 的保存位置
+DATA_INPUT_FOLDER = "data/finewebedu"
+DATA_OUTPUT_FOLDER = "data/finewebedu-output"
+LOG_PATH = "data/finewebedu-log.txt"
+NUM_WORKERS = 4
+BATCH_SIZE = 65536  # 每次最多读取的行数 - 内存不足时自动减小（见 AdaptiveBatchSize）
 
 
 def get_logger(log_path: str) -> logging.Logger:
@@ -36,61 +41,76 @@ def get_logger(log_path: str) -> logging.Logger:
 
 
 def convert_parquet_to_general_corpus(
-    path: Union[Path, str],
+    path: Union[WorkItem, Path, str],
     logger: logging.Logger,
-    batch_size: int = 65536,
+    batch_size: BatchSize = 65536,
 ) -> Iterator[GeneralCorpus]:
-    """将 jsonl 转化成通用语料格式。"""
+    """将 parquet（整个文件或者若干 row group）转化成通用语料格式。"""
     logger.debug(f"处理文件: {path}")
 
-    parquet_file = pq.ParquetFile(path)
-    for batch in parquet_file.iter_batches(batch_size=batch_size):
-        df_data = batch.to_pandas()
-        for idx, row in df_data.iterrows():
-            source = row["source"].strip()
-            text = row["text"].strip()
-            text = text.strip()
-            if not text:
-                continue
-
-            # 生成text id - 每次运行都会生成新的id
-            text_id = get_uuid()
-
-            # 转换成通用语料格式
-            corpus = convert_to_general_corpus(
-                text_id=text_id,
-                text=text,
-            )
-            corpus.extension_fields = json.dumps({"source": source})
-            yield corpus
+    rows = iter_work_item_rows(path, columns=["source", "text"], batch_size=batch_size)
+    for row in rows:
+        source = row["source"].strip()
+        text = row["text"].strip()
+        text = text.strip()
+        if not text:
+            continue
+
+        # 由来源与内容生成text id - 每次运行都相同
+        text_id = content_id(source, text)
+
+        # 转换成通用语料格式
+        corpus = convert_to_general_corpus(
+            text_id=text_id,
+            text=text,
+        )
+        corpus.extension_fields = json.dumps({"source": source})
+        yield corpus
 
     logger.debug(f"转换结束: {path}")
 
 
-if __name__ == "__main__":
-    # 修改指向数据文件夹
-    path = "data/finewebedu"
-    input_folder = Path(path)
-
-    # 输出文件夹
-    output_folder = "data/finewebedu-output"
-
-    # 修改 log 的保存位置
-    log_path = "data/finewebedu-log.txt"
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    workers: int = NUM_WORKERS,
+    limit: Optional[int] = None,
+    resume: bool = True,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的 parquet。limit 为处理的文件数量，writer_options 覆盖写入参数。
+
+    resume 为 True 时跳过已经转换并且没有改变的 parquet，只转换新的与改变了的 parquet。
+    """
+    input_folder = Path(input_folder)
     logger = get_logger(log_path)
 
     # 写入
-    writer = SizeLimitedFileWriter(
+    writer_kwargs = dict(
         output_folder=output_folder,
         filename_idx_first=0,  # 从 0 开始
         filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
         filename_idx_stride=1,  # 下一个文件的数字增量
         filename_fmt="{}.jsonl"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
     )
+    writer_kwargs = update_writer_kwargs(writer_kwargs, writer_options)
+
+    # 大的 parquet 按 row group 拆分，由 workers 个进程并行处理
+    # 每个进程的批大小根据内存预算（--memory-limit 或者可用内存）与每行的大小调整
+    budget = MemoryBudget(workers=workers)
+    batch_size = AdaptiveBatchSize(BATCH_SIZE, budget=budget)
+    paths = sorted(input_folder.glob("**/*.parquet"))[:limit]
+    summary = run_conversion(
+        schedule(paths),
+        partial(convert_parquet_to_general_corpus, logger=logger, batch_size=batch_size),
+        writer_kwargs=writer_kwargs,
+        workers=workers,
+        resume=resume,
+        memory_budget=budget,
+    )
+    logger.info(f"转换结束: {summary}")
 
-    BATCH_SIZE = 65536  # 每次读取的行数 - 根据内存大小调整
-    for path in input_folder.glob("**/*.parquet"):
-        for corpus in convert_parquet_to_general_corpus(path, logger, batch_size=BATCH_SIZE):
-            writer.writeline(corpus.model_dump(by_alias=True))
 
-    writer.close()
+if __name__ == "__main__":
+    main()
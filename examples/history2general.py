@@ -7,87 +7,73 @@ PYTHONPATH=. python examples/history2general.py
 """
 
 import json
-import re
 from pathlib import Path
-from typing import Union
+from typing import Dict, Iterator, Optional, Union
 
 from mnbvc.formats.general import convert_to_general_corpus
 from mnbvc.formats.qa import QACorpus, QAMetaData
 from mnbvc.utils import get_logger
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.boilerplate import BoilerplateStripper, Rule, format_date
+from mnbvc.utils.decoding import EncodingDetector
+from mnbvc.utils.routing import RoutingWriter
+from mnbvc.utils.sketch import BoilerplateLines, find_repeated_lines
+from mnbvc.utils.writer import update_writer_kwargs
 
+# 历史数据文件夹
+# 解压 20230112.zip，并重命名一下文件夹
+# riddle.20230111.1.أصسُ  -> riddle.20230111.1.谜语
+# txtsk.20230112.5.شستى  -> txtsk.20230112.5.小说
+DATA_INPUT_FOLDER = "data/20230112"
+# 修改 log 的保存位置
+LOG_PATH = "data/20230112/log.txt"
 
-def read_file(path: Path) -> str:
-    """读取文本文件 - 用chardet检测编码。"""
-
-    folder = path.parent.name
-    encoding = "GB18030"
-    if folder == "riddle.20230111.1.谜语":
-        encoding = "utf-8"
-
-    with open(path, "r", encoding=encoding, errors="ignore") as fp:
-        text = fp.read()
-
-    return text
-
-
-def preprocessing_duzhe(text: str) -> tuple[str, dict]:
-    """预处理文件夹: duzhe.20230111.2.杂志"""
-    header = "| 注册 | 登陆 | 家园首页 | 家园简介 | 版主招聘 | 原创佳句 | 新春祝福 |"
-    footer = "| 设为首页 | 加入收藏 | 联系我们 | 版权申明 |"
-
-    text = text.replace(header, "").strip()
-    footer_idx = text.find(footer)
-    footer = ""
-    if footer_idx != -1:
-        footer = text[footer_idx:]
-        text = text[:footer_idx].strip()
 
-    extra_attrs = {}
-    create_time_ptn = r"创建时间：(\d+)-(\d+)-(\d+)"
-    found = re.search(create_time_ptn, footer)
-    if found:
-        year, month, day = map(int, found.groups())
-        create_time = f"{year}{month:02d}{day:02d}"
-        extra_attrs["create_time"] = create_time
+# 按文件夹缓存编码检测结果，先严格解码，失败时才尝试其他编码
+decoding = EncodingDetector(candidates=("utf-8", "GB18030"))
 
-    return text, extra_attrs
 
+def read_file(path: Path) -> str:
+    """读取文本文件 - 自动检测编码，无法解码的字节替换为 U+FFFD 并记录日志。"""
+    return decoding.read_text(path).text
+
+
+# 每个来源的模板规则：页眉、页脚、正文中的固定内容以及要提取的属性。
+# 增加来源只需要增加规则，每个文件仍然只扫描一次。
+STRIPPERS = {
+    "duzhe.20230111.2.杂志": BoilerplateStripper([
+        Rule("inline", "| 注册 | 登陆 | 家园首页 | 家园简介 | 版主招聘 | 原创佳句 | 新春祝福 |"),
+        Rule("footer", "| 设为首页 | 加入收藏 | 联系我们 | 版权申明 |"),
+        Rule(
+            "attribute", r"创建时间：(\d+)-(\d+)-(\d+)", regex=True,
+            name="create_time", region="footer", convert=format_date,
+        ),
+    ]),
+    # 与原来的处理相同：没有页眉与页脚的小说不去掉首尾的空白
+    "txtsk.20230112.5.小说": BoilerplateStripper([
+        Rule("header", "欢迎访问:   www.txtsk.com.cn"),
+        Rule("footer", "更多免费txt电子书，欢迎您到www.txtsk.com.cn下载"),
+    ], strip_unmatched=False),
+    "riddle.20230111.1.谜语": BoilerplateStripper([]),
+}
 
-def preprocessing_txtsk(text: str) -> tuple[str, dict]:
-    """预处理 txtsk.20230112.5.小说"""
-    header = "欢迎访问:   www.txtsk.com.cn"
-    footer = "更多免费txt电子书，欢迎您到www.txtsk.com.cn下载"
 
-    header_idx = text.find(header)
-    if header_idx != -1:
-        header_idx += len(header)
-        text = text[header_idx:].strip()
+def preprocessing_text(folder: str, filename: str, text: str) -> tuple[str, dict]:
+    """预处理 - 根据文件所在的文件夹去除模板。没有规则的文件夹返回 (None, None)。"""
+    stripper = STRIPPERS.get(folder, None)
+    if stripper is None:
+        return None, None
+    return stripper.strip(text)
 
-    footer_idx = text.find(footer)
-    if footer_idx != -1:
-        text = text[:footer_idx].strip()
 
-    return text, {}
+def read_stripped(path: Path) -> Iterator[str]:
+    """统计重复行时的文档：去除模板后的正文。"""
+    text, _ = preprocessing_text(path.parent.name, path.name, read_file(path))
+    if text is not None:
+        yield text
 
 
-def preprocessing_text(folder: str, filename: str, text: str) -> tuple[str, dict]:
-    """预处理 - 根据文件所在的文件夹处理。"""
-    if folder == "duzhe.20230111.2.杂志":
-        return preprocessing_duzhe(text)
-    if folder == "txtsk.20230112.5.小说":
-        return preprocessing_txtsk(text)
-    if folder == "riddle.20230111.1.谜语":
-        return text, {}
-    return None, None
-
-
-def get_writer(
-    output_folder: Path,
-    writers: dict[str, SizeLimitedFileWriter],
-    path: Union[Path, str],
-) -> SizeLimitedFileWriter:
-    """根据文件路径返回对应的 writer"""
+def get_route(path: Union[Path, str]) -> str:
+    """根据文件路径返回对应的路由（输出文件名前缀）"""
 
     keys = [
         "riddle.20230111.1.谜语",
@@ -104,41 +90,69 @@ def get_writer(
             found_key = key
             break
 
-    if found_key not in writers:
-        filename_fmt = found_key + ".{}.jsonl.gz"
-        writer = SizeLimitedFileWriter(
-            output_folder, filename_fmt=filename_fmt)
-        writers[found_key] = writer
+    return found_key
 
-    return writers[found_key]
 
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Optional[Union[Path, str]] = None,
+    log_path: str = LOG_PATH,
+    limit: Optional[int] = None,
+    writer_options: Optional[dict] = None,
+    boilerplate_min_count: Optional[int] = None,
+    drop_boilerplate: bool = False,
+    workers: Optional[int] = None,
+):
+    """转换历史数据。limit 为每类数据处理的文件数量，writer_options 覆盖写入参数。
+
+    指定 boilerplate_min_count 时先用 workers 个进程扫描每个来源的 txt，出现在至少这么多个文件中的行
+    标记为跨文件重复（drop_boilerplate 为 True 时删除），结果保存为 output_folder 下的 {来源}.boilerplate.json。
+    """
+    input_folder = Path(input_folder)
+
+    # 结果输出文件夹：默认为 input_folder 下的 output 文件夹
+    if output_folder is None:
+        output_folder = input_folder / "output"
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
 
-if __name__ == "__main__":
-    # 历史数据文件夹
-    # 解压 20230112.zip，并重命名一下文件夹
-    # riddle.20230111.1.أصسُ  -> riddle.20230111.1.谜语
-    # txtsk.20230112.5.شستى  -> txtsk.20230112.5.小说
-    input_folder = Path("data/20230112")
-
-    # 结果输出文件夹
-    output_folder = input_folder / "output"
-    output_folder.mkdir(exist_ok=True)
-
-    # 修改 log 的保存位置
-    log_path = "data/20230112/log.txt"
     logger = get_logger(log_path)
 
-    # writers
-    writers = {}
+    # 按来源写入不同的文件：{来源}.000.jsonl.gz
+    writer_kwargs = update_writer_kwargs(
+        dict(filename_fmt="{route}.{}.jsonl.gz"), writer_options)
+    writer = RoutingWriter(output_folder, **writer_kwargs)
 
-    # 处理 txt 文件
+    txt_paths = []
+    folder_counts: Dict[str, int] = {}
     for path in sorted(input_folder.glob("**/*.txt")):
-        folder = path.parent.name
-        filename = path.name
         # 跳过根目录的 txt
-        if folder == "20230112":
+        if path.parent == input_folder:
             continue
-        writer = get_writer(output_folder, writers, path)
+        # 每个文件夹（每类数据）最多 limit 个文件
+        count = folder_counts.get(path.parent.name, 0)
+        if (limit is not None) and (count >= limit):
+            continue
+        folder_counts[path.parent.name] = count + 1
+        txt_paths.append(path)
+
+    # 每个来源的重复行
+    boilerplates: Dict[str, BoilerplateLines] = {}
+    if boilerplate_min_count is not None:
+        folders = sorted({path.parent.name for path in txt_paths} & set(STRIPPERS))
+        for folder in folders:
+            paths = [path for path in txt_paths if path.parent.name == folder]
+            boilerplate = find_repeated_lines(
+                paths, min_count=boilerplate_min_count, read_documents=read_stripped, workers=workers)
+            boilerplate.save(output_folder / f"{folder}.boilerplate.json")
+            logger.info(f"{folder}: {len(boilerplate)} repeated lines in {boilerplate.documents} files")
+            boilerplates[folder] = boilerplate
+
+    # 处理 txt 文件
+    for path in txt_paths:
+        folder = path.parent.name
+        filename = path.name
+        route = get_route(path)
 
         # text_id
         text_id = f"{folder}-{filename}"
@@ -162,16 +176,18 @@ if __name__ == "__main__":
             text_id=text_id,
             text=text,
             create_time=create_time,
+            boilerplate=boilerplates.get(folder, None),
+            drop_boilerplate=drop_boilerplate,
         )
         for key, val in attributes.items():
             setattr(corpus, key, val)
 
-        writer.writeline(corpus.model_dump(by_alias=True))
+        writer.writeline(corpus.model_dump(by_alias=True), route=route)
 
     # 处理：github.20230111.3.文章
     article_folder = input_folder / "github.20230111.3.文章"
-    for path in sorted(article_folder.glob("**/*.json")):
-        writer = get_writer(output_folder, writers, path)
+    for path in sorted(article_folder.glob("**/*.json"))[:limit]:
+        route = get_route(path)
         with open(path, "r") as fp:
             for line in fp:
                 line = line.strip()
@@ -191,7 +207,7 @@ if __name__ == "__main__":
                     create_time="20230111"
                 )
                 corpus.extension_fields = json.dumps(data, ensure_ascii=False)
-                writer.writeline(corpus.model_dump(by_alias=True))
+                writer.writeline(corpus.model_dump(by_alias=True), route=route)
 
     # 处理：afqmc.20230111.4.金融
     finance_folder = input_folder / "afqmc.20230111.4.金融"
@@ -200,10 +216,12 @@ if __name__ == "__main__":
 句子一：{sentence1}
 句子二：{sentence2}
 """.strip()
-    for path in sorted(finance_folder.glob("*.json")):
+    for path in sorted(finance_folder.glob("*.json"))[:limit]:
         folder = path.parent.name
         filename = path.name
 
+        route = get_route(path)
+
         # id prefix
         id_prefix = f"{folder}-{filename}"
 
@@ -225,8 +243,12 @@ if __name__ == "__main__":
                     元数据=meta
                 )
                 corpus.create_time = create_time
-                writer.writeline(corpus.model_dump(by_alias=True))
+                writer.writeline(corpus.model_dump(by_alias=True), route=route)
 
-    # 关闭所有writers
-    for writer in writers.values():
-        writer.close()
+    # 关闭所有文件
+    writer.close()
+    logger.info(f"解码统计: {decoding.to_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,26 @@ PYTHONPATH=. python examples/newsdialog2forum.py
 """
 
 import json
+import logging
 import re
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 from tqdm import tqdm
 
 from mnbvc.formats.forum import ForumCorpus, ForumMessage
 from mnbvc.utils import get_logger
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.json_array import imap_json_array
+from mnbvc.utils.writer import SizeLimitedFileWriter, update_writer_kwargs
 
-log_path = "data/news_dialog_log.txt"
-logger = get_logger(log_path)
+# 修改指向数据文件、输出文件夹与 log 的保存位置
+DATA_INPUT_PATH = "data/news_dialogue.json"
+DATA_OUTPUT_FOLDER = "data/news_dialogue"
+LOG_PATH = "data/news_dialog_log.txt"
+NUM_WORKERS = 4
+
+# 与 get_logger 返回的是同一个 logger，在 main 中设置日志文件
+logger = logging.getLogger("mnbvc.utils")
 
 
 def convert_dialog_to_forum_corpus(
@@ -63,31 +71,49 @@ def convert_dialog_to_forum_corpus(
     return corpus
 
 
-if __name__ == "__main__":
-    # 修改指向数据文件
-    path = "data/news_dialogue.json"
-    
+def convert_dialog(dialog: dict) -> Optional[dict]:
+    """在进程池中转换一个采访，出错时返回 None。ID 为采访在文件中的序号，由主进程设置。"""
+    try:
+        corpus = convert_dialog_to_forum_corpus(0, dialog)
+    except Exception as e:
+        logger.error(f"Error processing {dialog.get('id')}: {e}")
+        return None
+    if corpus is None:
+        return None
+    return corpus.model_dump(by_alias=True)
+
 
-    # 输出文件夹
-    output_folder = "data/news_dialogue"
+def main(
+    input_path: Union[Path, str] = DATA_INPUT_PATH,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    workers: int = NUM_WORKERS,
+    limit: Optional[int] = None,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_path 中的采访。limit 为处理的采访数量，writer_options 覆盖写入参数。"""
+    get_logger(log_path)
 
     # 写入
-    writer = SizeLimitedFileWriter(
+    writer_kwargs = dict(
         output_folder=output_folder,
         filename_idx_first=0,  # 从 0 开始
         filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
         filename_idx_stride=1,  # 下一个文件的数字增量
         filename_fmt="{}.jsonl.gz"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
     )
+    writer = SizeLimitedFileWriter(**update_writer_kwargs(writer_kwargs, writer_options))
 
-    with open(path) as fp:
-        data = json.load(fp)
-    for idx, item in tqdm(enumerate(data)):
-        try:
-            corpus = convert_dialog_to_forum_corpus(idx, item)
-            if corpus is not None:
-                writer.writeline(corpus.model_dump(by_alias=True))
-        except Exception as e:
-            logger.error(f"Error processing {item['id']}: {e}")
-
-    writer.close()
\ No newline at end of file
+    # 逐个读取 JSON 数组中的元素，不需要一次性读入整个文件；
+    # 元素按批在 workers 个进程中转换，结果保持文件中的顺序
+    corpora = imap_json_array(input_path, convert_dialog, workers=workers, limit=limit)
+    for idx, corpus in tqdm(enumerate(corpora)):
+        if corpus is not None:
+            corpus["ID"] = idx
+            writer.writeline(corpus)
+
+    writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,21 @@ PYTHONPATH=. python examples/wudao2general.py
 import os
 import json
 import logging
-import uuid
 from pathlib import Path
-from typing import Iterator, Union
+from typing import Iterator, Optional, Union
 
 from tqdm import tqdm
 
 from mnbvc.formats.general import GeneralCorpus, convert_to_general_corpus
-from mnbvc.utils.writer import SizeLimitedFileWriter
+from mnbvc.utils.ids import content_id
+from mnbvc.utils.json_array import iter_json_array
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.writer import SizeLimitedFileWriter, update_writer_kwargs
 
-
-def get_uuid() -> str:
-    """获取一个 uuid。"""
-    return uuid.uuid4().hex
+# 修改指向数据文件夹、输出文件夹与 log 的保存位置
+DATA_INPUT_FOLDER = "F:/待检查/20230117/"
+DATA_OUTPUT_FOLDER = "F:/待检查/20230117_output"
+LOG_PATH = "F:/待检查/20230117_output_wudao.20230117.1.网页_log.txt"
 
 
 def get_logger(log_path: str) -> logging.Logger:
@@ -43,64 +45,86 @@ def convert_json_to_general_corpus(
     """将 JSON 转化成通用语料格式。"""
     logger.debug(f"处理文件: {path}")
 
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        for item in data:
-            # 获取标题和内容
-            title = item.get('title', '').strip()
-            content = item.get('content', '').strip()
-            if not content:
-                continue
-
-            # 生成text id - 每次运行都会生成新的id
-            text_id = get_uuid()
-
-            # 转换成通用语料格式
-            corpus = convert_to_general_corpus(
-                text_id=text_id,
-                text=content,
-            )
-            
-            # 添加扩展字段
-            extension_fields = {
-                "title": title,
-                "dataType": item.get('dataType', ''),
-                "uniqueKey": item.get('uniqueKey', ''),
-                "titleUkey": item.get('titleUkey', '')
-            }
-            corpus.extension_fields = json.dumps(extension_fields, ensure_ascii=False)
-            yield corpus
+    # 逐个读取 JSON 数组中的元素，不需要一次性读入整个文件
+    for item in iter_json_array(path, encoding="utf-8"):
+        # 获取标题和内容
+        title = item.get('title', '').strip()
+        content = item.get('content', '').strip()
+        if not content:
+            continue
+
+        # 由标题与内容生成text id - 每次运行都相同
+        text_id = content_id(title, content)
+
+        # 转换成通用语料格式
+        corpus = convert_to_general_corpus(
+            text_id=text_id,
+            text=content,
+        )
+        
+        # 添加扩展字段
+        extension_fields = {
+            "title": title,
+            "dataType": item.get('dataType', ''),
+            "uniqueKey": item.get('uniqueKey', ''),
+            "titleUkey": item.get('titleUkey', '')
+        }
+        corpus.extension_fields = json.dumps(extension_fields, ensure_ascii=False)
+        yield corpus
 
     logger.debug(f"转换结束: {path}")
 
 
-if __name__ == "__main__":
-    # 修改指向数据文件夹
-    path = "F:/待检查/20230117/"
-    input_folder = Path(path)
-
-    # 输出文件夹
-    output_folder = "F:/待检查/20230117_output"
+def main(
+    input_folder: Union[Path, str] = DATA_INPUT_FOLDER,
+    output_folder: Union[Path, str] = DATA_OUTPUT_FOLDER,
+    log_path: str = LOG_PATH,
+    limit: Optional[int] = None,
+    resume: bool = True,
+    writer_options: Optional[dict] = None,
+):
+    """转换 input_folder 中的 JSON。limit 为处理的文件数量，writer_options 覆盖写入参数。
+
+    resume 为 True 时跳过已经转换并且没有改变的 JSON，只转换新的与改变了的 JSON。
+    """
+    input_folder = Path(input_folder)
+    output_folder = Path(output_folder)
     os.makedirs(output_folder, exist_ok=True)
 
-    # 修改 log 的保存位置
-    log_path = "F:/待检查/20230117_output_wudao.20230117.1.网页_log.txt"
     logger = get_logger(log_path)
 
+    data_list = list(input_folder.glob("**/*.json"))[:limit]
 
-    data_list = list(input_folder.glob("**/*.json"))
-
-    for json_path in tqdm(data_list):    
+    for json_path in tqdm(data_list):
         # 写入
         file_name = json_path.stem
         output_dir = json_path.relative_to(input_folder).parent
-        writer = SizeLimitedFileWriter(
+        writer_kwargs = dict(
             output_folder=output_folder / output_dir,
             filename_idx_first=0,  # 从 0 开始
             filename_idx_width=6,  # 每个数字宽度，比如 0 -> 000000.jsonl
             filename_idx_stride=1,  # 下一个文件的数字增量
             filename_fmt=f"{file_name}_" + "{}.jsonl"  # 如果想要压缩好的输出可以修改成 "{}.jsonl.gz"
         )
-        for corpus in convert_json_to_general_corpus(json_path, logger):
-            writer.writeline(corpus.model_dump(by_alias=True))
-        writer.close() 
\ No newline at end of file
+        writer_kwargs = update_writer_kwargs(writer_kwargs, writer_options)
+        # 每个 JSON 有自己的 manifest，JSON 改变时（resume 为 False 时总是）删除其旧的输出
+        manifest = RunManifest(
+            output_folder / output_dir / f"manifest.{file_name}.json", resume=True)
+        if resume:
+            manifest.refresh([json_path], compresslevel=writer_kwargs.get("compresslevel", 9))
+        else:
+            manifest.clear()
+        if manifest.is_done(json_path):
+            continue
+        writer = SizeLimitedFileWriter(manifest=manifest, **writer_kwargs)
+        writer.begin_input(json_path)
+        writer.write_many(
+            corpus.model_dump(by_alias=True)
+            for corpus in convert_json_to_general_corpus(json_path, logger)
+        )
+        writer.end_input()
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
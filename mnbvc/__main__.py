@@ -0,0 +1,6 @@
+import sys
+
+from mnbvc.cli import run
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,142 @@
+"""命令行入口 - 每个样例转换对应一个子命令。
+
+运行方式：命令行到此文件上一层目录，执行
+PYTHONPATH=. python -m mnbvc <转换> [参数]
+
+例如：
+PYTHONPATH=. python -m mnbvc cmb --input data/cmb_raw --output data/cmb --workers 16 --compress-level 6
+
+转换的代码在 examples 中，只有运行对应的子命令时才导入（以及 pyarrow 等依赖），
+因此 --help 或者很小的任务启动很快。
+"""
+
+import argparse
+import cProfile
+import importlib
+import inspect
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+EXAMPLES_FOLDER = Path(__file__).resolve().parent.parent / "examples"
+
+# 子命令 -> (examples 中的模块名，说明)
+CONVERTERS = {
+    "bloomberg": ("bloomberg2general", "彭博社新闻 -> 通用语料"),
+    "ccpdf": ("ccpdf2general", "CCPDF parquet -> 通用语料"),
+    "cmb": ("cmb2general", "招商金融数据 jsonl -> 通用语料"),
+    "epubs": ("epubs2general", "EPUB 电子书 -> 通用语料"),
+    "finewebedu": ("finewebedu2general", "中文教育数据 parquet -> 通用语料"),
+    "history": ("history2general", "历史数据 20230112 -> 通用语料/问答语料"),
+    "newsdialog": ("newsdialog2forum", "NPR/CNN 采访对话 -> 论坛语料"),
+    "wudao": ("wudao2general", "悟道 JSON -> 通用语料"),
+}
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """所有转换共用的参数。没有指定的参数使用样例中的默认值。"""
+    parser.add_argument("--input", help="输入文件夹（或文件）")
+    parser.add_argument("--output", help="输出文件夹")
+    parser.add_argument("--log", help="日志文件")
+    parser.add_argument("--workers", type=int, help="进程数")
+    parser.add_argument("--limit", type=int, help="最多处理的输入数量，用于试运行")
+    parser.add_argument(
+        "--compress-level", type=int, choices=range(1, 10), metavar="1-9",
+        help="gzip 压缩等级，输出改为 .jsonl.gz；越小越快")
+    parser.add_argument("--shard-size", type=float, help="每个输出文件的大小上限（MB）")
+    parser.add_argument(
+        "--resume", action=argparse.BooleanOptionalAction, default=None,
+        help="跳过上一次已经完成并且没有改变的输入，支持此参数的转换默认开启"
+             "（--no-resume 删除上一次的输出并重新处理所有输入）")
+    parser.add_argument(
+        "--memory-limit", type=float, metavar="MB",
+        help="所有进程合计的内存预算（MB），接近时减小批大小；默认为可用内存的 80%%")
+    parser.add_argument(
+        "--profile", nargs="?", const="", default=None, metavar="DIR",
+        help="统计各阶段耗时（所有进程）并用 cProfile 分析主进程，结果保存到 DIR（默认为 profile.<转换>）")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m mnbvc", description="MNBVC 数据清洗")
+    subparsers = parser.add_subparsers(dest="converter", required=True, metavar="<转换>")
+    for name, (_, description) in CONVERTERS.items():
+        subparser = subparsers.add_parser(name, help=description, description=description)
+        add_common_arguments(subparser)
+    return parser
+
+
+def load_converter(name: str):
+    """导入子命令对应的样例模块。"""
+    module_name, _ = CONVERTERS[name]
+    if str(EXAMPLES_FOLDER) not in sys.path:
+        sys.path.insert(0, str(EXAMPLES_FOLDER))
+    return importlib.import_module(module_name)
+
+
+def get_main_kwargs(parser: argparse.ArgumentParser, main, args: argparse.Namespace) -> dict:
+    """把命令行参数转换成样例中 main 的参数。样例不支持的参数会报错，而不是被忽略。"""
+    params = inspect.signature(main).parameters
+    input_param = "input_folder" if "input_folder" in params else "input_path"
+    candidates = {
+        "--input": (input_param, args.input),
+        "--output": ("output_folder", args.output),
+        "--log": ("log_path", args.log),
+        "--workers": ("workers", args.workers),
+        "--limit": ("limit", args.limit),
+        "--resume": ("resume", args.resume),
+    }
+    kwargs = {}
+    for flag, (param, value) in candidates.items():
+        if value is None:
+            continue
+        if param not in params:
+            parser.error(f"{args.converter} 不支持 {flag}")
+        kwargs[param] = value
+
+    writer_options = {}
+    if args.compress_level is not None:
+        writer_options["compresslevel"] = args.compress_level
+    if args.shard_size is not None:
+        writer_options["file_size_limit_mb"] = args.shard_size
+    if writer_options:
+        if "writer_options" not in params:
+            parser.error(f"{args.converter} 不支持 --compress-level 与 --shard-size")
+        kwargs["writer_options"] = writer_options
+    return kwargs
+
+
+def run(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    module = load_converter(args.converter)
+    kwargs = get_main_kwargs(parser, module.main, args)
+    if args.memory_limit is not None:
+        # 通过环境变量传给 MemoryBudget（包括子进程中的）
+        from mnbvc.utils import memory
+        os.environ[memory.ENV_VAR] = str(args.memory_limit)
+
+    if args.profile is None:
+        module.main(**kwargs)
+        return 0
+
+    from mnbvc.utils import profiling
+
+    profile_folder = Path(args.profile or f"profile.{args.converter}")
+    profile_folder.mkdir(parents=True, exist_ok=True)
+    # 删除上一次运行的统计
+    for path in profile_folder.glob("profile.*.json"):
+        path.unlink()
+    profiling.enable(profile_folder)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        module.main(**kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_folder / "main.prof")
+        profiling.flush()
+        report = profiling.write_report(profile_folder)
+        print(profiling.format_report(report), file=sys.stderr)
+        print(f"Profile saved to {profile_folder}", file=sys.stderr)
+    return 0
@@ -3,10 +3,11 @@
 
 import datetime
 import hashlib
-from typing import List, Union
+from typing import Container, List, Optional, Union
 
 from pydantic import BaseModel, Field, computed_field
 
+from mnbvc.utils import profiling
 from mnbvc.utils.simhash import Simhash
 
 
@@ -87,7 +88,8 @@ class GeneralCorpus(BaseModel):
             paragraph.content
             for paragraph in self.paragraphs
         ]
-        simhash_val = Simhash(texts).value
+        with profiling.stage("simhash"):
+            simhash_val = Simhash(texts).value
         return simhash_val
 
     @classmethod
@@ -95,14 +97,20 @@ class GeneralCorpus(BaseModel):
         return "通用语料格式"
 
 
+@profiling.timed("convert_to_general_corpus")
 def convert_to_general_corpus(
         text_id: str,
         text: Union[str, List[str]],
         create_time: str = None,
         strip=True,
+        boilerplate: Optional[Container[str]] = None,
+        drop_boilerplate: bool = False,
 ) -> GeneralCorpus:
     """将文件转化成通用语料格式。
 
+    boilerplate 为模板行（例如 mnbvc.utils.sketch.find_repeated_lines 的结果），其中的段落计入低质量段落数，
+    并标记为跨文件重复；drop_boilerplate 为 True 时直接删除这些段落。
+
     Returns:
         GeneralCorpusFormat: 将文件转化后的通用语料格式
     """
@@ -119,18 +127,25 @@ def convert_to_general_corpus(
     max_len = -1
 
     hashes = set()
+    low_quality = 0
 
     for idx, line in enumerate(lines):
         if not line.strip():
             continue
         if strip:
             line = line.strip()
+        is_boilerplate = (boilerplate is not None) and (line in boilerplate)
+        if is_boilerplate and drop_boilerplate:
+            continue
 
         line_dict = {
           "行号": idx + 1,
           "内容": line,
         }
         paragraph = GeneralParagraph(**line_dict)
+        if is_boilerplate:
+            paragraph.repeated_across_files = True
+            low_quality += 1
 
         paragraphs.append(paragraph)
         max_len = max(max_len, len(line))
@@ -147,7 +162,7 @@ def convert_to_general_corpus(
       "最长段落长度": max_len,
       "段落数": len(paragraphs),
       "去重段落数": len(hashes),
-      "低质量段落数": 0,
+      "低质量段落数": low_quality,
       "段落": paragraphs,
       "时间": create_time
     }
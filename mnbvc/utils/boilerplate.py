@@ -0,0 +1,175 @@
+"""去除网站模板 - 把一个来源的页眉、页脚、正文中的固定内容以及要提取的属性写成规则，
+合并成一个正则表达式，对全文只扫描一次。
+
+用法：
+    stripper = BoilerplateStripper([
+        Rule("inline", "| 注册 | 登陆 | 家园首页 |"),
+        Rule("footer", "| 设为首页 | 加入收藏 |"),
+        Rule("attribute", r"创建时间：(\\d+)-(\\d+)-(\\d+)", regex=True,
+             name="create_time", region="footer", convert=format_date),
+    ])
+    text, attrs = stripper.strip(raw_text)  # attrs: {"create_time": "20230111"}
+
+规则的类型：
+    header：删除第一个匹配及其之前的内容（有多个 header 规则时，删除到最靠后的一个）
+    footer：删除 header 之后的第一个匹配及其之后的内容
+    inline：删除所有匹配
+    attribute：不删除，提取属性 name；region 为 "header"、"body"、"footer" 时只使用该部分中的匹配，
+        "text" 为全文。值为 convert(匹配)，没有 convert 时为第一个分组（没有分组时为整个匹配）。
+        同一个属性有多个匹配时使用第一个。
+
+所有规则合并成一个正则表达式，规则增加时仍然只扫描一次全文：
+按字面匹配的规则合并成一个前缀树形式的分支（例如 ab|ac -> a(?:b|c)），每个位置只需要比较一次第一个字符，
+耗时几乎不随规则数量增长；正则表达式规则各自是一个分支，数量较多时会变慢。
+匹配不重叠：一个规则的匹配中的内容不会再匹配其他规则，例如 attribute 不应被包含在 footer 的模式中；
+多个字面规则在同一位置匹配时使用最长的一个。正则表达式规则中不要使用命名分组。
+"""
+
+import re
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+KINDS = ("header", "footer", "inline", "attribute")
+REGIONS = ("text", "header", "body", "footer")
+
+
+class Rule(NamedTuple):
+    kind: str
+    # 模式：regex 为 False 时按字面匹配
+    pattern: str
+    regex: bool = False
+    # 以下只用于 attribute
+    name: Optional[str] = None
+    region: str = "text"
+    convert: Optional[Callable[["re.Match"], Any]] = None
+
+
+def format_date(match: "re.Match") -> str:
+    """把 年、月、日 三个分组转换为 yyyymmdd，例如 创建时间：2023-1-11 -> 20230111"""
+    year, month, day = map(int, match.groups()[:3])
+    return f"{year}{month:02d}{day:02d}"
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """把多个字符串合并成前缀树形式的正则表达式，匹配其中任意一个（同一位置匹配最长的）。"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node: dict) -> str:
+    branches = [
+        re.escape(char) + _node_pattern(child)
+        for char, child in sorted(node.items()) if char != ""
+    ]
+    if not branches:
+        return ""
+    if (len(branches) == 1) and ("" not in node):
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    # 这里也可以结束：可选的后缀，贪婪匹配保证优先匹配更长的字符串
+    return pattern + "?" if "" in node else pattern
+
+
+class BoilerplateStripper:
+    """一个来源的规则，见模块说明。"""
+
+    def __init__(self, rules: Iterable[Rule], strip_unmatched: bool = True):
+        self.rules: List[Rule] = list(rules)
+        # 为 False 时，没有匹配到 header 与 footer 的正文保持原样，不去掉首尾的空白
+        self.strip_unmatched = strip_unmatched
+        self._patterns: List[re.Pattern] = []
+        # 字面 -> 规则编号（同一个字面有多个规则时使用第一个）
+        self._literals: Dict[str, int] = {}
+        branches = []
+        for idx, rule in enumerate(self.rules):
+            if rule.kind not in KINDS:
+                raise Exception(f"Unknown boilerplate rule kind: {rule.kind}")
+            if rule.region not in REGIONS:
+                raise Exception(f"Unknown boilerplate rule region: {rule.region}")
+            if (rule.kind == "attribute") and (not rule.name):
+                raise Exception(f"Attribute rule needs a name: {rule.pattern}")
+            if not rule.pattern:
+                raise Exception(f"Empty boilerplate pattern in rule {idx}")
+            pattern = rule.pattern if rule.regex else re.escape(rule.pattern)
+            self._patterns.append(re.compile(pattern))
+            if rule.regex:
+                # 规则中的分组编号会在合并后改变，这里只用外层的命名分组判断是哪个规则
+                branches.append(f"(?P<r{idx}>{pattern})")
+            else:
+                self._literals.setdefault(rule.pattern, idx)
+        if self._literals:
+            branches.insert(0, f"(?P<literal>{trie_pattern(self._literals)})")
+        self._regex = re.compile("|".join(branches)) if branches else None
+
+    def strip(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """去除模板并提取属性，返回 (正文，属性)。正文去掉首尾的空白（见 strip_unmatched）。"""
+        if self._regex is None:
+            return text, {}
+
+        header_end = 0
+        footers: List[int] = []
+        inline: List[Tuple[int, int]] = []
+        attributes: List[Tuple[Rule, int, "re.Match"]] = []
+        seen_headers = set()
+        for match in self._regex.finditer(text):
+            if match.lastgroup == "literal":
+                idx = self._literals[match.group()]
+            else:
+                idx = int(match.lastgroup[1:])
+            rule = self.rules[idx]
+            if rule.kind == "header":
+                if idx not in seen_headers:
+                    seen_headers.add(idx)
+                    header_end = max(header_end, match.end())
+            elif rule.kind == "footer":
+                footers.append(match.start())
+            elif rule.kind == "inline":
+                inline.append(match.span())
+            else:
+                attributes.append((rule, idx, match))
+
+        footer_start = next((start for start in footers if start >= header_end), len(text))
+
+        parts = []
+        pos = header_end
+        for start, end in inline:
+            if end <= header_end:
+                continue
+            if start >= footer_start:
+                break
+            parts.append(text[pos:max(start, pos)])
+            pos = max(end, pos)
+        parts.append(text[pos:max(footer_start, pos)])
+        body = "".join(parts)
+        if self.strip_unmatched or (header_end > 0) or (footer_start < len(text)):
+            body = body.strip()
+
+        attrs: Dict[str, Any] = {}
+        for rule, idx, match in attributes:
+            if rule.name in attrs:
+                continue
+            if not _in_region(rule.region, match, header_end, footer_start):
+                continue
+            # 用规则自己的正则表达式重新匹配，分组编号与规则中的相同
+            own_match = self._patterns[idx].match(text, match.start())
+            if rule.convert is not None:
+                attrs[rule.name] = rule.convert(own_match)
+            elif own_match.groups():
+                attrs[rule.name] = own_match.group(1)
+            else:
+                attrs[rule.name] = own_match.group(0)
+        return body, attrs
+
+
+def _in_region(region: str, match: "re.Match", header_end: int, footer_start: int) -> bool:
+    if region == "header":
+        return match.end() <= header_end
+    if region == "footer":
+        return match.start() >= footer_start
+    if region == "body":
+        return (match.start() >= header_end) and (match.end() <= footer_start)
+    return True
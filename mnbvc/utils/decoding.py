@@ -0,0 +1,267 @@
+"""文本解码 - 按文件夹缓存编码检测结果，严格解码，失败时才回退。
+
+同一个文件夹中的文件通常使用同一种编码。EncodingDetector 只读取文件开头的一小段用于检测编码，
+并按文件夹缓存检测结果；之后的文件先严格尝试 utf-8，再使用缓存的编码，只有都失败时才重新检测。
+GB18030 几乎可以解码任意字节，缓存的编码如果排在 utf-8 前面，同一个文件夹中的 utf-8 文件会被解码成乱码。
+所有候选编码都失败时，用检测到的编码解码并把错误的字节替换为 U+FFFD，同时统计替换的字节数，
+而不是像 errors="ignore" 一样静默丢弃。
+"""
+
+import codecs
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+
+from mnbvc.utils import profiling
+
+logger = logging.getLogger(__name__)
+
+# GB18030 几乎可以解码任意字节，因此 utf-8 需要排在前面
+DEFAULT_CANDIDATES = ("utf-8", "GB18030")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# 替换错误字节并计数的错误处理：errors="mnbvc.count_replace"
+_replace_counter = threading.local()
+
+
+def _count_replace(exc: UnicodeDecodeError) -> Tuple[str, int]:
+    _replace_counter.count = getattr(_replace_counter, "count", 0) + (exc.end - exc.start)
+    return "�", exc.end
+
+
+codecs.register_error("mnbvc.count_replace", _count_replace)
+
+
+class DecodeResult(NamedTuple):
+    text: str
+    encoding: str
+    # 被替换为 U+FFFD 的字节数，0 表示严格解码成功
+    replacements: int = 0
+
+
+def decode_prefix(sample: bytes, encoding: str) -> bool:
+    """sample 是否可以用 encoding 严格解码。sample 末尾被截断的多字节字符不算错误。"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        decoder.decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(
+    sample: bytes,
+    candidates: Sequence[str] = DEFAULT_CANDIDATES,
+    use_chardet: bool = True,
+) -> Optional[str]:
+    """根据文件开头的 sample 检测编码，返回第一个可以严格解码的候选编码。
+
+    所有候选编码都失败时，如果安装了 chardet 则使用 chardet 的结果，否则返回 None。
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in candidates:
+        if decode_prefix(sample, encoding):
+            return encoding
+    if use_chardet:
+        try:
+            import chardet
+        except ImportError:
+            return None
+        encoding = chardet.detect(sample).get("encoding")
+        if encoding and decode_prefix(sample, encoding):
+            return encoding
+    return None
+
+
+def decode_bytes(
+    data: bytes,
+    encoding: str,
+    fallback_encodings: Sequence[str] = (),
+) -> DecodeResult:
+    """先用 encoding 严格解码，失败时依次尝试 fallback_encodings，
+    都失败时用 encoding 解码并替换错误的字节。"""
+    for candidate in (encoding, *fallback_encodings):
+        try:
+            return DecodeResult(data.decode(candidate), candidate)
+        except UnicodeDecodeError:
+            continue
+    _replace_counter.count = 0
+    text = data.decode(encoding, errors="mnbvc.count_replace")
+    return DecodeResult(text, encoding, _replace_counter.count)
+
+
+def iter_decoded_chunks(
+    path: Union[Path, str],
+    encoding: str,
+    chunk_size: int = 1 << 20,
+    errors: str = "strict",
+) -> Iterator[str]:
+    """按块读取并解码文件，内存中只有一块数据。errors="strict" 时解码失败会抛出 UnicodeDecodeError。"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class EncodingDetector:
+    """读取文本文件，按文件夹缓存编码检测结果。
+
+    用法：
+        detector = EncodingDetector(candidates=("utf-8", "GB18030"))
+        result = detector.read_text(path)
+        result.text, result.encoding, result.replacements
+
+    sample_size：检测编码时读取的文件开头的字节数；
+    large_file_size：大于此大小的文件按块增量解码，不会读入整个文件的字节，
+    但 read_text 返回的仍然是整个文件的文本，内存占用与文本大小相当，只有检测编码读取的字节是有上限的；
+    开头就无法严格解码的候选编码不会用于尝试解码整个文件，通常只需要读一遍文件；
+    只包含 ASCII 的开头无法区分候选编码，不会写入缓存。
+
+    需要限制内存时使用 iter_text 或 iter_lines，内存中只有一块数据：
+        for line in detector.iter_lines(path):
+            ...
+    """
+
+    def __init__(
+        self,
+        candidates: Sequence[str] = DEFAULT_CANDIDATES,
+        sample_size: int = 64 << 10,
+        large_file_size: int = 64 << 20,
+        chunk_size: int = 1 << 20,
+        use_chardet: bool = True,
+    ):
+        self.candidates = tuple(candidates)
+        self.sample_size = sample_size
+        self.large_file_size = large_file_size
+        self.chunk_size = chunk_size
+        self.use_chardet = use_chardet
+        # 文件夹 -> 编码
+        self.folder_encodings: Dict[str, str] = {}
+        self.files = 0
+        self.fallbacks = 0
+        self.replaced_files = 0
+
+    def detect(self, path: Union[Path, str], sample: Optional[bytes] = None) -> str:
+        """返回 path 的编码：BOM、严格的 utf-8（在候选编码中时）、文件夹的缓存结果，最后读取开头检测。"""
+        folder = str(Path(path).parent)
+        if sample is None:
+            with open(path, "rb") as fp:
+                sample = fp.read(self.sample_size)
+        for bom, encoding in _BOMS:
+            if sample.startswith(bom):
+                return encoding
+        # utf-8 很少误认其他编码的文本，总是先于缓存的编码尝试
+        if ("utf-8" in self.candidates) and decode_prefix(sample, "utf-8"):
+            if not sample.isascii():
+                self.folder_encodings.setdefault(folder, "utf-8")
+            return "utf-8"
+        cached = self.folder_encodings.get(folder, None)
+        if (cached is not None) and decode_prefix(sample, cached):
+            return cached
+
+        encoding = detect_encoding(sample, self.candidates, self.use_chardet)
+        if encoding is None:
+            return cached or self.candidates[0]
+        if not sample.isascii():
+            self.folder_encodings[folder] = encoding
+        return encoding
+
+    @profiling.timed("read_text")
+    def read_text(self, path: Union[Path, str]) -> DecodeResult:
+        """读取并解码整个文件。编码错误时在日志中记录替换的字节数。"""
+        path = Path(path)
+        self.files += 1
+        if path.stat().st_size > self.large_file_size:
+            result = self._read_large(path)
+        else:
+            data = path.read_bytes()
+            encoding = self.detect(path, data[:self.sample_size])
+            fallbacks = [candidate for candidate in self.candidates if candidate != encoding]
+            result = decode_bytes(data, encoding, fallbacks)
+            if result.encoding != encoding:
+                self.fallbacks += 1
+
+        if result.replacements:
+            self.replaced_files += 1
+            logger.warning(
+                f"Replaced {result.replacements} undecodable bytes in {path} ({result.encoding})")
+        return result
+
+    def _read_large(self, path: Path) -> DecodeResult:
+        with open(path, "rb") as fp:
+            sample = fp.read(self.sample_size)
+        encoding = self.detect(path, sample)
+        # 开头就无法解码的候选编码不需要再读一遍整个文件
+        fallbacks = [c for c in self.candidates if (c != encoding) and decode_prefix(sample, c)]
+        if fallbacks:
+            for candidate in [encoding] + fallbacks:
+                try:
+                    text = "".join(iter_decoded_chunks(path, candidate, self.chunk_size))
+                except UnicodeDecodeError:
+                    continue
+                if candidate != encoding:
+                    self.fallbacks += 1
+                return DecodeResult(text, candidate)
+        # 没有其他候选编码时严格解码与替换错误字节只需要一遍：没有替换即为严格解码成功
+        _replace_counter.count = 0
+        text = "".join(iter_decoded_chunks(
+            path, encoding, self.chunk_size, errors="mnbvc.count_replace"))
+        return DecodeResult(text, encoding, _replace_counter.count)
+
+    def iter_text(self, path: Union[Path, str]) -> Iterator[str]:
+        """按块读取并解码文件，每次返回一块文本，内存中只有一块数据。
+
+        编码只根据文件开头检测：已经返回的文本无法撤回，之后出现无法解码的字节时不会换用其他候选编码，
+        而是替换为 U+FFFD，读完后在日志中记录替换的字节数。
+        """
+        path = Path(path)
+        self.files += 1
+        with open(path, "rb") as fp:
+            sample = fp.read(self.sample_size)
+        encoding = self.detect(path, sample)
+        chunks = iter_decoded_chunks(path, encoding, self.chunk_size, errors="mnbvc.count_replace")
+        replacements = 0
+        while True:
+            # 计数器是线程内共享的，只统计这一次解码
+            _replace_counter.count = 0
+            text = next(chunks, None)
+            replacements += _replace_counter.count
+            if text is None:
+                break
+            yield text
+        if replacements:
+            self.replaced_files += 1
+            logger.warning(f"Replaced {replacements} undecodable bytes in {path} ({encoding})")
+
+    def iter_lines(self, path: Union[Path, str]) -> Iterator[str]:
+        """按行返回 iter_text 的结果，与 text.split("\n") 相同（不包含换行符）。"""
+        rest = ""
+        for text in self.iter_text(path):
+            lines = (rest + text).split("\n")
+            rest = lines.pop()
+            yield from lines
+        yield rest
+
+    def to_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "fallbacks": self.fallbacks,
+            "replaced_files": self.replaced_files,
+            "folder_encodings": dict(self.folder_encodings),
+        }
@@ -0,0 +1,168 @@
+"""读取 EPUB - 直接用 zipfile 读取，只在需要时读取章节。
+
+EPUB 是一个 zip 压缩包：META-INF/container.xml 指向 OPF 文件，
+OPF 中有元数据（标题、日期等）、所有文件的列表（manifest）与阅读顺序（spine），
+NCX 文件中是目录。
+
+ebooklib.epub.read_epub 打开时会读取并解析压缩包中的所有文件（包括图片与字体）；
+EpubReader 打开时只解析 container.xml、OPF 与 NCX，章节内容在读取时才解压。
+"""
+
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import unquote
+
+from mnbvc.utils import profiling
+
+
+class ManifestItem(NamedTuple):
+    id: str
+    # 压缩包中的路径
+    path: str
+    media_type: str
+
+
+def _local_name(tag: str) -> str:
+    """去掉 XML 命名空间：{http://www.idpf.org/2007/opf}item -> item"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find_all(root: ET.Element, name: str) -> Iterator[ET.Element]:
+    for element in root.iter():
+        if _local_name(element.tag) == name:
+            yield element
+
+
+def _find(root: ET.Element, name: str) -> Optional[ET.Element]:
+    return next(_find_all(root, name), None)
+
+
+class EpubReader:
+    """读取 EPUB 的元数据、目录与章节。
+
+    用法：
+        with EpubReader(path) as book:
+            book.title, book.get_metadata("date")
+            for title, href in book.toc:
+                html = book.read(href).decode()
+            for href, content in book.iter_spine():
+                ...
+    """
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self._names = set(self.zip.namelist())
+
+        container = ET.fromstring(self.zip.read("META-INF/container.xml"))
+        rootfile = _find(container, "rootfile")
+        if rootfile is None:
+            raise Exception(f"Cannot find OPF file in {path}")
+        self.opf_path = rootfile.get("full-path")
+        self.opf_dir = posixpath.dirname(self.opf_path)
+        self.opf = ET.fromstring(self.zip.read(self.opf_path))
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def resolve(self, href: str, base_dir: Optional[str] = None) -> str:
+        """把 OPF（或 base_dir）中的相对链接转换为压缩包中的路径，去掉 #锚点。"""
+        if base_dir is None:
+            base_dir = self.opf_dir
+        href = unquote(href.split("#", 1)[0])
+        return posixpath.normpath(posixpath.join(base_dir, href))
+
+    @cached_property
+    def metadata(self) -> Dict[str, List[str]]:
+        """Dublin Core 元数据：{名称: [值, ...]}，例如 {"title": [...], "date": [...]}"""
+        metadata: Dict[str, List[str]] = {}
+        element = _find(self.opf, "metadata")
+        if element is None:
+            return metadata
+        for child in element:
+            if not child.tag.startswith("{http://purl.org/dc/elements/1.1/}"):
+                continue
+            metadata.setdefault(_local_name(child.tag), []).append((child.text or "").strip())
+        return metadata
+
+    def get_metadata(self, name: str) -> List[str]:
+        return self.metadata.get(name, [])
+
+    @property
+    def title(self) -> Optional[str]:
+        titles = self.get_metadata("title")
+        return titles[0] if titles else None
+
+    @cached_property
+    def manifest(self) -> Dict[str, ManifestItem]:
+        """manifest 中的文件：{id: ManifestItem}"""
+        items = {}
+        for item in _find_all(self.opf, "item"):
+            item_id = item.get("id")
+            href = item.get("href")
+            if (item_id is None) or (href is None):
+                continue
+            items[item_id] = ManifestItem(item_id, self.resolve(href), item.get("media-type", ""))
+        return items
+
+    @cached_property
+    def spine(self) -> List[str]:
+        """阅读顺序：压缩包中的路径列表。"""
+        paths = []
+        for itemref in _find_all(self.opf, "itemref"):
+            item = self.manifest.get(itemref.get("idref"), None)
+            if item is not None:
+                paths.append(item.path)
+        return paths
+
+    @cached_property
+    def toc(self) -> List[Tuple[str, str]]:
+        """NCX 目录，按文档顺序展开嵌套的目录。返回列表，每个元素为 (标题，压缩包中的路径)。"""
+        ncx_path = self._ncx_path()
+        if ncx_path is None:
+            return []
+        ncx = ET.fromstring(self.zip.read(ncx_path))
+        ncx_dir = posixpath.dirname(ncx_path)
+        contents = []
+        for nav_point in _find_all(ncx, "navPoint"):
+            label = _find(nav_point, "text")
+            content = _find(nav_point, "content")
+            if (label is None) or (content is None) or (content.get("src") is None):
+                continue
+            title = "".join(label.itertext()).strip()
+            contents.append((title, self.resolve(content.get("src"), ncx_dir)))
+        return contents
+
+    def _ncx_path(self) -> Optional[str]:
+        spine = _find(self.opf, "spine")
+        toc_id = spine.get("toc") if spine is not None else None
+        if toc_id in self.manifest:
+            return self.manifest[toc_id].path
+        for item in self.manifest.values():
+            if item.media_type == "application/x-dtbncx+xml":
+                return item.path
+        return None
+
+    def has(self, path: str) -> bool:
+        return path in self._names
+
+    def read(self, path: str) -> bytes:
+        """读取压缩包中的一个文件（路径见 toc、spine 与 manifest）。"""
+        with profiling.stage("read_epub"):
+            return self.zip.read(path)
+
+    def iter_spine(self) -> Iterator[Tuple[str, bytes]]:
+        """按阅读顺序逐个读取章节：(路径，内容)。同一时间内存中只有一个章节。"""
+        for path in self.spine:
+            if self.has(path):
+                yield path, self.read(path)
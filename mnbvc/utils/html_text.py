@@ -0,0 +1,192 @@
+"""HTML 文本提取 - 从 HTML 中按段落提取文字，保留代码区块。
+
+规则（与 examples/epubs2general.py 原来的 ArticleParser 相同）：
+    - 块级标签（p, div, h1-h6, blockquote）结束时结束当前段落；
+    - pre 中的文字保留空白，pre 结束时结束当前段落；
+    - pre 外的文字去掉首尾空白；
+    - br：pre 中为换行，pre 外结束当前段落；
+    - 统计 img 的数量。
+
+段落中的文字先放进列表，段落结束时再拼接，长段落的耗时与长度成正比。
+安装了 lxml 时可以使用 backend="lxml"，由 libxml2 分词，速度更快；
+注意 lxml 会把没有闭合的 <br> 也当作换行并忽略多余的 </br>，html.parser 只处理 <br/> 与 </br>。
+"""
+
+from html.parser import HTMLParser
+from typing import List, NamedTuple, Optional, Tuple
+
+from mnbvc.utils import profiling
+
+BLOCK_TAGS = frozenset(["p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote"])
+
+
+class Article(NamedTuple):
+    texts: List[str]
+    img_count: int
+
+
+class _TextBuilder:
+    """记录提取状态，由不同的分词器调用。"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.current: List[str] = []
+        self.in_pre: bool = False
+        self.img_count = 0
+
+    def add_text(self):
+        """保存当前文字。"""
+        if self.current:
+            text = "".join(self.current)
+            if text:
+                self.texts.append(text)
+            self.current = []
+
+    def line_break(self):
+        if self.in_pre:
+            self.current.append("\n")
+        else:
+            self.add_text()
+
+    def start(self, tag: str):
+        if tag == "pre":
+            self.in_pre = True
+        elif tag == "img":
+            self.img_count += 1
+
+    def end(self, tag: str):
+        if tag in BLOCK_TAGS:
+            self.add_text()
+        elif tag == "br":
+            self.line_break()
+        elif tag == "pre":
+            self.in_pre = False
+            self.add_text()
+
+    def startend(self, tag: str):
+        if tag == "br":
+            self.line_break()
+        elif tag == "img":
+            self.img_count += 1
+
+    def data(self, data: str):
+        if not self.in_pre:
+            data = data.strip()
+        if data:
+            self.current.append(data)
+
+    def finish(self) -> Article:
+        self.add_text()
+        return Article(self.texts, self.img_count)
+
+
+class ArticleExtractor(HTMLParser):
+    """从 HTML 中提取文章，基于 html.parser。
+
+    用法：
+        extractor = ArticleExtractor()
+        extractor.feed(html)
+        extractor.texts, extractor.img_count
+    """
+
+    def __init__(self):
+        self.builder = _TextBuilder()
+        super().__init__()
+
+    @property
+    def texts(self) -> List[str]:
+        return self.builder.texts
+
+    @property
+    def img_count(self) -> int:
+        return self.builder.img_count
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.builder.start(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        self.builder.end(tag)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.builder.startend(tag)
+
+    def handle_data(self, data: str) -> None:
+        self.builder.data(data)
+
+    def feed(self, data: str) -> None:
+        self.clear()
+        super().feed(data)
+        self.close()
+        self.builder.finish()
+
+    def clear(self):
+        self.reset()
+        self.builder = _TextBuilder()
+
+
+class _LxmlTarget:
+    """lxml 解析器的 target：把事件转发给 _TextBuilder。
+
+    lxml 会在实体处把文字拆成多次 data 事件，先缓存起来，到下一个标签时再一起处理，
+    与 html.parser 保持一致（pre 外的文字按两个标签之间的整体去掉首尾空白）。
+    """
+
+    def __init__(self):
+        self.builder = _TextBuilder()
+        self.pending: List[str] = []
+
+    def flush(self):
+        if self.pending:
+            self.builder.data("".join(self.pending))
+            self.pending = []
+
+    def start(self, tag: str, attrib: dict):
+        self.flush()
+        self.builder.start(tag)
+
+    def end(self, tag: str):
+        self.flush()
+        # lxml 对 <br>、<img> 等空标签也会产生 end 事件
+        if tag == "br":
+            self.builder.line_break()
+        elif tag != "img":
+            self.builder.end(tag)
+
+    def data(self, data: str):
+        self.pending.append(data)
+
+    def close(self) -> Article:
+        self.flush()
+        return self.builder.finish()
+
+
+def _extract_lxml(html: str) -> Article:
+    from lxml import etree
+
+    parser = etree.HTMLParser(target=_LxmlTarget())
+    # 去掉 XML 声明，否则 lxml 不接受带编码声明的 str
+    if html.startswith("<?xml"):
+        html = html[html.find("?>") + 2:]
+    parser.feed(html)
+    return parser.close()
+
+
+@profiling.timed("parse_html")
+def extract_article(html: str, backend: str = "html.parser") -> Article:
+    """提取一个 HTML 中的文章。backend 为 "html.parser" 或 "lxml"。"""
+    if backend == "lxml":
+        return _extract_lxml(html)
+    if backend != "html.parser":
+        raise Exception(f"Unknown HTML backend: {backend}")
+    extractor = ArticleExtractor()
+    extractor.feed(html)
+    return Article(extractor.texts, extractor.img_count)
+
+
+def default_backend() -> str:
+    """安装了 lxml 时返回 "lxml"，否则返回 "html.parser"。"""
+    try:
+        import lxml.etree  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
@@ -0,0 +1,18 @@
+"""语料 id - 由内容计算，同样的输入每次运行都得到同样的 id，不同次运行的输出可以直接比较。
+"""
+
+import hashlib
+
+
+def content_id(*parts: str) -> str:
+    """由 parts（例如来源与正文）计算 id：md5 的 32 位十六进制，与 uuid.uuid4().hex 的长度相同。
+
+    各部分之间有分隔符，("ab", "c") 与 ("a", "bc") 的 id 不同。
+    完全相同的语料得到同样的 id。
+    """
+    md5 = hashlib.md5()
+    for idx, part in enumerate(parts):
+        if idx:
+            md5.update(b"\x00")
+        md5.update(part.encode("utf-8", errors="surrogatepass"))
+    return md5.hexdigest()
@@ -0,0 +1,158 @@
+"""输出文件的记录索引 - 用于随机读取某一条记录。
+
+每个输出文件 "000.jsonl.gz" 旁边有一个索引文件 "000.jsonl.gz.idx"，格式（小端）：
+
+    文件头：magic(8 字节) version(u16) flags(u16) count(u64)
+    记录：count 个固定 32 字节的条目
+        block_offset(u64) in_block_offset(u32) length(u32) crc32(u32) key_offset(u64) key_length(u32)
+    键：所有记录的键（utf-8）依次拼接
+
+未压缩文件：block_offset 为记录在文件中的字节位置，in_block_offset 为 0。
+gzip 文件：文件由多个 gzip 块（member）组成，block_offset 为块在文件中的位置，
+in_block_offset 为记录在解压后的块中的位置。
+length 与 crc32 均不包括行尾的换行符。
+"""
+
+import gzip
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Union
+
+INDEX_MAGIC = b"MNBVCIDX"
+INDEX_VERSION = 1
+INDEX_FLAG_GZIP = 1
+INDEX_SUFFIX = ".idx"
+
+_header = struct.Struct("<8sHHQ")
+_entry = struct.Struct("<QIIIQI")
+
+
+class IndexEntry(NamedTuple):
+    block_offset: int
+    in_block_offset: int
+    length: int
+    crc32: int
+    key: str
+
+
+def index_path_for(shard_path: Union[Path, str]) -> Path:
+    shard_path = Path(shard_path)
+    return shard_path.with_name(shard_path.name + INDEX_SUFFIX)
+
+
+class ShardIndexWriter:
+    """在写入输出文件时累积索引条目，文件写完后一次性保存。"""
+
+    def __init__(self, compressed: bool = False):
+        self.flags = INDEX_FLAG_GZIP if compressed else 0
+        self.count = 0
+        self.entries = bytearray()
+        self.keys = bytearray()
+
+    def add(self, block_offset: int, in_block_offset: int, data: bytes, key: str = ""):
+        """添加一条记录，data 为不包括换行符的记录内容。"""
+        key_bytes = key.encode()
+        self.entries += _entry.pack(
+            block_offset, in_block_offset, len(data), zlib.crc32(data),
+            len(self.keys), len(key_bytes)
+        )
+        self.keys += key_bytes
+        self.count += 1
+
+    @classmethod
+    def load(cls, path: Union[Path, str]) -> "ShardIndexWriter":
+        """读取已有的索引文件，用于继续写入同一个输出文件。"""
+        with open(path, "rb") as fp:
+            data = fp.read()
+        magic, version, flags, count = _header.unpack_from(data, 0)
+        if (magic != INDEX_MAGIC) or (version != INDEX_VERSION):
+            raise Exception(f"Invalid index file: {path}")
+        writer = cls(compressed=bool(flags & INDEX_FLAG_GZIP))
+        entries_end = _header.size + count * _entry.size
+        writer.count = count
+        writer.entries = bytearray(data[_header.size: entries_end])
+        writer.keys = bytearray(data[entries_end:])
+        return writer
+
+    def save(self, path: Union[Path, str]):
+        with open(path, "wb") as fp:
+            fp.write(_header.pack(INDEX_MAGIC, INDEX_VERSION, self.flags, self.count))
+            fp.write(self.entries)
+            fp.write(self.keys)
+
+
+class ShardIndex:
+    """读取索引文件，按记录编号或键随机读取输出文件中的记录。
+
+    用法：
+        index = ShardIndex("output/000.jsonl.gz")
+        record = index.read_record(12345)
+    """
+
+    def __init__(self, shard_path: Union[Path, str], index_path: Optional[Union[Path, str]] = None):
+        self.shard_path = Path(shard_path)
+        self.index_path = Path(index_path) if index_path else index_path_for(shard_path)
+        self.fp = open(self.index_path, "rb")
+        magic, version, self.flags, self.count = _header.unpack(self.fp.read(_header.size))
+        if magic != INDEX_MAGIC:
+            raise Exception(f"Not an index file: {self.index_path}")
+        if version != INDEX_VERSION:
+            raise Exception(f"Unsupported index version {version}: {self.index_path}")
+        self.keys_offset = _header.size + self.count * _entry.size
+        self._key_to_idx: Optional[Dict[str, int]] = None
+
+    @property
+    def compressed(self) -> bool:
+        return bool(self.flags & INDEX_FLAG_GZIP)
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, idx: int) -> IndexEntry:
+        if not (0 <= idx < self.count):
+            raise IndexError(f"Record {idx} out of range [0, {self.count})")
+        self.fp.seek(_header.size + idx * _entry.size)
+        block_offset, in_block_offset, length, crc, key_offset, key_length = _entry.unpack(
+            self.fp.read(_entry.size))
+        self.fp.seek(self.keys_offset + key_offset)
+        key = self.fp.read(key_length).decode()
+        return IndexEntry(block_offset, in_block_offset, length, crc, key)
+
+    def find(self, key: str) -> int:
+        """根据键（默认为文件名）找到记录编号，找不到返回 -1。第一次调用时会读取所有键。"""
+        if self._key_to_idx is None:
+            self.fp.seek(_header.size)
+            entries = self.fp.read(self.count * _entry.size)
+            keys = self.fp.read()
+            self._key_to_idx = {}
+            for idx in range(self.count):
+                *_, key_offset, key_length = _entry.unpack_from(entries, idx * _entry.size)
+                k = keys[key_offset: key_offset + key_length].decode()
+                self._key_to_idx.setdefault(k, idx)
+        return self._key_to_idx.get(key, -1)
+
+    def read_record(self, idx: int, verify: bool = True) -> bytes:
+        """读取第 idx 条记录（不包括换行符）。verify 为 True 时检查 crc32。"""
+        entry = self.entry(idx)
+        with open(self.shard_path, "rb") as fp:
+            fp.seek(entry.block_offset)
+            if self.compressed:
+                with gzip.GzipFile(fileobj=fp, mode="rb") as gz:
+                    gz.read(entry.in_block_offset)
+                    data = gz.read(entry.length)
+            else:
+                fp.seek(entry.in_block_offset, 1)
+                data = fp.read(entry.length)
+        if verify and zlib.crc32(data) != entry.crc32:
+            raise Exception(f"Checksum mismatch for record {idx} in {self.shard_path}")
+        return data
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,182 @@
+"""流式读取 JSON 数组 - 用于整个文件是一个很大的 JSON 数组的数据。
+
+json.load 需要读完并解析整个文件后才能开始转换，而且占用的内存是文件大小的数倍。
+iter_json_array 每次读取一块数据，解析出数组中完整的元素后立即返回，内存占用与单个元素的大小相当。
+"""
+
+import codecs
+import json
+import mmap
+import os
+import re
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from mnbvc.utils import profiling
+from mnbvc.utils.runner import bounded_imap
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+# 数字可能包含的字符：数字在缓冲区末尾被截断时（例如 "12" | ".5"），raw_decode 只解析出前一部分
+_number_chars = re.compile(r"[0-9eE.+\-]*")
+
+
+def _iter_text_chunks(
+    source: Union[Path, str, IO[str]],
+    chunk_size: int,
+    encoding: str,
+    use_mmap: bool,
+) -> Iterator[str]:
+    """按块读取文本。source 可以是文件路径或者已经打开的文本文件。"""
+    if not isinstance(source, (Path, str)):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    if not use_mmap:
+        with open(source, "r", encoding=encoding) as fp:
+            yield from _iter_text_chunks(fp, chunk_size, encoding, use_mmap)
+        return
+
+    with open(source, "rb") as fp:
+        size = fp.seek(0, 2)
+        if size == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            for offset in range(0, size, chunk_size):
+                yield decoder.decode(buffer[offset: offset + chunk_size])
+            yield decoder.decode(b"", final=True)
+
+
+def iter_json_array(
+    source: Union[Path, str, IO[str]],
+    chunk_size: int = 1 << 20,
+    encoding: str = "utf-8",
+    use_mmap: bool = False,
+) -> Iterator[Any]:
+    """逐个返回顶层 JSON 数组中的元素。
+
+    source 为文件路径时，use_mmap 为 True 则通过内存映射读取文件。
+    """
+    chunks = _iter_text_chunks(source, chunk_size, encoding, use_mmap)
+    buf = ""
+    pos = 0
+    eof = False
+    # 接下来期望的内容： "[" -> "first"（元素或 "]"） -> "next"（"," 或 "]"） -> "value"（元素） -> ...
+    expect = "["
+
+    def read_more(min_size: int):
+        """至少再读取 min_size 个字符，避免很大的元素被反复解析。"""
+        nonlocal buf, pos, eof
+        parts = [buf[pos:]]
+        read = 0
+        while read < min_size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            parts.append(chunk)
+            read += len(chunk)
+        buf = "".join(parts)
+        pos = 0
+
+    while True:
+        pos = _whitespace.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                if expect == "done":
+                    return
+                raise ValueError("Unexpected end of JSON array")
+            read_more(1)
+            continue
+
+        char = buf[pos]
+        if expect == "done":
+            raise ValueError(f"Unexpected data after JSON array: {buf[pos: pos + 20]!r}")
+        if expect == "[":
+            if char != "[":
+                raise ValueError(f"Expected a JSON array, got {buf[pos: pos + 20]!r}")
+            pos += 1
+            expect = "first"
+            continue
+        if (expect in ("first", "next")) and (char == "]"):
+            pos += 1
+            expect = "done"
+            continue
+        if expect == "next":
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']', got {buf[pos: pos + 20]!r}")
+            pos += 1
+            expect = "value"
+            continue
+
+        # 解析一个元素：元素可能还没有读完（数字在末尾时也可能没有读完）
+        try:
+            with profiling.stage("parse_json"):
+                item, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more(max(chunk_size, len(buf) - pos))
+            continue
+        if (end >= len(buf)) and (not eof):
+            read_more(max(chunk_size, len(buf) - pos))
+            continue
+        if _is_number(item) and (not eof) and (_number_chars.match(buf, end).end() >= len(buf)):
+            # 数字后面到缓冲区末尾都可能是这个数字的一部分，读取更多后重新解析
+            read_more(max(chunk_size, len(buf) - pos))
+            continue
+        pos = end
+        expect = "next"
+        yield item
+
+
+def _is_number(item: Any) -> bool:
+    return isinstance(item, (int, float)) and (not isinstance(item, bool))
+
+
+def _batched(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _MapBatch:
+    def __init__(self, func: Callable[[Any], Any]):
+        self.func = func
+
+    def __call__(self, batch: List[Any]) -> List[Any]:
+        return [self.func(item) for item in batch]
+
+
+def imap_json_array(
+    source: Union[Path, str],
+    func: Callable[[Any], Any],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    batch_size: int = 256,
+    limit: Optional[int] = None,
+    **kwargs
+) -> Iterator[Any]:
+    """一边读取 JSON 数组，一边在 workers 个进程中对元素调用 func，返回 func 的结果。
+
+    元素每 batch_size 个一批发送给进程池，同时最多有 2 * workers 批在处理中，
+    因此内存占用不会随文件大小增长。limit 为处理的元素数量，kwargs 传给 iter_json_array。
+    func 需要可以 pickle（模块级函数或 functools.partial）。
+    """
+    workers = workers or os.cpu_count() or 1
+    with Pool(workers) as pool:
+        window = 2 * workers
+        batches = _batched(islice(iter_json_array(source, **kwargs), limit), batch_size)
+        for results in bounded_imap(pool, _MapBatch(func), batches, window=window, ordered=ordered):
+            yield from results
@@ -0,0 +1,92 @@
+"""读取 jsonl - 按与换行对齐的字节范围并行读取。
+
+一个很大的 jsonl 文件可以按字节范围拆分（见 mnbvc.utils.scheduler.split_byte_ranges），
+每个范围处理起始位置在范围内的行，因此范围不需要与换行对齐，各个进程可以独立处理自己的范围。
+.gz 文件无法按字节拆分，整个文件作为一个任务顺序解压。
+"""
+
+import gzip
+import json
+import mmap
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+from mnbvc.utils import profiling
+from mnbvc.utils.scheduler import WorkItem
+
+
+def iter_jsonl_range(
+    path: Union[Path, str],
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[Any]:
+    """通过内存映射读取 jsonl 文件中起始位置在 [start, end) 的行，跳过空行。"""
+    with open(path, "rb") as fp:
+        size = fp.seek(0, 2)
+        if size == 0:
+            return
+        end = size if end is None else min(end, size)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            pos = start
+            if start > 0:
+                # 从 start 所在行的下一行开始：start 所在的行属于上一个范围
+                newline = buffer.find(b"\n", start - 1)
+                if newline == -1:
+                    return
+                pos = newline + 1
+            while pos < end:
+                newline = buffer.find(b"\n", pos)
+                if newline == -1:
+                    newline = size
+                line = buffer[pos: newline]
+                pos = newline + 1
+                if line.strip():
+                    with profiling.stage("parse_json"):
+                        data = json.loads(line)
+                    yield data
+
+
+def iter_jsonl(path: Union[Path, str]) -> Iterator[Any]:
+    """顺序读取整个 jsonl 或 jsonl.gz 文件，跳过空行。"""
+    if str(path).endswith(".gz"):
+        with gzip.open(path, "rb") as fp:
+            for line in fp:
+                if line.strip():
+                    with profiling.stage("parse_json"):
+                        data = json.loads(line)
+                    yield data
+        return
+    yield from iter_jsonl_range(path)
+
+
+def iter_work_item_lines(item: Union[WorkItem, Path, str]) -> Iterator[Any]:
+    """读取一个任务（见 mnbvc.utils.scheduler）中的所有行：整个文件或者一个字节范围。"""
+    if not isinstance(item, WorkItem):
+        yield from iter_jsonl(item)
+        return
+    if item.unit == "bytes":
+        yield from iter_jsonl_range(item.path, item.start, item.end)
+        return
+    if item.unit != "file":
+        raise Exception(f"Cannot read {item} as jsonl")
+    for path in item.paths:
+        yield from iter_jsonl(path)
+
+
+class JsonlRecordConverter:
+    """把按行转换的函数包装成按任务转换的函数，用于 run_conversion。
+
+    record_converter(data) 返回一条语料，返回 None 表示跳过此行。
+
+    用法：
+        run_conversion(schedule(jsonl_paths), JsonlRecordConverter(convert_record), ...)
+    """
+
+    def __init__(self, record_converter: Callable[[Dict[str, Any]], Any]):
+        self.record_converter = record_converter
+
+    def __call__(self, item: Union[WorkItem, Path, str]) -> Iterator[Any]:
+        for data in iter_work_item_lines(item):
+            result = self.record_converter(data)
+            if result is not None:
+                yield result
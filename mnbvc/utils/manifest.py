@@ -0,0 +1,346 @@
+"""运行记录 - 记录每个输入文件写入了哪些输出文件，用于中断后继续运行以及增量转换。
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from mnbvc.utils.index import ShardIndex, ShardIndexWriter, index_path_for
+
+logger = logging.getLogger(__name__)
+
+# 重写压缩的输出文件时，每个 gzip 块（member）解压后的大小，与 SizeLimitedFileWriter 的默认值相同
+COMPACT_BLOCK_SIZE = 1 << 20
+
+
+def input_files(input_path) -> List[str]:
+    """一个输入包含的文件：WorkItem 的 paths，或者输入本身。"""
+    paths = getattr(input_path, "paths", None)
+    if paths is None:
+        paths = [input_path]
+    return [str(path) for path in paths]
+
+
+def file_md5(path: Union[Path, str], chunk_size: int = 1 << 20) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def compact_shard(path: Path, ranges: List[Tuple[int, int]], compresslevel: int = 9) -> Optional[dict]:
+    """删除输出文件中行号在 ranges（左闭右开）中的记录，同时更新索引文件（如果有）。
+
+    compresslevel 为重写压缩的输出文件时的 gzip 压缩等级，应与写入时（SizeLimitedFileWriter）相同。
+    返回新的文件信息（同 manifest 中的 shards），所有记录都被删除时删除文件并返回 None。
+    """
+    index_path = index_path_for(path)
+    compressed = path.suffix == ".gz"
+    drop = set()
+    for start, end in ranges:
+        drop.update(range(start, end))
+    old_index = ShardIndex(path) if index_path.exists() else None
+    index_writer = ShardIndexWriter(compressed=compressed) if old_index is not None else None
+    tmp_path = path.with_name(path.name + ".tmp")
+    records = 0
+    raw_size = 0
+    block_offset = 0
+    block_size = 0
+    opener = gzip.open if compressed else open
+    block_kwargs = dict(filename=path.name, mode="wb", compresslevel=compresslevel)
+    with opener(path, "rb") as src, open(tmp_path, "wb") as raw:
+        dst = gzip.GzipFile(fileobj=raw, **block_kwargs) if compressed else raw
+        for lineno, line in enumerate(src):
+            if lineno in drop:
+                continue
+            if compressed and block_size >= COMPACT_BLOCK_SIZE:
+                dst.close()
+                block_offset = raw.tell()
+                block_size = 0
+                dst = gzip.GzipFile(fileobj=raw, **block_kwargs)
+            if index_writer is not None:
+                key = old_index.entry(lineno).key
+                if compressed:
+                    index_writer.add(block_offset, block_size, line.rstrip(b"\n"), key)
+                else:
+                    index_writer.add(raw_size, 0, line.rstrip(b"\n"), key)
+            dst.write(line)
+            raw_size += len(line)
+            block_size += len(line)
+            records += 1
+        if compressed:
+            dst.close()
+    if old_index is not None:
+        old_index.close()
+
+    if records == 0:
+        tmp_path.unlink()
+        path.unlink()
+        index_path.unlink(missing_ok=True)
+        return None
+    if index_writer is not None:
+        index_writer.save(index_path.with_name(index_path.name + ".tmp"))
+        os.replace(index_path.with_name(index_path.name + ".tmp"), index_path)
+    os.replace(tmp_path, path)
+    return {"path": path.name, "records": records, "size": path.stat().st_size, "raw_size": raw_size}
+
+
+def file_fingerprint(path: Union[Path, str]) -> Optional[dict]:
+    """文件的指纹：{"size", "mtime_ns"}，不是文件时返回 None。
+
+    md5 由 RunManifest.fingerprint 在 hash_inputs 为 True 时另外计算（并缓存）。
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class RunManifest:
+    """记录一次转换的输出文件以及每个输入文件对应的记录范围。
+
+    格式：
+    {
+        "shards": [{"path": "000.jsonl", "records": 100, "size": 1024, ...}, ...],
+        "inputs": {
+            "input.jsonl": [{"shard": "000.jsonl", "start": 0, "end": 100}, ...],
+        },
+        "fingerprints": {
+            "input.jsonl": {"input.jsonl": {"size": 4096, "mtime_ns": ...}},
+        },
+        "partial": {
+            "big.jsonl": [{"shard": "000.jsonl", "start": 100, "end": 250}],
+        },
+        "records": 100,
+        "size": 1024
+    }
+
+    其中 start/end 为记录在输出文件中的行号范围（左闭右开），
+    fingerprints 为每个输入开始转换时其中文件的指纹（见 file_fingerprint）。
+    只有当输入文件的所有记录都已经写入完整的输出文件后，才会记录到 inputs 中，
+    所以 resume 时可以直接跳过 is_done 的输入文件。
+    partial 为还没有完成的输入已经写入完整输出文件的记录范围（输出文件写完时正在写入的输入），
+    中断或者出错后，refresh 会先从输出文件中删除这些记录，重新转换时不会重复写入。
+
+    用法：
+        manifest = RunManifest(output_folder / "manifest.json", resume=True)
+        writer = SizeLimitedFileWriter(output_folder, manifest=manifest)
+        for path in paths:
+            if manifest.is_done(path):
+                continue
+            writer.begin_input(path)
+            ...
+            writer.end_input()
+        writer.close()
+
+    增量转换：在跳过已经完成的输入之前调用 refresh(inputs)，
+    改变了的输入（大小、修改时间，hash_inputs 为 True 时比较内容）及其输出会被删除并重新转换，
+    没有改变的输入与输出文件保持不变。
+    """
+
+    def __init__(self, path: Union[Path, str], resume: bool = False, hash_inputs: bool = False):
+        self.path = Path(path)
+        self.hash_inputs = hash_inputs
+        self.shards: Dict[str, dict] = {}
+        self.inputs: Dict[str, List[dict]] = {}
+        # 输入 -> {文件: 指纹}
+        self.fingerprints: Dict[str, Dict[str, dict]] = {}
+        # 没有完成的输入 -> 已经写入完整输出文件的记录范围
+        self.partial: Dict[str, List[dict]] = {}
+        # 同一个文件拆分成多个任务时只计算一次 md5：(文件，大小，修改时间) -> md5
+        self._md5_cache: Dict[tuple, str] = {}
+        if resume and self.path.exists():
+            self.update(self.load(self.path))
+
+    @staticmethod
+    def load(path: Union[Path, str]) -> dict:
+        with open(path, "r") as fp:
+            return json.load(fp)
+
+    @staticmethod
+    def input_key(input_path) -> str:
+        return str(input_path)
+
+    def update(self, data: dict):
+        """合并另一个 manifest 的内容。"""
+        for shard in data.get("shards", []):
+            self.shards[shard["path"]] = shard
+        self.inputs.update(data.get("inputs", {}))
+        self.fingerprints.update(data.get("fingerprints", {}))
+        self.partial.update(data.get("partial", {}))
+        for key in self.inputs:
+            self.partial.pop(key, None)
+
+    def is_done(self, input_path) -> bool:
+        return self.input_key(input_path) in self.inputs
+
+    def add_shard(self, shard: dict):
+        self.shards[shard["path"]] = shard
+
+    def add_input(self, input_path, segments: List[dict], fingerprint: Optional[Dict[str, dict]] = None):
+        """记录一个已经完成的输入。fingerprint 为开始转换时的指纹，None 表示现在计算。"""
+        key = self.input_key(input_path)
+        self.inputs[key] = segments
+        self.partial.pop(key, None)
+        if fingerprint is None:
+            fingerprint = self.fingerprint(input_path)
+        if fingerprint:
+            self.fingerprints[key] = fingerprint
+
+    def set_partial(self, input_path, segments: List[dict]):
+        """记录一个还没有完成的输入已经写入完整输出文件的记录范围。"""
+        if segments:
+            self.partial[self.input_key(input_path)] = segments
+
+    def fingerprint(self, input_path) -> Dict[str, dict]:
+        """输入中每个文件的指纹，不是文件的输入（例如 URL）返回空字典。"""
+        fingerprints = {}
+        for path in input_files(input_path):
+            fingerprint = file_fingerprint(path)
+            if fingerprint is None:
+                continue
+            if self.hash_inputs:
+                cache_key = (path, fingerprint["size"], fingerprint["mtime_ns"])
+                if cache_key not in self._md5_cache:
+                    self._md5_cache[cache_key] = file_md5(path)
+                fingerprint["md5"] = self._md5_cache[cache_key]
+            fingerprints[path] = fingerprint
+        return fingerprints
+
+    def is_unchanged(self, key: str) -> bool:
+        """输入中的文件与记录的指纹相同。没有指纹（旧的 manifest）时认为没有改变。
+
+        记录中有 md5 时，只有大小相同而修改时间不同才计算 md5 比较。
+        """
+        for path, expected in self.fingerprints.get(key, {}).items():
+            current = file_fingerprint(path)
+            if (current is None) or (current["size"] != expected["size"]):
+                return False
+            if current["mtime_ns"] == expected["mtime_ns"]:
+                continue
+            if ("md5" not in expected) or (file_md5(path) != expected["md5"]):
+                return False
+        return True
+
+    def refresh(self, inputs: Optional[Iterable] = None, compresslevel: int = 9) -> List[str]:
+        """删除已经失效的输入的记录，返回需要重新转换的输入（的键）。
+
+        失效的输入：其中的文件改变或者被删除；或者不在这次的 inputs 中，但包含 inputs 中的文件
+        （例如文件增加后 schedule 重新分组、重新拆分）；或者写入的输出文件已经不存在。
+        失效输入的记录从输出文件中删除（见 compact_shard），同一个输出文件中其他输入的记录保持不变，
+        只是行号相应减小；输出文件中只有失效的记录时删除整个文件。
+        没有完成的输入（partial）已经写入的记录也同样删除，但不计入返回值。
+        compresslevel 为重写压缩的输出文件时的压缩等级（见 compact_shard）。
+        """
+        folder = self.path.parent
+        # 已经不存在的输出文件：其中的输入需要重新转换
+        missing = {
+            segment["shard"]
+            for segments in self.inputs.values() for segment in segments
+            if not (folder / segment["shard"]).exists()
+        }
+        missing.update(name for name in self.shards if not (folder / name).exists())
+        stale = {
+            key for key, segments in self.inputs.items()
+            if any(segment["shard"] in missing for segment in segments) or (not self.is_unchanged(key))
+        }
+        if inputs is not None:
+            inputs = list(inputs)
+            current = {self.input_key(item) for item in inputs}
+            files = {path for item in inputs for path in input_files(item)}
+            for key in self.inputs:
+                if key in current:
+                    continue
+                if files.intersection(self.fingerprints.get(key, {})):
+                    stale.add(key)
+        if (not stale) and (not self.partial) and (not missing):
+            return []
+        for name in missing:
+            self.shards.pop(name, None)
+
+        # 输出文件 -> 需要删除的行号范围
+        dropped: Dict[str, List[Tuple[int, int]]] = {}
+        for key in stale:
+            for segment in self.inputs.pop(key, []):
+                dropped.setdefault(segment["shard"], []).append((segment["start"], segment["end"]))
+            self.fingerprints.pop(key, None)
+        partial = len(self.partial)
+        for segments in self.partial.values():
+            for segment in segments:
+                dropped.setdefault(segment["shard"], []).append((segment["start"], segment["end"]))
+        self.partial = {}
+
+        removed = 0
+        for name, ranges in dropped.items():
+            if name in missing:
+                continue
+            shard = compact_shard(folder / name, ranges, compresslevel=compresslevel)
+            if shard is None:
+                self.shards.pop(name, None)
+                removed += 1
+            else:
+                self.shards[name] = shard
+            self._shift_segments(name, ranges)
+        if missing:
+            logger.warning(f"{len(missing)} shards missing in {folder}: {sorted(missing)}")
+        logger.info(
+            f"{len(stale)} inputs changed and {partial} inputs unfinished, removed their records "
+            f"from {len(dropped)} shards ({removed} deleted) in {folder}")
+        self.save()
+        return sorted(stale)
+
+    def clear(self):
+        """删除 manifest 中记录的输出文件与索引，清空记录并删除 manifest 文件。
+
+        不继续上一次运行时使用：文件数量比上一次少时，上一次多出的输出文件不会留在输出文件夹中。
+        """
+        folder = self.path.parent
+        for name in self.shards:
+            for path in (folder / name, index_path_for(folder / name)):
+                path.unlink(missing_ok=True)
+                path.with_name(path.name + ".tmp").unlink(missing_ok=True)
+        if self.shards:
+            logger.info(f"Removed {len(self.shards)} shards of the previous run in {folder}")
+        self.shards = {}
+        self.inputs = {}
+        self.fingerprints = {}
+        self.partial = {}
+        self.path.unlink(missing_ok=True)
+
+    def _shift_segments(self, shard: str, ranges: List[Tuple[int, int]]):
+        """删除 shard 中 ranges 的记录后，更新其他输入在 shard 中的行号。"""
+        for segments in self.inputs.values():
+            for segment in segments:
+                if segment["shard"] != shard:
+                    continue
+                offset = sum(end - start for start, end in ranges if end <= segment["start"])
+                segment["start"] -= offset
+                segment["end"] -= offset
+
+    def to_dict(self) -> dict:
+        shards = sorted(self.shards.values(), key=lambda shard: shard["path"])
+        return {
+            "shards": shards,
+            "inputs": self.inputs,
+            "fingerprints": self.fingerprints,
+            "partial": self.partial,
+            "records": sum(shard["records"] for shard in shards),
+            "size": sum(shard["size"] for shard in shards),
+        }
+
+    def save(self):
+        """先写入临时文件再重命名，保证 manifest 本身不会写坏。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(self.to_dict(), fp, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
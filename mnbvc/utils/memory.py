@@ -0,0 +1,212 @@
+"""内存预算 - 按字节限制队列，监控进程的常驻内存（RSS），内存紧张时减小批大小。
+
+总预算（所有进程合计）来自环境变量 MNBVC_MEMORY_LIMIT_MB（命令行的 --memory-limit 会设置它），
+没有设置时为创建 MemoryBudget 时可用内存的 DEFAULT_FRACTION；都无法得到时不限制。
+每个 worker 的预算为 总预算 / 进程数。
+预算通过减小批大小、限制队列与暂存结果的字节数起作用；转换函数本身占用的内存只能检查并记录警告。
+
+用法：
+    budget = MemoryBudget(workers=4)
+    batch_size = AdaptiveBatchSize(65536, budget=budget)
+    rows = iter_parquet_rows(path, batch_size=batch_size)  # 每个 row group 读取前重新计算批大小
+
+    queue = ByteBoundedQueue(256 << 20)  # 队列中最多 256 MB 的数据
+    with RecordBatchSender(queue) as sender: ...
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import sys
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "MNBVC_MEMORY_LIMIT_MB"
+
+# 没有设置预算时，使用可用内存的比例
+DEFAULT_FRACTION = 0.8
+
+# RSS 超过预算的 HIGH_WATERMARK 时减小批大小，低于 LOW_WATERMARK 时逐步恢复
+HIGH_WATERMARK = 0.8
+LOW_WATERMARK = 0.5
+
+# 一批数据（按 parquet 中未压缩的大小计算）最多占 worker 预算的比例。
+# 转换成 Python 对象后通常会大好几倍，因此这里留出余量。
+BATCH_FRACTION = 1 / 16
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存（字节）。
+
+    Linux 读取 /proc/self/statm；其他系统使用 resource 中的峰值，无法得到时返回 0。
+    """
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位是字节，Linux 是 KB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def available_memory() -> Optional[int]:
+    """系统当前可用的内存（字节），无法得到时返回 None。"""
+    try:
+        with open("/proc/meminfo", "r") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * _PAGE_SIZE
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_limit() -> Optional[int]:
+    """总预算（字节）：环境变量 MNBVC_MEMORY_LIMIT_MB，或者可用内存的 DEFAULT_FRACTION。"""
+    value = os.environ.get(ENV_VAR)
+    if value:
+        return int(float(value) * 1024 * 1024)
+    available = available_memory()
+    if available is None:
+        return None
+    return int(available * DEFAULT_FRACTION)
+
+
+class MemoryBudget:
+    """workers 个进程共享的内存预算。只包含数字，可以传给子进程，每个进程检查自己的 RSS。
+
+    limit 为总预算（字节），None 表示使用 default_limit()；default_limit() 也为 None 时不限制。
+    """
+
+    def __init__(self, limit: Optional[int] = None, workers: int = 1):
+        if limit is None:
+            limit = default_limit()
+        self.limit = limit
+        self.workers = max(workers, 1)
+
+    @property
+    def per_worker(self) -> Optional[int]:
+        if self.limit is None:
+            return None
+        return self.limit // self.workers
+
+    def usage(self) -> float:
+        """当前进程的 RSS 占每个 worker 预算的比例，不限制时为 0。"""
+        if not self.per_worker:
+            return 0.0
+        return rss_bytes() / self.per_worker
+
+    def is_near(self, threshold: float = HIGH_WATERMARK) -> bool:
+        return self.usage() >= threshold
+
+    def check(self, name: str = "") -> bool:
+        """在任务之间调用：超过预算时先回收垃圾，仍然超过则记录警告。返回是否超过预算。
+
+        只是检查：减少内存需要调用方减小批大小或暂存的数据（见 AdaptiveBatchSize、is_near）。
+        """
+        if self.usage() < 1:
+            return False
+        gc.collect()
+        usage = self.usage()
+        if usage < 1:
+            return False
+        logger.warning(
+            f"Memory of {name or os.getpid()} is {rss_bytes() >> 20} MB, "
+            f"{usage:.0%} of the budget {self.per_worker >> 20} MB")
+        return True
+
+    def __repr__(self) -> str:
+        limit = "unlimited" if self.limit is None else f"{self.limit >> 20} MB"
+        return f"MemoryBudget({limit}, workers={self.workers})"
+
+
+class AdaptiveBatchSize:
+    """根据内存预算调整的批大小（行数），在每批（或每个 row group）读取前调用。
+
+    内存宽裕时为 maximum；RSS 超过预算的 HIGH_WATERMARK 时减半（不小于 minimum），
+    低于 LOW_WATERMARK 时加倍，逐步恢复到 maximum。
+    知道每行的大小时（例如 parquet 元数据中的未压缩大小），一批最多占用 worker 预算的 BATCH_FRACTION。
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1024, budget: Optional[MemoryBudget] = None):
+        self.maximum = max(maximum, 1)
+        self.minimum = min(max(minimum, 1), self.maximum)
+        self.budget = budget if budget is not None else MemoryBudget()
+        self.value = self.maximum
+
+    def __call__(self, row_bytes: Optional[float] = None) -> int:
+        usage = self.budget.usage()
+        if usage >= HIGH_WATERMARK:
+            self.value = max(self.value // 2, self.minimum)
+        elif usage < LOW_WATERMARK:
+            self.value = min(self.value * 2, self.maximum)
+        value = self.value
+        per_worker = self.budget.per_worker
+        if per_worker and row_bytes:
+            value = min(value, max(int(per_worker * BATCH_FRACTION / row_bytes), self.minimum))
+        return value
+
+    def __repr__(self) -> str:
+        return f"AdaptiveBatchSize({self.minimum}-{self.maximum}, {self.budget})"
+
+
+def _size_of(data: Any) -> int:
+    if isinstance(data, (bytes, bytearray, memoryview, str)):
+        return len(data)
+    return 0
+
+
+class ByteBoundedQueue:
+    """按字节数而不是条数限制的进程间队列。
+
+    队列中的数据超过 max_bytes 时 put 会阻塞，写入跟不上时生产者会等待，而不是在内存中堆积数据。
+    数据的大小为 len(data)（bytes、RecordBatch），其他对象（例如结束标记 None）计为 0 字节，
+    也可以通过 put(data, size) 指定。单条数据超过 max_bytes 时等到队列为空才放入，不会永久阻塞。
+
+    与 multiprocessing.Queue 一样需要在创建子进程之前创建，并作为参数传给子进程。
+    """
+
+    def __init__(self, max_bytes: int, ctx=None):
+        if max_bytes <= 0:
+            raise Exception(f"Max bytes must be positive, got {max_bytes}")
+        ctx = ctx or multiprocessing.get_context()
+        self.max_bytes = max_bytes
+        self.queue = ctx.Queue()
+        self._bytes = ctx.Value("q", 0, lock=False)
+        self._cond = ctx.Condition()
+
+    def put(self, data: Any, size: Optional[int] = None):
+        if size is None:
+            size = _size_of(data)
+        with self._cond:
+            # 0 字节的数据（例如结束标记）不会被队列中的数据阻塞
+            while size > 0 and self._bytes.value > 0 and self._bytes.value + size > self.max_bytes:
+                self._cond.wait()
+            self._bytes.value += size
+        self.queue.put((size, data))
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        size, data = self.queue.get(block, timeout)
+        with self._cond:
+            self._bytes.value -= size
+            self._cond.notify_all()
+        return data
+
+    def bytes(self) -> int:
+        """已经放入但还没有取出的字节数。"""
+        return self._bytes.value
@@ -0,0 +1,126 @@
+"""读取 parquet - 按 row group 读取需要的列，不经过 pandas。
+"""
+
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import pyarrow.parquet as pq
+
+from mnbvc.utils import profiling
+from mnbvc.utils.scheduler import WorkItem
+
+
+# 批大小：固定的行数，或者根据每行的字节数返回行数的函数（例如 mnbvc.utils.memory.AdaptiveBatchSize）
+BatchSize = Union[int, Callable[[Optional[float]], int]]
+
+
+def iter_parquet_rows(
+    path: Union[Path, str],
+    columns: Optional[List[str]] = None,
+    row_groups: Optional[Iterable[int]] = None,
+    batch_size: BatchSize = 65536,
+) -> Iterator[Dict[str, Any]]:
+    """逐行读取 parquet 文件，每行为 {列名: Python 值}。
+
+    只读取 columns 中的列（None 表示所有列），只读取 row_groups 中的 row group（None 表示全部）。
+    数据按列转换成 Python 值，不会为每一行构造 pandas.Series；
+    同一时间内存中只有 batch_size 行左右的数据。
+    batch_size 为函数时，每个 row group 读取前用元数据中每行的（未压缩）字节数重新计算批大小。
+    """
+    parquet_file = pq.ParquetFile(path)
+    if row_groups is None:
+        row_groups = range(parquet_file.num_row_groups)
+    row_groups = list(row_groups)
+    if not row_groups:
+        return
+    if not callable(batch_size):
+        batches = parquet_file.iter_batches(
+            batch_size=batch_size, row_groups=row_groups, columns=columns
+        )
+        yield from _iter_batch_rows(batches)
+        return
+    for row_group in row_groups:
+        size = batch_size(_row_bytes(parquet_file, row_group, columns))
+        batches = parquet_file.iter_batches(
+            batch_size=size, row_groups=[row_group], columns=columns
+        )
+        yield from _iter_batch_rows(batches)
+
+
+def _row_bytes(parquet_file: pq.ParquetFile, row_group: int, columns: Optional[List[str]]) -> float:
+    """row group 中每行需要读取的列未压缩的平均字节数。"""
+    metadata = parquet_file.metadata.row_group(row_group)
+    if columns is None:
+        size = metadata.total_byte_size
+    else:
+        size = sum(
+            metadata.column(idx).total_uncompressed_size
+            for idx in range(metadata.num_columns)
+            if metadata.column(idx).path_in_schema.split(".")[0] in columns
+        )
+    return size / max(metadata.num_rows, 1)
+
+
+def _iter_batch_rows(batches) -> Iterator[Dict[str, Any]]:
+    while True:
+        # 读取与转换成 Python 值的耗时
+        start = time.perf_counter()
+        batch = next(batches, None)
+        if batch is None:
+            break
+        names = batch.schema.names
+        values = [column.to_pylist() for column in batch.columns]
+        profiling.record("read_parquet", time.perf_counter() - start)
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
+def iter_work_item_rows(
+    item: Union[WorkItem, Path, str],
+    columns: Optional[List[str]] = None,
+    batch_size: BatchSize = 65536,
+) -> Iterator[Dict[str, Any]]:
+    """读取一个任务（见 mnbvc.utils.scheduler）中的所有行：整个文件或者若干 row group。"""
+    if not isinstance(item, WorkItem):
+        yield from iter_parquet_rows(item, columns=columns, batch_size=batch_size)
+        return
+    if item.unit == "row_groups":
+        yield from iter_parquet_rows(
+            item.path, columns=columns, row_groups=range(item.start, item.end), batch_size=batch_size)
+        return
+    if item.unit != "file":
+        raise Exception(f"Cannot read {item} as parquet")
+    for path in item.paths:
+        yield from iter_parquet_rows(path, columns=columns, batch_size=batch_size)
+
+
+class ParquetRowConverter:
+    """把按行转换的函数包装成按任务转换的函数，用于 run_conversion。
+
+    row_converter(row) 返回一条语料，返回 None 表示跳过此行。
+
+    用法：
+        run_conversion(
+            schedule(parquet_paths),
+            ParquetRowConverter(convert_row, columns=["id", "text"]),
+            ...
+        )
+    不同的 row group 会分发给不同的进程并行处理，每个进程同时只读取少量 row group。
+    """
+
+    def __init__(
+        self,
+        row_converter: Callable[[Dict[str, Any]], Any],
+        columns: Optional[List[str]] = None,
+        batch_size: BatchSize = 65536,
+    ):
+        self.row_converter = row_converter
+        self.columns = columns
+        self.batch_size = batch_size
+
+    def __call__(self, item: Union[WorkItem, Path, str]) -> Iterator[Any]:
+        for row in iter_work_item_rows(item, columns=self.columns, batch_size=self.batch_size):
+            data = self.row_converter(row)
+            if data is not None:
+                yield data
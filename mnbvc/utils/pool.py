@@ -0,0 +1,217 @@
+"""多进程写入 - 每个进程使用独立的 SizeLimitedFileWriter。
+"""
+
+import logging
+from multiprocessing import Process, Queue
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional
+
+from mnbvc.utils import profiling, progress
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.memory import MemoryBudget
+from mnbvc.utils.writer import SizeLimitedFileWriter
+
+logger = logging.getLogger(__name__)
+
+
+class WriterPool:
+    """为 world_size 个进程分配互不冲突的 SizeLimitedFileWriter。
+
+    第 rank 个进程的 writer 使用 filename_idx_first=first + rank * stride，
+    filename_idx_stride=stride * world_size，因此各进程的文件名不会冲突，
+    也不需要把语料通过 Queue 发送给单独的写入进程。
+    写入统计的名字与 stats_path 同样加上 rank（例如 stats.json -> stats.0.json），各进程不会互相覆盖。
+
+    每个进程将自己写入的文件信息以及每个任务对应的记录范围保存为 manifest 分片，
+    merge_manifests 将其合并成 output_folder 下的 manifest_name。
+    resume 为 True 时，跳过 manifest 中已经完成并且输入没有改变的任务，继续上一次中断的运行，
+    或者在输入增加、改变后只转换新的与改变了的输入（见 RunManifest.refresh）；
+    否则先删除上一次运行的 manifest 中记录的输出文件（见 RunManifest.clear）。
+    hash_inputs 为 True 时记录输入文件的 md5，只改变了修改时间的输入不会重新转换。
+
+    用法：
+        pool = WriterPool(4, output_folder="output", filename_fmt="{}.jsonl.gz")
+        pool.run(convert_file, paths)
+
+    其中 convert_file(writer, path) 需要是模块级函数，以便传给子进程。
+    convert_file 返回 False 表示此任务失败，manifest 不会将其记录为已完成。
+    失败之前已经写入的记录在 resume 时删除（见 RunManifest 的 partial），但这次运行的输出中仍然保留，
+    因此 convert_file 最好在转换成功后再写入（run_conversion 的做法见 runner._InputBuffer）。
+    """
+
+    def __init__(
+        self,
+        world_size: int,
+        manifest_name: str = "manifest.json",
+        resume: bool = False,
+        hash_inputs: bool = False,
+        **writer_kwargs
+    ):
+        if world_size <= 0:
+            raise Exception(f"World size must be positive, got {world_size}")
+        self.world_size = world_size
+        self.manifest_name = manifest_name
+        self.resume = resume
+        self.hash_inputs = hash_inputs
+        self.writer_kwargs = writer_kwargs
+        self.output_folder = Path(writer_kwargs["output_folder"])
+
+    def get_writer_kwargs(self, rank: int) -> dict:
+        """第 rank 个进程的 writer 参数。"""
+        if not (0 <= rank < self.world_size):
+            raise Exception(f"Rank must be in [0, {self.world_size}), got {rank}")
+        kwargs = dict(self.writer_kwargs)
+        first = kwargs.get("filename_idx_first", 0)
+        stride = max(int(kwargs.get("filename_idx_stride", 1)), 1)
+        kwargs["filename_idx_first"] = first + rank * stride
+        kwargs["filename_idx_stride"] = stride * self.world_size
+        kwargs["stats_name"] = f"{kwargs.get('stats_name') or self.output_folder}.{rank}"
+        if kwargs.get("stats_path"):
+            stats_path = Path(kwargs["stats_path"])
+            kwargs["stats_path"] = stats_path.with_name(f"{stats_path.stem}.{rank}{stats_path.suffix}")
+        return kwargs
+
+    def get_writer(self, rank: int) -> SizeLimitedFileWriter:
+        return SizeLimitedFileWriter(manifest=self.get_manifest(rank), **self.get_writer_kwargs(rank))
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_folder / self.manifest_name
+
+    def part_manifest_path(self, rank: int) -> Path:
+        name = Path(self.manifest_name)
+        return self.output_folder / f"{name.stem}.{rank}{name.suffix}"
+
+    def get_manifest(self, rank: int) -> RunManifest:
+        """第 rank 个进程的 manifest 分片，包含之前运行的记录以避免文件名冲突。"""
+        manifest = RunManifest(self.part_manifest_path(rank), hash_inputs=self.hash_inputs)
+        if self.manifest_path.exists():
+            manifest.update(RunManifest.load(self.manifest_path))
+        return manifest
+
+    def merge_manifests(self, include_existing: bool = False) -> RunManifest:
+        """合并所有进程的 manifest 分片，并删除分片文件。
+
+        include_existing 为 True 时，同时合并已有的 manifest（继续运行时使用）。
+        """
+        manifest = RunManifest(self.manifest_path, resume=include_existing)
+        for rank in range(self.world_size):
+            path = self.part_manifest_path(rank)
+            if path.exists():
+                manifest.update(RunManifest.load(path))
+        manifest.save()
+        for rank in range(self.world_size):
+            self.part_manifest_path(rank).unlink(missing_ok=True)
+        return manifest
+
+    def run(
+        self,
+        target: Callable[[SizeLimitedFileWriter, Any], None],
+        tasks: Iterable[Any],
+        counters: Optional[progress.ProgressCounters] = None,
+        memory_budget: Optional[MemoryBudget] = None,
+    ) -> dict:
+        """启动 world_size 个进程执行 target(writer, task)，返回合并后的 manifest。
+
+        任务通过队列按需分发，先完成的进程会继续领取下一个任务。
+        有进程异常退出时终止其他进程，合并已经写完的 manifest 分片后抛出异常，resume 时从中断处继续。
+        counters 不为 None 时（至少 world_size 行），第 rank 个进程把进度计入第 rank 行，
+        target 中可以用 progress.current() 取得当前进程的 reporter。
+        memory_budget 不为 None 时，每个进程在任务之间检查自己的 RSS，超过预算时回收垃圾并记录警告。
+        """
+        if self.resume:
+            # 合并上一次运行留下的分片，删除改变了的任务及其输出，跳过已经完成的任务
+            done = self.merge_manifests(include_existing=True)
+            tasks = list(tasks)
+            done.refresh(tasks, compresslevel=self.writer_kwargs.get("compresslevel", 9))
+            tasks = [task for task in tasks if not done.is_done(task)]
+        else:
+            tasks = list(tasks)
+            # 删除上一次运行（包括中断的运行留下的分片）记录的输出文件
+            self.merge_manifests(include_existing=True).clear()
+        if counters is not None:
+            counters.set_total(tasks)
+
+        task_queue = Queue()
+        procs = [
+            Process(target=_pool_worker, args=(self, rank, target, task_queue, counters, memory_budget))
+            for rank in range(self.world_size)
+        ]
+        for proc in procs:
+            proc.start()
+        for task in tasks:
+            task_queue.put(task)
+        for _ in procs:
+            task_queue.put(None)
+        failed = _join_workers(procs, task_queue)
+
+        manifest = self.merge_manifests(include_existing=self.resume)
+        if failed:
+            raise Exception(f"Writer pool workers failed: {failed}")
+        return manifest
+
+
+def _join_workers(procs: List[Process], task_queue: Queue) -> List[int]:
+    """等待所有进程结束，返回出错的进程编号。
+
+    一个进程异常退出（例如被 OOM 终止）时不会再领取任务与结束标记，
+    因此不能只调用 join：发现出错的进程后终止其他进程，不再等待队列中剩下的任务。
+    """
+    running = {proc.sentinel: rank for rank, proc in enumerate(procs)}
+    failed = []
+    while running and (not failed):
+        for sentinel in wait(list(running)):
+            rank = running.pop(sentinel)
+            procs[rank].join()
+            if procs[rank].exitcode != 0:
+                failed.append(rank)
+    if failed:
+        exitcode = procs[failed[0]].exitcode
+        logger.error(f"Writer pool worker {failed[0]} exited with {exitcode}, terminating the others")
+        for rank in running.values():
+            procs[rank].terminate()
+        for rank in running.values():
+            procs[rank].join()
+        task_queue.cancel_join_thread()
+    return failed
+
+
+def _pool_worker(
+    pool: WriterPool,
+    rank: int,
+    target: Callable,
+    task_queue: Queue,
+    counters: Optional[progress.ProgressCounters] = None,
+    memory_budget: Optional[MemoryBudget] = None,
+):
+    """WriterPool 的子进程：不断领取任务直到收到 None。"""
+    writer = pool.get_writer(rank)
+    reporter = counters.reporter(rank) if counters is not None else None
+    progress.set_current(reporter)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            raw_bytes = writer.stats.raw_bytes
+            writer.begin_input(task)
+            with profiling.stage("task"):
+                done = target(writer, task)
+            writer.end_input(done=done is not False)
+            if reporter is not None:
+                reporter.add(
+                    inputs=1,
+                    input_size=progress.input_size(task),
+                    output_bytes=writer.stats.raw_bytes - raw_bytes,
+                )
+                reporter.flush()
+            # 每个任务结束后保存计时统计：进程被终止时也不会丢失
+            profiling.flush()
+            if memory_budget is not None:
+                memory_budget.check(f"writer pool worker {rank}")
+    except BaseException:
+        # 放弃没有写完的文件，已经完成的任务仍然保留在 manifest 分片中
+        writer.abort()
+        raise
+    writer.close()
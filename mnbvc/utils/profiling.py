@@ -0,0 +1,308 @@
+"""分阶段计时 - 统计读取、解码、解析、转换、simhash、序列化与写入各自的耗时。
+
+用法：
+    from mnbvc.utils import profiling
+
+    with profiling.stage("parse_html"):
+        ...
+    profiling.record("write", seconds)  # 已经计时的代码直接记录耗时
+
+    @profiling.timed("convert_to_general_corpus")
+    def convert_to_general_corpus(...): ...
+
+    with profiling.source("duzhe"):  # 之后的计时同时按来源统计
+        ...
+
+没有启用时 stage 返回同一个空的上下文管理器，record 直接返回，几乎没有额外开销。
+阶段可以嵌套（例如 convert 包括 parse_json 与 convert_to_general_corpus），总耗时会重复计算。
+
+启用：profiling.enable(folder)，或者设置环境变量 MNBVC_PROFILE_DIR=folder。
+启用后每个进程把自己的统计保存为 folder/profile.<pid>.json（在每个任务结束时与进程退出时），
+merge_profiles(folder) 合并所有进程的统计，format_report 输出每个阶段的总耗时、次数与分位数，
+以及每个来源的耗时。
+"""
+
+import atexit
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+ENV_VAR = "MNBVC_PROFILE_DIR"
+
+# 每个阶段最多保留的耗时样本数（蓄水池抽样），用于估计分位数
+MAX_SAMPLES = 10000
+
+_NULL = nullcontext()
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            idx = random.randrange(self.count)
+            if idx < MAX_SAMPLES:
+                self.samples[idx] = seconds
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "max": self.max, "samples": self.samples}
+
+
+class StageProfiler:
+    """一个进程中的计时统计。"""
+
+    def __init__(self, folder: Union[Path, str]):
+        self.folder = Path(folder)
+        self.stages: Dict[str, _StageStats] = {}
+        # 来源 -> 阶段 -> [次数，总耗时]
+        self.sources: Dict[str, Dict[str, List[float]]] = {}
+        self.source: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self.lock:
+            stats = self.stages.get(name, None)
+            if stats is None:
+                stats = self.stages[name] = _StageStats()
+            stats.add(seconds)
+            if self.source is not None:
+                by_stage = self.sources.setdefault(self.source, {})
+                counter = by_stage.setdefault(name, [0, 0.0])
+                counter[0] += 1
+                counter[1] += seconds
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+                "sources": {
+                    source: {name: list(counter) for name, counter in by_stage.items()}
+                    for source, by_stage in self.sources.items()
+                },
+            }
+
+    def save(self):
+        """保存为 folder/profile.<pid>.json。先写入临时文件再重命名，读取时不会读到一半的文件。"""
+        if not self.stages:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder / f"profile.{os.getpid()}.json"
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(self.to_dict(), fp)
+        os.replace(tmp_path, path)
+
+
+class _Timer:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: StageProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+_profiler: Optional[StageProfiler] = None
+
+
+def enable(folder: Union[Path, str]):
+    """在当前进程以及之后创建的子进程中启用计时，结果保存在 folder 中。"""
+    global _profiler
+    os.environ[ENV_VAR] = str(folder)
+    if (_profiler is None) or (_profiler.folder != Path(folder)):
+        _profiler = StageProfiler(folder)
+
+
+def disable():
+    """保存当前进程的统计并停止计时。"""
+    global _profiler
+    flush()
+    _profiler = None
+    os.environ.pop(ENV_VAR, None)
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def stage(name: str):
+    """计时的上下文管理器：with stage("parse_json"): ..."""
+    if _profiler is None:
+        return _NULL
+    return _Timer(_profiler, name)
+
+
+def record(name: str, seconds: float):
+    """记录已经计时的一段代码的耗时。"""
+    if _profiler is not None:
+        _profiler.add(name, seconds)
+
+
+def timed(name: str):
+    """计时的装饰器：@timed("convert_to_general_corpus")"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _Timer(_profiler, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+    """对迭代器的每次 next 计时（不包括使用者处理每个元素的时间），例如转换函数返回的生成器。"""
+    if _profiler is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(name, time.perf_counter() - start)
+            return
+        record(name, time.perf_counter() - start)
+        yield item
+
+
+@contextmanager
+def source(name: Optional[str]) -> Iterator[None]:
+    """其中的计时同时记录到来源 name 下（例如数据集、文件夹或 dump 的名字）。"""
+    if _profiler is None:
+        yield
+        return
+    previous = _profiler.source
+    _profiler.source = name
+    try:
+        yield
+    finally:
+        _profiler.source = previous
+
+
+def flush():
+    """保存当前进程的统计。WriterPool 与 run_conversion 在每个任务结束后调用。"""
+    if _profiler is not None:
+        _profiler.save()
+
+
+def _reset_after_fork():
+    # fork 出来的子进程不应该带着父进程已有的统计，否则合并时会重复计算
+    global _profiler
+    if _profiler is not None:
+        _profiler = StageProfiler(_profiler.folder)
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(int(q * len(sorted_samples)), len(sorted_samples) - 1)
+    return sorted_samples[idx]
+
+
+def merge_profiles(folder: Union[Path, str]) -> dict:
+    """合并 folder 中所有进程的统计。
+
+    返回：{
+        "processes": 进程数,
+        "stages": {阶段: {count, total, mean, p50, p90, p99, max}}，按总耗时从大到小，
+        "sources": {来源: {阶段: {count, total}}}
+    }
+    分位数由各进程的抽样样本估计。
+    """
+    parts = []
+    for path in sorted(Path(folder).glob("profile.*.json")):
+        with open(path, "r") as fp:
+            parts.append(json.load(fp))
+
+    merged: Dict[str, dict] = {}
+    sources: Dict[str, Dict[str, dict]] = {}
+    for part in parts:
+        for name, stats in part["stages"].items():
+            entry = merged.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "samples": []})
+            entry["count"] += stats["count"]
+            entry["total"] += stats["total"]
+            entry["max"] = max(entry["max"], stats["max"])
+            entry["samples"].extend(stats["samples"])
+        for source_name, by_stage in part["sources"].items():
+            for name, (count, total) in by_stage.items():
+                entry = sources.setdefault(source_name, {}).setdefault(name, {"count": 0, "total": 0.0})
+                entry["count"] += count
+                entry["total"] += total
+
+    stages = {}
+    for name, entry in sorted(merged.items(), key=lambda item: -item[1]["total"]):
+        samples = sorted(entry["samples"])
+        stages[name] = {
+            "count": entry["count"],
+            "total": entry["total"],
+            "mean": entry["total"] / max(entry["count"], 1),
+            "p50": _percentile(samples, 0.5),
+            "p90": _percentile(samples, 0.9),
+            "p99": _percentile(samples, 0.99),
+            "max": entry["max"],
+        }
+    return {"processes": len(parts), "stages": stages, "sources": sources}
+
+
+def format_report(report: dict) -> str:
+    """把 merge_profiles 的结果转换成表格文本（时间单位：总耗时为秒，其他为毫秒）。"""
+    lines = [f"processes: {report['processes']}"]
+    header = f"{'stage':<28}{'count':>10}{'total(s)':>12}{'mean(ms)':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+    lines.append(header)
+    for name, stats in report["stages"].items():
+        lines.append(
+            f"{name:<28}{stats['count']:>10}{stats['total']:>12.3f}"
+            f"{stats['mean'] * 1000:>10.3f}{stats['p50'] * 1000:>9.3f}"
+            f"{stats['p90'] * 1000:>9.3f}{stats['p99'] * 1000:>9.3f}{stats['max'] * 1000:>9.3f}"
+        )
+    for source_name, by_stage in sorted(report["sources"].items()):
+        lines.append(f"[{source_name}]")
+        for name, stats in sorted(by_stage.items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"  {name:<26}{stats['count']:>10}{stats['total']:>12.3f}")
+    return "\n".join(lines)
+
+
+def write_report(folder: Union[Path, str]) -> dict:
+    """合并 folder 中的统计，保存为 folder/report.json 与 folder/report.txt，并返回合并结果。"""
+    folder = Path(folder)
+    report = merge_profiles(folder)
+    with open(folder / "report.json", "w") as fp:
+        json.dump(report, fp, indent=2, ensure_ascii=False)
+    with open(folder / "report.txt", "w") as fp:
+        fp.write(format_report(report) + "\n")
+    return report
+
+
+if os.environ.get(ENV_VAR):
+    # spawn 启动的子进程导入此模块时自动启用
+    enable(os.environ[ENV_VAR])
+atexit.register(flush)
+os.register_at_fork(after_in_child=_reset_after_fork)
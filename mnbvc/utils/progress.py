@@ -0,0 +1,272 @@
+"""进度 - 汇总所有进程转换的输入、文档、段落与字节数，显示速度与按输入大小估计的剩余时间。
+
+每个进程在共享内存（multiprocessing.RawArray）中有自己的一行计数，只有它自己写入，不需要加锁。
+进程先在本地累加，最多每隔 flush_interval 秒写入共享内存一次，每条记录没有额外的进程间通信。
+主进程中的 ProgressMonitor 线程定期读取所有行的和并显示。
+
+用法：
+    counters = ProgressCounters(slots=workers)
+    counters.set_total(items)
+    with ProgressMonitor(counters, desc="epubs"):
+        # 第 slot 个子进程中
+        reporter = counters.reporter(slot)
+        for corpus in count_records(convert(item), reporter):
+            ...
+        reporter.add(inputs=1, input_size=input_size(item), output_bytes=size)
+        reporter.flush()
+
+run_conversion 默认显示进度，不需要直接使用这些类。
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+# 每个进程一行，每行依次为这些计数
+FIELDS = ("inputs", "input_size", "documents", "paragraphs", "output_bytes")
+_INDEX = {name: idx for idx, name in enumerate(FIELDS)}
+
+# count_records 每处理这么多条记录检查一次是否需要写入共享内存
+_CHECK_EVERY = 64
+
+
+def input_size(item: Any) -> int:
+    """估计剩余时间时一个输入的权重：WorkItem 的 size，或者文件的大小；至少为 1。"""
+    size = getattr(item, "size", None)
+    if not isinstance(size, int):
+        try:
+            size = os.path.getsize(str(item))
+        except (OSError, ValueError):
+            size = 0
+    return max(size, 1)
+
+
+def paragraphs_of(data: Any) -> int:
+    """一条语料的段落数（通用语料的 段落数），没有时为 0。"""
+    count = getattr(data, "paragraphs_count", None)
+    if count is None and isinstance(data, dict):
+        count = data.get("段落数", None)
+        if count is None and isinstance(data.get("段落", None), list):
+            count = len(data["段落"])
+    return count or 0
+
+
+class ProgressReporter:
+    """一个进程的计数：在本地累加，定期写入共享内存中属于自己的一行。"""
+
+    def __init__(self, array, slot: int, flush_interval: float = 0.5):
+        self.array = array
+        self.offset = slot * len(FIELDS)
+        self.values = [0.0] * len(FIELDS)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def add(self, **counts: float):
+        """累加计数，例如 add(documents=1, paragraphs=20)。"""
+        for name, value in counts.items():
+            self.values[_INDEX[name]] += value
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把本地的计数写入共享内存。写入的是累计值，主进程读到的总是某一时刻的完整计数。"""
+        self.array[self.offset: self.offset + len(FIELDS)] = self.values
+        self._last_flush = time.monotonic()
+
+
+class ProgressCounters:
+    """slots 个进程共享的计数。需要在创建子进程之前创建，并作为参数传给子进程。"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.array = RawArray("d", slots * len(FIELDS))
+        # 以下只在主进程中使用
+        self.total_inputs: Optional[int] = None
+        self.total_size: Optional[int] = None
+
+    def __getstate__(self):
+        # 子进程只需要共享内存
+        return {"slots": self.slots, "array": self.array}
+
+    def __setstate__(self, state):
+        self.slots = state["slots"]
+        self.array = state["array"]
+        self.total_inputs = None
+        self.total_size = None
+
+    def set_total(self, items: Iterable[Any]):
+        """设置需要处理的输入（已经跳过的输入不应包括在内），用于计算完成比例与剩余时间。"""
+        items = list(items)
+        self.total_inputs = len(items)
+        self.total_size = sum(input_size(item) for item in items)
+
+    def reporter(self, slot: int, flush_interval: float = 0.5) -> ProgressReporter:
+        if not (0 <= slot < self.slots):
+            raise Exception(f"Slot must be in [0, {self.slots}), got {slot}")
+        return ProgressReporter(self.array, slot, flush_interval)
+
+    def totals(self) -> dict:
+        """所有进程的计数之和。"""
+        values = self.array[:]
+        width = len(FIELDS)
+        return {
+            name: sum(values[idx::width])
+            for idx, name in enumerate(FIELDS)
+        }
+
+
+def count_records(records: Iterable[Any], reporter: Optional[ProgressReporter]) -> Iterator[Any]:
+    """原样返回 records，同时统计文档数与段落数。reporter 为 None 时不统计。"""
+    if reporter is None:
+        yield from records
+        return
+    documents = 0
+    paragraphs = 0
+    try:
+        for data in records:
+            documents += 1
+            paragraphs += paragraphs_of(data)
+            if documents >= _CHECK_EVERY:
+                reporter.add(documents=documents, paragraphs=paragraphs)
+                documents = 0
+                paragraphs = 0
+            yield data
+    finally:
+        reporter.add(documents=documents, paragraphs=paragraphs)
+
+
+# 当前进程的 reporter，由 WriterPool 的子进程设置
+_reporter: Optional[ProgressReporter] = None
+
+
+def set_current(reporter: Optional[ProgressReporter]):
+    global _reporter
+    _reporter = reporter
+
+
+def current() -> Optional[ProgressReporter]:
+    return _reporter
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressMonitor:
+    """在主进程的线程中定期显示 counters 的汇总。
+
+    剩余时间按输入大小估计：剩余输入的大小 / 目前每秒处理的输入大小，
+    大小差别很大的输入（例如 epub）比按输入数量估计准确。
+
+    file 是终端时每 interval 秒（默认 0.5）刷新同一行；
+    否则（例如重定向到日志文件）每 interval 秒（默认 30）输出一行。
+    结束时把汇总写入日志。
+    """
+
+    def __init__(
+        self,
+        counters: ProgressCounters,
+        desc: str = "",
+        interval: Optional[float] = None,
+        file: Optional[TextIO] = None,
+    ):
+        self.counters = counters
+        self.desc = desc
+        self.file = file or sys.stderr
+        self.tty = hasattr(self.file, "isatty") and self.file.isatty()
+        if interval is None:
+            interval = 0.5 if self.tty else 30.0
+        self.interval = interval
+        self.start_time = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> dict:
+        """当前的计数、耗时、速度（每秒）与剩余时间（秒，无法估计时为 None）。"""
+        totals = self.counters.totals()
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        result = dict(totals)
+        result["elapsed"] = elapsed
+        for name in ("input_size", "documents", "paragraphs", "output_bytes"):
+            result[f"{name}_per_second"] = totals[name] / elapsed
+        result["total_inputs"] = self.counters.total_inputs
+        result["total_size"] = self.counters.total_size
+        result["eta"] = None
+        total_size = self.counters.total_size
+        if total_size and totals["input_size"] > 0:
+            remaining = max(total_size - totals["input_size"], 0)
+            result["eta"] = remaining / result["input_size_per_second"]
+        return result
+
+    def format(self, snapshot: dict) -> str:
+        parts = [f"[{self.desc}]"] if self.desc else []
+        inputs = f"{int(snapshot['inputs'])}"
+        if snapshot["total_inputs"] is not None:
+            inputs += f"/{snapshot['total_inputs']}"
+        if snapshot["total_size"]:
+            percent = 100 * snapshot["input_size"] / snapshot["total_size"]
+            parts.append(f"{percent:5.1f}%")
+        parts.append(f"{inputs} inputs ({_format_size(snapshot['input_size_per_second'])}/s)")
+        parts.append(f"{int(snapshot['documents'])} docs ({snapshot['documents_per_second']:.1f}/s)")
+        parts.append(f"{int(snapshot['paragraphs'])} paragraphs")
+        parts.append(f"{_format_size(snapshot['output_bytes'])} out ({_format_size(snapshot['output_bytes_per_second'])}/s)")
+        parts.append(f"elapsed {_format_seconds(snapshot['elapsed'])}")
+        if snapshot["eta"] is not None:
+            parts.append(f"ETA {_format_seconds(snapshot['eta'])}")
+        return " | ".join(parts)
+
+    def render(self, final: bool = False):
+        line = self.format(self.snapshot())
+        if self.tty:
+            self.file.write("\r\033[K" + line + ("\n" if final else ""))
+        else:
+            self.file.write(line + "\n")
+        self.file.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.render(final=True)
+        logger.info(self.format(self.snapshot()))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,167 @@
+"""按路由写入 - 不同类别的记录写入不同的文件，并限制同时打开的文件数量。
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from mnbvc.utils.stats import WriterStats
+from mnbvc.utils.writer import SizeLimitedFileWriter
+
+
+class RoutingWriter:
+    """根据路由把记录写入对应的 SizeLimitedFileWriter。
+
+    路由由 writeline 的 route 参数给出，没有给出时使用 route_fn(data)。
+    filename_fmt 中的 "{route}" 会替换成路由名，例如 "{route}_{}.jsonl" -> "zh_000.jsonl"。
+
+    同时最多打开 max_open 个 writer（LRU）。被关闭的路由再次写入时，
+    继续追加写入该路由最后一个没有写满的文件（见 SizeLimitedFileWriter 的 append_shard），
+    写满后才使用下一个文件编号，不会覆盖之前的文件。
+    每次重新打开只读取该文件的索引（每条记录 32 字节加上键，没有索引时不读取），
+    新的记录写在新的 gzip 块中，不会复制或重新压缩已经写入的数据。
+    同一个文件最多重新打开 max_reopen 次，之后该路由使用下一个文件编号，
+    因此路由数超过 max_open 而频繁切换时，读取索引的总量不超过索引大小的 max_reopen 倍。
+    route_stats 为每个路由已经写完的文件的记录数、文件大小以及文件数，每个文件写完后即更新。
+    所有路由的 writer 共用一个 stats（参数同 SizeLimitedFileWriter 的 stats_interval 等），
+    关闭被淘汰的 writer 时不输出统计，close 时才输出一次。
+
+    用法：
+        writer = RoutingWriter(output_folder, filename_fmt="{route}_{}.jsonl.gz")
+        writer.writeline(corpus.model_dump(by_alias=True), route=lang)
+        writer.close()
+    """
+
+    def __init__(
+        self,
+        output_folder,
+        route_fn: Optional[Callable[[Any], str]] = None,
+        filename_fmt: str = "{route}_{}.jsonl",
+        max_open: int = 64,
+        max_reopen: int = 16,
+        **writer_kwargs
+    ):
+        if max_open <= 0:
+            raise Exception(f"Max open writers must be positive, got {max_open}")
+        if max_reopen < 0:
+            raise Exception(f"Max reopen count must be non-negative, got {max_reopen}")
+        self.output_folder = output_folder
+        self.route_fn = route_fn
+        self.filename_fmt = filename_fmt
+        self.max_open = max_open
+        self.max_reopen = max_reopen
+        self.stats = WriterStats(
+            name=writer_kwargs.pop("stats_name", None) or str(output_folder),
+            interval=writer_kwargs.pop("stats_interval", 60),
+            path=writer_kwargs.pop("stats_path", None),
+        )
+        self.writer_kwargs = writer_kwargs
+
+        self.writers: "OrderedDict[str, SizeLimitedFileWriter]" = OrderedDict()
+        # 被关闭的路由最后一个文件的编号与信息，再次写入时继续这个文件
+        self._last_shard: Dict[str, Tuple[int, dict]] = {}
+        # 被关闭的路由下一个文件的编号
+        self._next_idx: Dict[str, int] = {}
+        # 路由 -> (文件名, 重新打开的次数)
+        self._reopens: Dict[str, Tuple[str, int]] = {}
+        # 路由 -> {文件名: 文件信息}，同一个文件追加写入后使用最新的信息
+        self._route_shards: Dict[str, Dict[str, dict]] = {}
+
+    def get_route(self, data, route: Optional[str] = None) -> str:
+        if route is not None:
+            return route
+        if self.route_fn is None:
+            raise Exception("Either route or route_fn must be given")
+        return self.route_fn(data)
+
+    def get_writer(self, route: str) -> SizeLimitedFileWriter:
+        """获取路由对应的 writer，必要时关闭最久没有使用的 writer。"""
+        writer = self.writers.get(route, None)
+        if writer is not None:
+            self.writers.move_to_end(route)
+            return writer
+
+        while len(self.writers) >= self.max_open:
+            old_route, old_writer = self.writers.popitem(last=False)
+            self._close_writer(old_route, old_writer)
+
+        kwargs = dict(self.writer_kwargs)
+        if route in self._last_shard:
+            last_idx, shard = self._last_shard[route]
+            name, reopens = self._reopens.get(route, (None, 0))
+            reopens = reopens + 1 if name == shard["path"] else 1
+            if reopens <= self.max_reopen:
+                self._reopens[route] = (shard["path"], reopens)
+                kwargs["filename_idx_first"], kwargs["append_shard"] = last_idx, shard
+            else:
+                kwargs["filename_idx_first"] = self._next_idx[route]
+        writer = SizeLimitedFileWriter(
+            output_folder=self.output_folder,
+            filename_fmt=self.filename_fmt.replace("{route}", route),
+            stats=self.stats,
+            **kwargs
+        )
+        self.writers[route] = writer
+        return writer
+
+    def writeline(self, data, route: Optional[str] = None):
+        self.get_writer(self.get_route(data, route)).writeline(data)
+
+    def write_many(self, records: Iterable[Any], batch_size: int = 4096):
+        """批量写入，每 batch_size 条记录按路由分组后写入（同一路由内保持顺序）。"""
+        batches: Dict[str, list] = {}
+        count = 0
+        for data in records:
+            batches.setdefault(self.get_route(data), []).append(data)
+            count += 1
+            if count >= batch_size:
+                self._write_batches(batches)
+                batches = {}
+                count = 0
+        self._write_batches(batches)
+
+    def _write_batches(self, batches: Dict[str, list]):
+        for route, records in batches.items():
+            self.get_writer(route).write_many(records)
+
+    def _close_writer(self, route: str, writer: SizeLimitedFileWriter):
+        writer.close()
+        if writer.shards:
+            # 最后一个文件的编号：next_filepath 之后编号已经增加了一次
+            last_idx = writer.filename_idx_current - writer.filename_idx_stride
+            self._last_shard[route] = (last_idx, writer.shards[-1])
+            self._next_idx[route] = writer.filename_idx_current
+        shards = self._route_shards.setdefault(route, {})
+        for shard in writer.shards:
+            shards[shard["path"]] = shard
+
+    @property
+    def route_stats(self) -> Dict[str, dict]:
+        """每个路由已经写完的文件的统计，包括仍然打开的 writer 已经写完的文件。"""
+        stats = {}
+        for route in set(self._route_shards) | set(self.writers):
+            shards = dict(self._route_shards.get(route, {}))
+            writer = self.writers.get(route, None)
+            if writer is not None:
+                for shard in writer.shards:
+                    shards[shard["path"]] = shard
+            stats[route] = {
+                "records": sum(shard["records"] for shard in shards.values()),
+                "size": sum(shard["size"] for shard in shards.values()),
+                "raw_size": sum(shard["raw_size"] for shard in shards.values()),
+                "shards": len(shards),
+            }
+        return stats
+
+    def close(self):
+        if not self.writers:
+            return
+        while self.writers:
+            route, writer = self.writers.popitem(last=False)
+            self._close_writer(route, writer)
+        self.stats.finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
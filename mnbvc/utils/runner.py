@@ -0,0 +1,372 @@
+"""并行转换 - 在多个进程中运行转换函数并写入结果。
+"""
+
+import logging
+import os
+import queue
+import struct
+import tempfile
+import traceback
+from collections import deque
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from mnbvc.utils import profiling, progress
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.memory import BATCH_FRACTION, MemoryBudget
+from mnbvc.utils.pool import WriterPool
+from mnbvc.utils.writer import DEFAULT_INDEX_KEY, RecordBatch, SizeLimitedFileWriter, serialize_keyed
+
+logger = logging.getLogger(__name__)
+
+# 转换函数：输入一个文件（或其他任务），返回语料的迭代器
+Converter = Callable[[Any], Iterable[Any]]
+
+
+class _Window:
+    """同时提交的任务数：最多 window 个，并且 平均结果大小 × 任务数 不超过 max_bytes。"""
+
+    def __init__(self, window: int, max_bytes: Optional[int], size_of: Optional[Callable[[Any], int]]):
+        self.window = max(window, 1)
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.value = self.window
+        self.count = 0
+        self.total = 0
+
+    def observe(self, result: Any) -> Any:
+        if self.max_bytes is None or self.size_of is None:
+            return result
+        self.count += 1
+        self.total += self.size_of(result)
+        average = self.total / self.count
+        if average > 0:
+            self.value = min(self.window, max(int(self.max_bytes // average), 1))
+        return result
+
+
+def bounded_imap(
+    pool: Pool,
+    func: Callable,
+    iterable: Iterable[Any],
+    window: int,
+    ordered: bool = True,
+    max_bytes: Optional[int] = None,
+    size_of: Optional[Callable[[Any], int]] = None,
+) -> Iterator[Any]:
+    """类似 pool.imap / pool.imap_unordered，但最多同时提交 window 个任务。
+
+    pool.imap 会一次性读取整个 iterable，输入很多或者结果很大时会占用大量内存。
+    指定 max_bytes 与 size_of（结果的字节数）时，根据已经返回的结果的平均大小减少同时提交的任务，
+    使等待取出的结果大约不超过 max_bytes。
+    """
+    limit = _Window(window, max_bytes, size_of)
+    iterator = iter(iterable)
+    if ordered:
+        pending = deque()
+        for item in iterator:
+            pending.append(pool.apply_async(func, (item,)))
+            while len(pending) >= limit.value:
+                yield limit.observe(pending.popleft().get())
+        while pending:
+            yield limit.observe(pending.popleft().get())
+        return
+
+    done = queue.Queue()
+    pending = 0
+    for item in iterator:
+        pool.apply_async(func, (item,), callback=done.put, error_callback=done.put)
+        pending += 1
+        while pending >= limit.value:
+            yield limit.observe(_get_result(done))
+            pending -= 1
+    while pending:
+        yield limit.observe(_get_result(done))
+        pending -= 1
+
+
+def _get_result(done: queue.Queue):
+    result = done.get()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _result_size(result: Tuple[Any, List[RecordBatch], Optional[str], int]) -> int:
+    """_SerializeConverted 结果的字节数。"""
+    return sum(len(batch) for batch in result[1])
+
+
+def _source_of(item: Any) -> str:
+    """计时统计中的来源：输入文件所在的文件夹名（通常是数据集或 dump 的名字）。"""
+    return Path(str(getattr(item, "path", item))).parent.name
+
+
+class _InputBuffer:
+    """一个输入转换后的记录（序列化为 RecordBatch）。转换成功后才写入 writer，出错时直接丢弃，
+    输出文件中不会留下出错输入的部分记录，继续运行重试时也不会重复写入。
+
+    内存中的记录超过 max_bytes 时写入输出文件夹中的临时文件，很大的输入也只占用 max_bytes 左右的内存。
+    指定 budget 时 max_bytes 不超过每个 worker 预算的 BATCH_FRACTION，并且进程的 RSS 接近预算时立即写入临时文件。
+    """
+
+    _length = struct.Struct("<Q")
+
+    def __init__(
+        self,
+        folder: Path,
+        index_key: Optional[str] = None,
+        max_bytes: int = 64 << 20,
+        batch_size: int = 1 << 20,
+        budget: Optional[MemoryBudget] = None,
+    ):
+        self.folder = folder
+        self.index_key = index_key
+        self.budget = budget
+        if (budget is not None) and budget.per_worker:
+            max_bytes = min(max_bytes, max(int(budget.per_worker * BATCH_FRACTION), batch_size))
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.batches: List[RecordBatch] = []
+        self.batches_size = 0
+        self.records: List[bytes] = []
+        self.keys: List[Optional[str]] = []
+        self.records_size = 0
+        self._spill = None
+
+    def add(self, data: Any):
+        with profiling.stage("serialize"):
+            record, key = serialize_keyed(data, self.index_key)
+        self.records.append(record)
+        self.keys.append(key)
+        self.records_size += len(record)
+        if self.records_size >= self.batch_size:
+            self._pack()
+
+    def _pack(self):
+        if not self.records:
+            return
+        batch = RecordBatch.pack(self.records, self.keys)
+        self.records = []
+        self.keys = []
+        self.records_size = 0
+        self.batches.append(batch)
+        self.batches_size += len(batch)
+        if (self.batches_size >= self.max_bytes) or ((self.budget is not None) and self.budget.is_near()):
+            self._spill_batches()
+
+    def _spill_batches(self):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(dir=self.folder, prefix=".buffer-")
+        for batch in self.batches:
+            self._spill.write(self._length.pack(len(batch)))
+            self._spill.write(batch)
+        self.batches = []
+        self.batches_size = 0
+
+    def _iter_batches(self) -> Iterator[RecordBatch]:
+        if self._spill is not None:
+            self._spill.seek(0)
+            while True:
+                header = self._spill.read(self._length.size)
+                if not header:
+                    break
+                (size,) = self._length.unpack(header)
+                yield RecordBatch(self._spill.read(size))
+        yield from self.batches
+
+    def write_to(self, writer: SizeLimitedFileWriter):
+        self._pack()
+        for batch in self._iter_batches():
+            writer.write_batch(batch)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self.batches = []
+        self.records = []
+        self.keys = []
+
+
+class _WriteConverted:
+    """WriterPool 的任务：转换一个输入，全部转换成功后用当前进程的 writer 写入（见 _InputBuffer）。
+    出错时记录日志并继续。"""
+
+    def __init__(self, converter: Converter, memory_budget: Optional[MemoryBudget] = None):
+        self.converter = converter
+        self.memory_budget = memory_budget
+
+    def __call__(self, writer: SizeLimitedFileWriter, item: Any) -> bool:
+        buffer = _InputBuffer(
+            writer.output_folder, writer.index_key if writer.index else None, budget=self.memory_budget)
+        try:
+            with profiling.source(_source_of(item)):
+                records = profiling.timed_iter("convert", self.converter(item))
+                for data in progress.count_records(records, progress.current()):
+                    buffer.add(data)
+                buffer.write_to(writer)
+            return True
+        except Exception:
+            logger.exception(f"Error converting {item}")
+            return False
+        finally:
+            buffer.close()
+
+
+class _SerializeConverted:
+    """进程池的任务：转换一个输入并序列化为 RecordBatch，由主进程按顺序写入。"""
+
+    def __init__(self, converter: Converter, batch_size: int = 1 << 20, index_key: Optional[str] = None):
+        self.converter = converter
+        self.batch_size = batch_size
+        # writer 建立索引时，键在这里取出并随记录一起传给主进程
+        self.index_key = index_key
+
+    def __call__(self, item: Any) -> Tuple[Any, List[RecordBatch], Optional[str], int]:
+        batches = []
+        records = []
+        keys = []
+        records_size = 0
+        paragraphs = 0
+        try:
+            with profiling.source(_source_of(item)):
+                for data in profiling.timed_iter("convert", self.converter(item)):
+                    paragraphs += progress.paragraphs_of(data)
+                    with profiling.stage("serialize"):
+                        record, key = serialize_keyed(data, self.index_key)
+                    records.append(record)
+                    keys.append(key)
+                    records_size += len(record)
+                    if records_size >= self.batch_size:
+                        batches.append(RecordBatch.pack(records, keys))
+                        records = []
+                        keys = []
+                        records_size = 0
+            if records:
+                batches.append(RecordBatch.pack(records, keys))
+            # 段落数随结果一起返回，由主进程计入进度
+            return item, batches, None, paragraphs
+        except Exception:
+            # 错误信息交给主进程记录
+            return item, [], traceback.format_exc(), 0
+        finally:
+            profiling.flush()
+
+
+def run_conversion(
+    inputs: Iterable[Any],
+    converter: Converter,
+    writer_kwargs: dict,
+    workers: Optional[int] = None,
+    ordered: bool = False,
+    resume: bool = False,
+    manifest_name: str = "manifest.json",
+    show_progress: bool = True,
+    memory_budget: Optional[MemoryBudget] = None,
+    hash_inputs: bool = False,
+) -> dict:
+    """在 workers 个进程中转换 inputs，并写入 writer_kwargs 指定的文件夹。
+
+    converter(item) 返回语料（pydantic 模型、dict 等）的迭代器，
+    例如 EpubConverter(path).convert()。converter 需要可以 pickle（模块级函数或 functools.partial）。
+
+    ordered 为 False 时，每个进程使用自己的 writer 写入（见 WriterPool），速度最快：
+    一个输入全部转换成功后才写入，结果较大时先暂存在输出文件夹的临时文件中；
+    ordered 为 True 时，各进程把转换后的语料序列化后交给主进程按输入顺序写入，
+    每个输入的全部结果需要能放进内存。两种方式中出错的输入都不会在输出中留下记录。
+
+    单个输入出错时记录日志并跳过，不影响其他输入；出错的输入不会记录为已完成，
+    resume 为 True 时会跳过上一次已经完成的输入并重试出错的输入；
+    输入文件改变（大小或修改时间，hash_inputs 为 True 时比较 md5）或被删除时，
+    删除包含其记录的输出文件并重新转换这些文件中的输入，没有改变的输出保持不变（见 RunManifest.refresh）。
+    resume 为 False 时先删除上一次运行的 manifest 中记录的输出文件，输出文件夹中只有这一次的结果。
+
+    memory_budget 为内存预算（默认见 MemoryBudget），限制的是转换结果占用的内存：
+    ordered 为 False 时，每个输入在内存中暂存的结果不超过每个 worker 预算的 BATCH_FRACTION，
+    进程的 RSS 接近预算时暂存的结果立即写入临时文件；
+    ordered 为 True 时，等待主进程写入的结果最多占用预算的一半，结果很大时减少同时处理的输入。
+    converter 自身占用的内存（例如一次读入整个文件）无法限制：每个进程在任务之间检查 RSS，
+    超过预算时只回收垃圾并记录警告。读取 parquet 时可以用 AdaptiveBatchSize 随预算调整批大小。
+
+    show_progress 为 True 时在标准错误中显示所有进程合计的进度、速度与剩余时间（见 progress）。
+
+    返回：{"inputs": 输入数量, "failed": 出错的输入, "records": 写入的记录数}
+    """
+    inputs = list(inputs)
+    workers = workers or os.cpu_count() or 1
+    output_folder = Path(writer_kwargs["output_folder"])
+    if memory_budget is None:
+        memory_budget = MemoryBudget(workers=workers)
+    counters = progress.ProgressCounters(workers if not ordered else 1)
+    monitor = progress.ProgressMonitor(counters, desc=output_folder.name) if show_progress else None
+
+    if not ordered:
+        pool = WriterPool(
+            workers, manifest_name=manifest_name, resume=resume, hash_inputs=hash_inputs, **writer_kwargs)
+        if monitor is not None:
+            monitor.start()
+        try:
+            manifest = pool.run(
+                _WriteConverted(converter, memory_budget), inputs, counters=counters, memory_budget=memory_budget)
+        finally:
+            if monitor is not None:
+                monitor.stop()
+    else:
+        manifest = RunManifest(output_folder / manifest_name, resume=True, hash_inputs=hash_inputs)
+        if resume:
+            manifest.refresh(inputs, compresslevel=writer_kwargs.get("compresslevel", 9))
+        else:
+            manifest.clear()
+        todo = [item for item in inputs if not manifest.is_done(item)]
+        counters.set_total(todo)
+        reporter = counters.reporter(0)
+        writer = SizeLimitedFileWriter(manifest=manifest, **writer_kwargs)
+        if monitor is not None:
+            monitor.start()
+        try:
+            try:
+                with Pool(workers) as pool:
+                    max_bytes = memory_budget.limit // 2 if memory_budget.limit is not None else None
+                    index_key = (
+                        writer_kwargs.get("index_key", DEFAULT_INDEX_KEY) if writer_kwargs.get("index") else None)
+                    results = bounded_imap(
+                        pool, _SerializeConverted(converter, index_key=index_key), todo, window=2 * workers,
+                        ordered=True, max_bytes=max_bytes, size_of=_result_size)
+                    for item, batches, error, paragraphs in results:
+                        if error is not None:
+                            logger.error(f"Error converting {item}\n{error}")
+                        raw_bytes = writer.stats.raw_bytes
+                        records = writer.stats.records
+                        writer.begin_input(item)
+                        for batch in batches:
+                            writer.write_batch(batch)
+                        writer.end_input(done=error is None)
+                        reporter.add(
+                            inputs=1,
+                            input_size=progress.input_size(item),
+                            documents=writer.stats.records - records,
+                            paragraphs=paragraphs,
+                            output_bytes=writer.stats.raw_bytes - raw_bytes,
+                        )
+                        reporter.flush()
+            except BaseException:
+                # 出错或被中断时删除没有写完的文件，已经写完的文件与 manifest 保留，resume 时继续
+                writer.abort()
+                raise
+            writer.close()
+        finally:
+            if monitor is not None:
+                monitor.stop()
+
+    failed = [item for item in inputs if not manifest.is_done(item)]
+    summary = {
+        "inputs": len(inputs),
+        "failed": [str(item) for item in failed],
+        "records": manifest.to_dict()["records"],
+    }
+    logger.info(
+        f"Converted {len(inputs) - len(failed)}/{len(inputs)} inputs, "
+        f"{summary['records']} records")
+    return summary
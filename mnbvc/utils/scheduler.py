@@ -0,0 +1,162 @@
+"""任务调度 - 按大小拆分与合并输入文件，并按从大到小的顺序分发。
+
+输入文件大小差别很大时（比如很多很小的新闻文件与几 GB 的 parquet），
+按 glob 的顺序分发会让最后一个进程单独处理一个很大的文件。
+schedule 先统计所有文件的大小：
+    - 可以拆分的大文件（jsonl 按字节范围，parquet 按 row group）拆分成大小接近 chunk_size 的任务；
+    - 小于 small_file_size 的文件合并成大小接近 chunk_size 的任务；
+    - 所有任务按大小从大到小排序。
+配合 run_conversion（ordered=False）使用时，空闲的进程按顺序领取任务，总耗时接近 总工作量 / 进程数。
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class WorkItem(NamedTuple):
+    """一个转换任务：一个或多个完整的文件，或者一个文件的一部分。
+
+    unit 为 "file" 时，paths 中的文件都需要完整处理；
+    unit 为 "bytes" 时，处理 paths[0] 中起始位置在 [start, end) 的行；
+    unit 为 "row_groups" 时，处理 paths[0] 中第 [start, end) 个 row group。
+    """
+
+    paths: Tuple[str, ...]
+    size: int
+    unit: str = "file"
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+    @property
+    def path(self) -> str:
+        return self.paths[0]
+
+    def __str__(self) -> str:
+        # 用作 manifest 中的键，同样的输入与参数会得到同样的键
+        if self.unit != "file":
+            return f"{self.path}#{self.unit}={self.start}-{self.end}"
+        if len(self.paths) == 1:
+            return self.path
+        digest = hashlib.md5("\n".join(self.paths).encode()).hexdigest()
+        return f"{self.path}#files={len(self.paths)}-{digest}"
+
+
+def split_byte_ranges(path: Union[Path, str], size: int, chunk_size: int) -> List[WorkItem]:
+    """按字节范围拆分文本文件。范围不需要与换行对齐，由读取方处理（见 WorkItem）。"""
+    items = []
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size)
+        items.append(WorkItem((str(path),), end - start, "bytes", start, end))
+    return items
+
+
+def split_parquet(path: Union[Path, str], size: int, chunk_size: int) -> List[WorkItem]:
+    """按 row group 拆分 parquet 文件，每个任务包含连续的若干 row group。"""
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(path).metadata
+    num_row_groups = metadata.num_row_groups
+    if num_row_groups == 0:
+        return [WorkItem((str(path),), size)]
+    # row group 的大小按压缩后的大小在文件中所占比例估计
+    group_sizes = []
+    for idx in range(num_row_groups):
+        row_group = metadata.row_group(idx)
+        group_sizes.append(sum(
+            row_group.column(col).total_compressed_size
+            for col in range(row_group.num_columns)
+        ))
+    total = max(sum(group_sizes), 1)
+    group_sizes = [group_size * size // total for group_size in group_sizes]
+
+    items = []
+    start = 0
+    current = 0
+    for idx, group_size in enumerate(group_sizes):
+        current += group_size
+        if current >= chunk_size or idx == num_row_groups - 1:
+            items.append(WorkItem((str(path),), current, "row_groups", start, idx + 1))
+            start = idx + 1
+            current = 0
+    return items
+
+
+# 文件后缀 -> 拆分函数
+SPLITTERS: Dict[str, Callable[[Union[Path, str], int, int], List[WorkItem]]] = {
+    ".jsonl": split_byte_ranges,
+    ".parquet": split_parquet,
+}
+
+
+def schedule(
+    paths: Iterable[Union[Path, str]],
+    chunk_size: int = 256 << 20,
+    small_file_size: int = 1 << 20,
+    max_group_files: int = 10000,
+    splitters: Optional[Dict[str, Callable]] = None,
+) -> List[WorkItem]:
+    """统计文件大小，拆分大文件、合并小文件，并按大小从大到小排序。
+
+    splitters 为 None 时使用 SPLITTERS；传入空字典则不拆分任何文件。
+    """
+    if splitters is None:
+        splitters = SPLITTERS
+
+    items = []
+    group: List[str] = []
+    group_size = 0
+    for path in paths:
+        size = os.stat(path).st_size
+        splitter = splitters.get(Path(path).suffix, None)
+        if (splitter is not None) and (size > chunk_size):
+            items.extend(splitter(path, size, chunk_size))
+        elif size < small_file_size:
+            group.append(str(path))
+            group_size += size
+            if (group_size >= chunk_size) or (len(group) >= max_group_files):
+                items.append(WorkItem(tuple(group), group_size))
+                group = []
+                group_size = 0
+        else:
+            items.append(WorkItem((str(path),), size))
+    if group:
+        items.append(WorkItem(tuple(group), group_size))
+
+    items.sort(key=lambda item: item.size, reverse=True)
+    return items
+
+
+class FileGroupConverter:
+    """把按文件转换的函数包装成按 WorkItem 转换的函数（只支持 unit == "file" 的任务）。
+
+    合并的小文件中某一个出错时，默认（skip_errors=False）整个任务出错：
+    run_conversion 不会写入这个任务的记录，也不会记录为已完成，resume 时重新转换整个任务。
+    skip_errors=True 时每个文件的记录先暂存，出错的文件丢弃已经产生的记录并记录日志，
+    继续处理同一任务中的其他文件；出错的文件不会重试。
+
+    用法：
+        run_conversion(schedule(paths), FileGroupConverter(convert_epub), ...)
+    """
+
+    def __init__(self, converter: Callable[[Any], Iterable[Any]], skip_errors: bool = False):
+        self.converter = converter
+        self.skip_errors = skip_errors
+
+    def __call__(self, item: WorkItem) -> Iterator[Any]:
+        if item.unit != "file":
+            raise Exception(f"Cannot convert {item}: only whole files are supported")
+        for path in item.paths:
+            if (not self.skip_errors) or (len(item.paths) == 1):
+                yield from self.converter(path)
+                continue
+            try:
+                records = list(self.converter(path))
+            except Exception:
+                logger.exception(f"Error converting {path}, dropped its records")
+                continue
+            yield from records
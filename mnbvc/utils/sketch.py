@@ -0,0 +1,389 @@
+"""重复行检测 - 用固定大小的 count-min sketch 统计一个来源中每行出现在多少个文档中，找出模板行。
+
+网站的页眉、页脚、广告（例如 "更多免费txt电子书，欢迎您到www.txtsk.com.cn下载"）会在成千上万个文件中重复出现。
+find_repeated_lines 在转换之前扫描一遍所有输入（多个进程并行），返回出现在至少 min_count 个文档中的行，
+转换时传给 convert_to_general_corpus(boilerplate=...) 标记或删除这些段落。
+
+count-min sketch：depth 行、每行 width 个计数器，每行用不同的哈希函数把一行文字映射到一个计数器，
+估计值为 depth 个计数器中的最小值。估计值只会偏大不会偏小，偏大的期望不超过 总计数 × e / width。
+内存只与 width × depth 有关（默认 4 × 2^20 个 uint32，16 MB），与数据量无关。
+sketch 只能估计给定行的次数，不能列出所有的行，因此输入读取两遍：第一遍各进程分别统计 sketch 并合并；
+第二遍各进程用合并后的 sketch 筛选估计次数至少为 min_count 的行，并精确统计这些行出现的文档数。
+候选行只由合并后的 sketch 决定，结果与进程数、输入的分组无关。
+sketch 太小（数据量远大于 width）时几乎所有的行都会成为候选行，因此第二遍最多保留 capacity 个候选行
+（Space-Saving，见 RepeatedLineCollector），内存同样与数据量无关。
+
+用法：
+    boilerplate = find_repeated_lines(paths, min_count=100, workers=8)
+    boilerplate.save("txtsk.boilerplate.json")
+    corpus = convert_to_general_corpus(text_id, text, boilerplate=boilerplate)
+"""
+
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+import numpy as np
+
+from mnbvc.utils.decoding import EncodingDetector
+from mnbvc.utils.runner import bounded_imap
+
+# 每批处理的行数：哈希值攒够一批后再用 numpy 更新计数器
+BATCH_SIZE = 65536
+
+
+def normalize_line(line: str) -> str:
+    """统计与匹配时使用的行：去掉首尾的空白（与 convert_to_general_corpus 的 strip 相同）。"""
+    return line.strip()
+
+
+def document_lines(text: Union[str, Iterable[str]], min_length: int = 0) -> Set[str]:
+    """一个文档（文字或者行的列表）中不同的行（normalize_line 之后至少 min_length 个字符）。"""
+    lines = text.split("\n") if isinstance(text, str) else text
+    unique = set()
+    for line in lines:
+        line = normalize_line(line)
+        if len(line) >= min_length:
+            unique.add(line)
+    return unique
+
+
+def hash_lines(lines: List[str]) -> np.ndarray:
+    """每行两个 64 位哈希值，形状为 (len(lines), 2)。"""
+    digests = b"".join(
+        hashlib.blake2b(line.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+        for line in lines
+    )
+    return np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+
+
+class CountMinSketch:
+    """count-min sketch。第 i 行的哈希函数为 h1 + i × h2（双重哈希），h1、h2 见 hash_lines。
+
+    同样 width 与 depth 的 sketch 可以相加（merge），因此可以在多个进程中分别统计再合并。
+    """
+
+    def __init__(self, width: int = 1 << 20, depth: int = 4):
+        if (width <= 0) or (depth <= 0):
+            raise Exception(f"Invalid sketch size: width={width}, depth={depth}")
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        # 所有加入的次数之和，用于估计误差
+        self.total = 0
+
+    def _indices(self, hashes: np.ndarray) -> np.ndarray:
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        with np.errstate(over="ignore"):
+            return (hashes[:, 0][None, :] + rows * hashes[:, 1][None, :]) % np.uint64(self.width)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """每个哈希值（hash_lines 的一行）计数加一。"""
+        if not len(hashes):
+            return
+        indices = self._indices(hashes)
+        for row in range(self.depth):
+            np.add.at(self.table[row], indices[row], 1)
+        self.total += len(hashes)
+
+    def estimate_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.zeros(0, dtype=np.uint32)
+        indices = self._indices(hashes)
+        return self.table[np.arange(self.depth)[:, None], indices].min(axis=0)
+
+    def add(self, lines: List[str]):
+        self.add_hashes(hash_lines(lines))
+
+    def estimate(self, lines: List[str]) -> np.ndarray:
+        return self.estimate_hashes(hash_lines(lines))
+
+    def merge(self, other: "CountMinSketch"):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise Exception(
+                f"Cannot merge sketches of different sizes: "
+                f"{self.depth}x{self.width} and {other.depth}x{other.width}")
+        self.table += other.table
+        self.total += other.total
+
+    @property
+    def error(self) -> float:
+        """估计值偏大的期望上限：total × e / width。"""
+        return self.total * np.e / self.width
+
+
+class LineCounter:
+    """统计每行出现在多少个文档中（sketch 的估计值）。同样参数的 LineCounter 可以合并。"""
+
+    def __init__(self, width: int = 1 << 20, depth: int = 4, min_length: int = 5):
+        self.sketch = CountMinSketch(width, depth)
+        self.min_length = min_length
+        self.documents = 0
+        self._lines: List[str] = []
+
+    def add_document(self, text: Union[str, Iterable[str]]):
+        """加入一个文档（文字或者行的列表）。同一个文档中重复的行只计一次。"""
+        self._lines.extend(document_lines(text, self.min_length))
+        self.documents += 1
+        if len(self._lines) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.sketch.add(self._lines)
+            self._lines = []
+
+    def merge(self, other: "LineCounter"):
+        """合并另一个进程的统计。"""
+        other.flush()
+        self.flush()
+        self.sketch.merge(other.sketch)
+        self.documents += other.documents
+
+
+class RepeatedLineCollector:
+    """第二遍：用合并后的 sketch 筛选估计次数至少为 min_count 的行，并精确统计它们出现在多少个文档中。
+
+    sketch 的估计值只会偏大，因此不会漏掉真正重复的行；精确计数去掉了估计偏大的行。
+
+    最多保留 capacity 个候选行（Space-Saving）：每次 flush 或 merge 后只保留次数最多的 capacity 行，
+    被删除的行再次出现时从 floor（被删除的行次数的上限）开始计数，多计的部分记录在 errors 中。
+    候选行不超过 capacity 个时计数是精确的，结果与之前相同；超过时出现次数多于 候选行总次数 / capacity 的行
+    一定会保留，lines() 只返回确定至少出现 min_count 次的行，次数为下限（counts - errors）。
+    """
+
+    def __init__(self, sketch: CountMinSketch, min_count: int, min_length: int = 5, capacity: int = 1 << 20):
+        if capacity <= 0:
+            raise Exception(f"Invalid capacity: {capacity}")
+        self.sketch = sketch
+        self.min_count = min_count
+        self.min_length = min_length
+        self.capacity = capacity
+        # 行 -> 出现的文档数（上限）
+        self.counts: Dict[str, int] = {}
+        # 行 -> counts 中多计的次数上限，只记录不为 0 的行
+        self.errors: Dict[str, int] = {}
+        # 不在 counts 中的行出现次数的上限
+        self.floor = 0
+        # 等待筛选的行，每个文档一个列表
+        self._documents: List[List[str]] = []
+        self._pending = 0
+
+    def add_document(self, text: Union[str, Iterable[str]]):
+        lines = list(document_lines(text, self.min_length))
+        self._documents.append(lines)
+        self._pending += len(lines)
+        if self._pending >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            self._documents = []
+            return
+        lines = [line for document in self._documents for line in document]
+        self._documents = []
+        self._pending = 0
+        estimates = self.sketch.estimate(lines)
+        batch: Dict[str, int] = {}
+        for idx in np.nonzero(estimates >= self.min_count)[0]:
+            line = lines[idx]
+            batch[line] = batch.get(line, 0) + 1
+        self._add_counts(batch, {}, 0)
+
+    def merge(self, other: "RepeatedLineCollector"):
+        other.flush()
+        self.flush()
+        self._add_counts(other.counts, other.errors, other.floor)
+
+    def _add_counts(self, counts: Dict[str, int], errors: Dict[str, int], floor: int):
+        """加上另一组计数（其中没有的行次数上限为 floor），然后只保留次数最多的 capacity 行。"""
+        if floor:
+            for line in self.counts:
+                if line not in counts:
+                    self.counts[line] += floor
+                    self.errors[line] = self.errors.get(line, 0) + floor
+        for line, count in counts.items():
+            error = errors.get(line, 0)
+            if line in self.counts:
+                self.counts[line] += count
+            else:
+                self.counts[line] = self.floor + count
+                error += self.floor
+            if error:
+                self.errors[line] = self.errors.get(line, 0) + error
+        self.floor += floor
+        if len(self.counts) <= self.capacity:
+            return
+        # 次数相同时按行排序，保证结果确定
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        for line, count in ranked[self.capacity:]:
+            del self.counts[line]
+            self.errors.pop(line, None)
+            self.floor = max(self.floor, count)
+
+    def lines(self) -> Dict[str, int]:
+        """确定至少出现在 min_count 个文档中的行 -> 出现的文档数（下限，没有超过 capacity 时是精确的）。"""
+        lines = {}
+        for line, count in self.counts.items():
+            count -= self.errors.get(line, 0)
+            if count >= self.min_count:
+                lines[line] = count
+        return lines
+
+
+class BoilerplateLines:
+    """重复出现的行（模板行）：{行: 出现的文档数（估计值）}。可以用 in 判断一行（会先 normalize_line）是否为模板行。"""
+
+    def __init__(
+        self,
+        lines: Dict[str, int],
+        min_count: int = 0,
+        documents: int = 0,
+        error: float = 0.0,
+    ):
+        self.lines = lines
+        self.min_count = min_count
+        self.documents = documents
+        self.error = error
+
+    def __contains__(self, line: str) -> bool:
+        return normalize_line(line) in self.lines
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "min_count": self.min_count,
+            "documents": self.documents,
+            "error": self.error,
+            # 按次数从大到小，方便人工检查
+            "lines": dict(sorted(self.lines.items(), key=lambda item: -item[1])),
+        }
+
+    def save(self, path: Union[Path, str]):
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.to_dict(), fp, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path: Union[Path, str]) -> "BoilerplateLines":
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        return cls(
+            data["lines"], min_count=data.get("min_count", 0),
+            documents=data.get("documents", 0), error=data.get("error", 0.0))
+
+
+# 默认的读取方式：每个文件是一个文档，自动检测编码
+_decoding = EncodingDetector()
+
+
+def read_text_document(path: Union[Path, str]) -> Iterator[Union[str, Iterable[str]]]:
+    # 很大的文件按行读取，不需要把整个文件的文本放进内存
+    if Path(path).stat().st_size > _decoding.large_file_size:
+        yield _decoding.iter_lines(path)
+    else:
+        yield _decoding.read_text(path).text
+
+
+def _read_all(read_documents: Callable, items: List[Any], counter: Any) -> Any:
+    for item in items:
+        for document in read_documents(item):
+            counter.add_document(document)
+    counter.flush()
+    return counter
+
+
+class _CountInputs:
+    """进程池的任务（第一遍）：把一组输入加入 sketch，返回 LineCounter。"""
+
+    def __init__(self, read_documents: Callable[[Any], Iterable[Union[str, Iterable[str]]]], counter_kwargs: dict):
+        self.read_documents = read_documents
+        self.counter_kwargs = counter_kwargs
+
+    def __call__(self, items: List[Any]) -> LineCounter:
+        return _read_all(self.read_documents, items, LineCounter(**self.counter_kwargs))
+
+
+# 第二遍中每个进程使用的 sketch（通过 Pool 的 initializer 传入，每个进程只传一次）
+_merged_sketch: Optional[CountMinSketch] = None
+
+
+def _set_merged_sketch(sketch: CountMinSketch):
+    global _merged_sketch
+    _merged_sketch = sketch
+
+
+class _CollectInputs:
+    """进程池的任务（第二遍）：统计一组输入中估计次数足够的行，返回 RepeatedLineCollector。"""
+
+    def __init__(
+        self,
+        read_documents: Callable[[Any], Iterable[Union[str, Iterable[str]]]],
+        min_count: int,
+        min_length: int,
+        capacity: int,
+    ):
+        self.read_documents = read_documents
+        self.min_count = min_count
+        self.min_length = min_length
+        self.capacity = capacity
+
+    def __call__(self, items: List[Any]) -> RepeatedLineCollector:
+        collector = RepeatedLineCollector(_merged_sketch, self.min_count, self.min_length, self.capacity)
+        return _read_all(self.read_documents, items, collector)
+
+
+def _map_groups(task: Callable, groups: List[List[Any]], workers: int, initializer=None, initargs=()) -> Iterator[Any]:
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(task, groups)
+        return
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        yield from bounded_imap(pool, task, groups, window=2 * workers, ordered=False)
+
+
+def find_repeated_lines(
+    inputs: Iterable[Any],
+    min_count: int = 100,
+    read_documents: Callable[[Any], Iterable[Union[str, Iterable[str]]]] = read_text_document,
+    workers: Optional[int] = None,
+    width: int = 1 << 20,
+    depth: int = 4,
+    min_length: int = 5,
+    tasks_per_worker: int = 4,
+    capacity: int = 1 << 20,
+) -> BoilerplateLines:
+    """找出 inputs 中出现在至少 min_count 个文档中的行（去掉首尾空白后至少 min_length 个字符）。
+
+    read_documents(item) 返回输入中的文档（文字或者行的列表），默认每个文件是一个文档。
+    输入分成 workers × tasks_per_worker 组，在 workers 个进程中读取两遍：
+    第一遍统计 sketch，主进程依次合并（同一时间内存中最多有 2 × workers 个 sketch）；
+    第二遍用合并后的 sketch 筛选候选行并精确计数（见 RepeatedLineCollector）。
+    结果与进程数、分组方式无关，返回的次数是精确的文档数。
+    每个进程最多保留 capacity 个候选行；候选行更多时（sketch 相对数据量太小）只返回确定重复的行，
+    次数为下限，结果可能与分组方式有关。
+    """
+    inputs = list(inputs)
+    workers = workers or os.cpu_count() or 1
+    groups = max(min(len(inputs), workers * tasks_per_worker), 1)
+    tasks = [inputs[idx::groups] for idx in range(groups)]
+
+    total = LineCounter(width=width, depth=depth, min_length=min_length)
+    count_task = _CountInputs(read_documents, dict(width=width, depth=depth, min_length=min_length))
+    for counter in _map_groups(count_task, tasks, workers):
+        total.merge(counter)
+
+    collected = RepeatedLineCollector(total.sketch, min_count, min_length, capacity)
+    collect_task = _CollectInputs(read_documents, min_count, min_length, capacity)
+    for collector in _map_groups(collect_task, tasks, workers, _set_merged_sketch, (total.sketch,)):
+        collected.merge(collector)
+
+    return BoilerplateLines(collected.lines(), min_count=min_count, documents=total.documents, error=total.sketch.error)
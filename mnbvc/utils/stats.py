@@ -0,0 +1,101 @@
+"""写入统计 - 记录写入速度、序列化与写入耗时、队列等待时间以及文件切换次数。
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class WriterStats:
+    """SizeLimitedFileWriter 及写入进程的统计数据。
+
+    每隔 interval 秒输出一行日志（logger 为 mnbvc.utils.stats，
+    使用 mnbvc.utils.get_logger 时会写入同一个日志文件），
+    设置 path 时同时把统计数据保存为 JSON 文件，方便其他程序读取。
+
+    统计项：
+        records / raw_bytes / compressed_bytes：写入的记录数、压缩前与压缩后的字节数
+        serialize_seconds / write_seconds：序列化与写入的耗时
+        queue_wait_seconds：写入进程在 queue.get 上等待的时间
+        rotations：切换到下一个文件的次数
+    """
+
+    def __init__(
+        self,
+        name: str = "writer",
+        interval: Optional[float] = 60,
+        path: Optional[Union[Path, str]] = None
+    ):
+        self.name = name
+        self.interval = interval
+        self.path = Path(path) if path else None
+
+        self.records = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.serialize_seconds = 0.0
+        self.write_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+        self.rotations = 0
+
+        self.start_time = time.monotonic()
+        self._next_report = self.start_time + (interval or 0)
+
+    def to_dict(self) -> dict:
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        return {
+            "name": self.name,
+            "elapsed_seconds": elapsed,
+            "records": self.records,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "records_per_second": self.records / elapsed,
+            "raw_bytes_per_second": self.raw_bytes / elapsed,
+            "compressed_bytes_per_second": self.compressed_bytes / elapsed,
+            "serialize_seconds": self.serialize_seconds,
+            "write_seconds": self.write_seconds,
+            "queue_wait_seconds": self.queue_wait_seconds,
+            "rotations": self.rotations,
+        }
+
+    def maybe_report(self):
+        """距离上次输出超过 interval 秒时输出统计。"""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next_report:
+            return
+        self._next_report = now + self.interval
+        self.report()
+
+    def report(self):
+        stats = self.to_dict()
+        logger.info(
+            f"[{self.name}] {stats['records']} records, "
+            f"{stats['records_per_second']:.1f} records/s, "
+            f"{stats['raw_bytes_per_second'] / (1 << 20):.2f} MB/s raw, "
+            f"{stats['compressed_bytes_per_second'] / (1 << 20):.2f} MB/s compressed, "
+            f"serialize {stats['serialize_seconds']:.1f}s, write {stats['write_seconds']:.1f}s, "
+            f"queue wait {stats['queue_wait_seconds']:.1f}s, rotations {stats['rotations']}"
+        )
+        self.save()
+
+    def finish(self):
+        """写入结束时调用：输出最终的统计（interval 为 None 时只保存 JSON 文件）。"""
+        if self.interval:
+            self.report()
+        else:
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+        os.replace(tmp_path, self.path)
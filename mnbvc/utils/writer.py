@@ -1,15 +1,228 @@
 import gzip
 import json
+import logging
+import os
+import shutil
+import struct
+import time
 from multiprocessing import Queue
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel
 
+from mnbvc.utils import profiling
+from mnbvc.utils.index import ShardIndexWriter, index_path_for
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.stats import WriterStats
+
+logger = logging.getLogger(__name__)
+
+# 索引中记录的键默认使用的字段
+DEFAULT_INDEX_KEY = "文件名"
+
+# 关闭 gzip 块时还会写入的数据：最后的压缩块与 8 字节的 crc32、长度
+_GZIP_TRAILER_SIZE = 16
+# deflate 压缩后大小的上限：无法压缩的数据按 stored 块写入，每 64 KB 增加 5 字节
+_GZIP_MAX_RATIO = 1.001
+
+
+def serialize_record(data) -> bytes:
+    """将一条记录序列化为 bytes（不包括换行）。
+
+    支持 bytes、str、pydantic 模型（按别名导出）以及可以 JSON 序列化的对象。
+    """
+    if type(data) is bytes:
+        return data
+    elif type(data) is str:
+        return data.encode()
+    if isinstance(data, BaseModel):
+        data = data.model_dump(by_alias=True)
+    data_str = json.dumps(data, ensure_ascii=False)
+    return data_str.encode()
+
+
+def serialize_keyed(data, index_key: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """序列化一条记录，同时取出索引的键（index_key 字段）。
+
+    index_key 为 None，或者记录已经是 bytes/str 时，键为 None（写入时再从 JSON 中解析）。
+    """
+    key = None
+    if index_key is not None:
+        if isinstance(data, BaseModel):
+            data = data.model_dump(by_alias=True)
+        if isinstance(data, dict):
+            key = str(data.get(index_key, ""))
+    return serialize_record(data), key
+
+
+def key_from_json(data: bytes, index_key: str) -> str:
+    """从已经序列化的 JSON 记录中解析索引的键，无法解析时为空字符串。"""
+    try:
+        obj = json.loads(data)
+    except ValueError:
+        return ""
+    if isinstance(obj, dict):
+        return str(obj.get(index_key, ""))
+    return ""
+
+
+class RecordBatch(bytes):
+    """一批已经序列化的记录，用于在进程间传递。
+
+    格式：每条记录前有 8 字节（小端）的头：键的长度与记录的长度，之后依次为键（UTF-8）与记录。
+    没有键时键的长度为 0xFFFFFFFF。
+    worker 进程负责序列化并取出索引的键，写入进程只需要拆分并写入，不再需要 pickle 或解析语料。
+    """
+
+    __slots__ = ()
+
+    _header = struct.Struct("<II")
+    _NO_KEY = 0xFFFFFFFF
+
+    @classmethod
+    def pack(cls, records: List[bytes], keys: Optional[List[Optional[str]]] = None) -> "RecordBatch":
+        parts = []
+        for idx, record in enumerate(records):
+            key = keys[idx] if keys is not None else None
+            if key is None:
+                parts.append(cls._header.pack(cls._NO_KEY, len(record)))
+            else:
+                key = key.encode("utf-8", errors="surrogatepass")
+                parts.append(cls._header.pack(len(key), len(record)))
+                parts.append(key)
+            parts.append(record)
+        return cls(b"".join(parts))
+
+    def unpack_keyed(self) -> Iterator[Tuple[bytes, Optional[str]]]:
+        """依次返回 (记录，键)，没有键时为 None。"""
+        data = bytes(self)
+        offset = 0
+        header_size = self._header.size
+        while offset < len(data):
+            key_size, size = self._header.unpack_from(data, offset)
+            offset += header_size
+            key = None
+            if key_size != self._NO_KEY:
+                key = data[offset: offset + key_size].decode("utf-8", errors="surrogatepass")
+                offset += key_size
+            yield data[offset: offset + size], key
+            offset += size
+
+    def unpack(self) -> Iterator[bytes]:
+        for record, _ in self.unpack_keyed():
+            yield record
+
+
+class RecordBatchSender:
+    """在 worker 中序列化记录，并按批放入写入队列。
+
+    队列应当有大小限制（例如 mnbvc.utils.memory.ByteBoundedQueue(256 << 20)，或者 Queue(maxsize=64)），
+    这样写入速度跟不上时 worker 会阻塞，而不是在内存中堆积数据。
+    每批的大小不同，按字节限制比按条数限制更能控制内存。
+
+    用法：
+        with RecordBatchSender(queue) as sender:
+            for corpus in converter.convert():
+                sender.send(corpus)
+
+    写入的文件建立索引时，index_key 应与 writer 的相同，键在 worker 中取出，写入进程不需要解析 JSON。
+    """
+
+    def __init__(self, queue: Queue, batch_size: int = 1 << 20, index_key: Optional[str] = None):
+        self.queue = queue
+        self.batch_size = batch_size  # 每批的字节数
+        self.index_key = index_key
+        self.records = []
+        self.keys = []
+        self.records_size = 0
+
+    def send(self, data):
+        record, key = serialize_keyed(data, self.index_key)
+        self.records.append(record)
+        self.keys.append(key)
+        self.records_size += len(record)
+        if self.records_size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.records:
+            self.queue.put(RecordBatch.pack(self.records, self.keys))
+        self.records = []
+        self.keys = []
+        self.records_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.flush()
+
+
+class _CountingFile:
+    """包装一个二进制文件，统计实际写入磁盘的字节数。
+
+    gzip 压缩时，GzipFile 会把压缩后的数据写入此对象，
+    因此 bytes_written 即为压缩后的文件大小（不包括 zlib 内部尚未输出的缓冲）。
+    """
+
+    def __init__(self, fp, bytes_written: int = 0):
+        self.fp = fp
+        self.bytes_written = bytes_written  # 追加写入时为文件原有的大小
+
+    @property
+    def name(self):
+        return self.fp.name
+
+    def write(self, data):
+        size = self.fp.write(data)
+        self.bytes_written += size
+        return size
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
 
 class SizeLimitedFileWriter:
     """用于写入限制大小的文件。
 
     使用场景：可以使用此类生成大小需要限制在 500 MB 左右的 jsonl 文件。
+
+    文件大小按磁盘上的实际大小计算：使用 .gz 文件名时按压缩后的大小切分文件。
+    写入记录会超过限制时先切换到下一个文件，因此文件不会超过 file_size_limit_mb（单条记录超过限制时除外）。
+    gzip 文件中 zlib 还没有输出的数据按不压缩估计大小的上限，超过限制时才 flush 压缩数据得到准确的大小：
+    只有剩余空间小于未输出的数据时才会 flush，每个文件只有几十次，对压缩率的影响可以忽略。
+    如果设置 file_records_limit，则每个文件最多写入该数量的记录（writeline 的次数）。
+
+    大量小记录可以使用 write_many 批量写入：记录先序列化并累积到缓冲区，
+    缓冲区达到 write_buffer_size 字节后一次性写入。
+
+    atomic 为 True 时，文件先写入 "<文件名>.tmp"，写完（切换到下一个文件或 close）后才重命名，
+    因此程序中断时不会留下看起来完整的半个文件。
+    传入 manifest 时，会记录每个输入文件（begin_input/end_input 之间写入的记录）
+    所在的文件与行号范围，并跳过 manifest 中已经存在的文件名，用于中断后继续运行。
+
+    index 为 True 时，每个文件旁边会生成 "<文件名>.idx" 索引（见 mnbvc.utils.index），
+    记录每条记录的位置、crc32 以及 index_key 字段（默认为 "文件名"），可以随机读取记录。
+    gzip 文件会每隔 index_block_size 字节（压缩前）开始一个新的 gzip 块，
+    读取一条记录最多只需要解压一个块。
+
+    stats 记录写入速度、序列化与写入耗时以及文件切换次数（见 mnbvc.utils.stats），
+    每隔 stats_interval 秒输出到日志，设置 stats_path 时同时保存为 JSON 文件，close 时输出最终的统计。
+    stats_name 为日志中的名字，默认为输出文件夹。
+    多个 writer 可以共用一个 WriterStats（参数 stats，例如 RoutingWriter），
+    此时 stats_interval 等参数不起作用，close 也不输出统计，由 stats 的所有者调用 stats.finish()。
+
+    compresslevel 为 gzip 的压缩等级（1-9），默认 9；CPU 是瓶颈时可以调低以换取速度。
+
+    append_shard 为之前同样参数的 writer 写入的最后一个文件（shards 中的一项）：
+    第一个文件名与之相同并且没有写满时，继续追加写入这个文件（gzip 文件追加一个新的块），
+    大小、记录数与索引从这个文件继续计算；否则跳过这个文件名。
+    atomic 为 True 时新的记录先写入 "<文件名>.tmp"，写完后才拼接到原文件末尾，不复制原文件；
+    拼接中断留下的多余数据在下一次追加时按 append_shard 的大小截掉。
     """
 
     def __init__(
@@ -19,12 +232,25 @@ class SizeLimitedFileWriter:
         filename_idx_width=3,
         filename_idx_stride=1,
         filename_fmt="{}.jsonl",  # .jsonl.gz
-        file_size_limit_mb=500
+        file_size_limit_mb=500,
+        file_records_limit=None,
+        write_buffer_size=1 << 20,
+        atomic=True,
+        manifest: Optional[RunManifest] = None,
+        index=False,
+        index_key=DEFAULT_INDEX_KEY,
+        index_block_size=1 << 20,
+        stats_interval=60,
+        stats_path=None,
+        stats_name=None,
+        stats: Optional[WriterStats] = None,
+        compresslevel=9,
+        append_shard: Optional[dict] = None,
       ):
         # 文件存储相关： 文件夹
         self.output_folder = Path(output_folder)
-        if not self.output_folder.exists():
-            self.output_folder.mkdir()
+        # 多个进程可能同时创建同一个文件夹
+        self.output_folder.mkdir(parents=True, exist_ok=True)
 
         # 文件存储相关： 文件名生成规律
         self.filename_idx_current = filename_idx_first  # 第一个文件编号
@@ -39,95 +265,482 @@ class SizeLimitedFileWriter:
                 f"File size limit must be positive, got {file_size_limit_mb}")
         self.file_size_limit = int(
             file_size_limit_mb * (1 << 20))  # MB -> Bytes
-        self.file_size_current = 0
+        self.file_size_current = 0  # 磁盘上的大小（压缩后）
+        self.raw_size_current = 0  # 写入的原始数据大小（压缩前）
+
+        # 文件记录数相关
+        if (file_records_limit is not None) and (file_records_limit <= 0):
+            raise Exception(
+                f"File records limit must be positive, got {file_records_limit}")
+        self.file_records_limit = file_records_limit
+        self.file_records_current = 0
+
+        # 批量写入时缓冲区的大小
+        self.write_buffer_size = max(int(write_buffer_size), 1)
+
+        # 已经写完的文件信息，可用于生成 manifest
+        self.shards = []
+        self.atomic = atomic
+        self.manifest = manifest
+        self.input_current = None  # 正在写入的输入文件
+        self._input_segments = []  # 正在写入的输入文件对应的记录范围
+        self._input_fingerprint = None  # 正在写入的输入文件的指纹
+        self._input_start = 0  # 正在写入的输入文件在当前文件中的起始行号
+        self._inputs_pending = []  # 已经结束但所在文件还没有写完的输入文件
+        self._inputs_failed = []  # 出错但已经写入了记录的输入文件，所在文件写完时记录为 partial
+
+        # 索引相关
+        self.index = index
+        self.index_key = index_key
+        self.index_block_size = index_block_size
+        self._index_writer = None
+        self._block_offset = 0  # 当前 gzip 块在文件中的位置
+        self._block_raw_size = 0  # 当前 gzip 块压缩前的大小
+        self._synced_raw_size = 0  # file_size_current 准确时（没有 zlib 缓冲的数据）压缩前的大小
+
+        # 统计相关
+        self._owns_stats = stats is None
+        if stats is None:
+            stats = WriterStats(
+                name=stats_name or str(self.output_folder), interval=stats_interval, path=stats_path)
+        self.stats = stats
 
         self.fp = None
-        self._open = open
-        if filename_fmt.endswith(".gz"):
-            self._open = gzip.open
+        self.filepath_current = None
+        self._raw_fp = None
+        self.compress = filename_fmt.endswith(".gz")
+        self.compresslevel = compresslevel  # gzip 压缩等级 1-9，越小越快
+        self._append_shard = append_shard  # 第一个文件继续写入的文件信息
+        self._appending = False  # 当前文件是否为追加写入（atomic 时 .tmp 中只有新的记录）
         self.open_next_file()
 
     def next_filepath(self):
-        """生成下一个文件路径。
+        """生成下一个文件路径。继续运行时跳过 manifest 中已经写完的文件。
         """
-        filename_idx = str(self.filename_idx_current)
-        if len(filename_idx) < self.filename_idx_width:
-            filename_idx = "0" * (self.filename_idx_width -
-                                  len(filename_idx)) + filename_idx
-        filepath = self.filename_fmt.format(filename_idx)
-        filepath = self.output_folder / filepath
+        while True:
+            filename_idx = str(self.filename_idx_current)
+            if len(filename_idx) < self.filename_idx_width:
+                filename_idx = "0" * (self.filename_idx_width -
+                                      len(filename_idx)) + filename_idx
+            filepath = self.filename_fmt.format(filename_idx)
+            filepath = self.output_folder / filepath
 
-        self.filename_idx_current += self.filename_idx_stride
+            self.filename_idx_current += self.filename_idx_stride
 
-        return filepath
+            if (self.manifest is None) or (filepath.name not in self.manifest.shards):
+                return filepath
 
     def open_next_file(self):
         """打开下一个文件以供写入。
         """
-        self.close()
+        self._end_input_segment()
+        if self.fp is not None:
+            self.stats.rotations += 1
+        self._close_file()
         path = self.next_filepath()
-        self.fp = self._open(path, "wb")
-        self.file_size_current = 0
+        shard, self._append_shard = self._append_shard, None
+        if (shard is not None) and (shard["path"] == path.name) and (not self._can_append(path, shard)):
+            path = self.next_filepath()
+            shard = None
+        if (shard is not None) and (shard["path"] != path.name):
+            shard = None
+        self.filepath_current = path
+        self._input_start = 0
+        self._appending = shard is not None
+        if shard is not None:
+            self._open_append(path, shard)
+            return
+        if self.atomic:
+            path = self._tmp_path(path)
+        self._raw_fp = _CountingFile(open(path, "wb"))
+        if self.compress:
+            self._open_gzip_block()
+        else:
+            self.fp = self._raw_fp
+        if self.index:
+            self._index_writer = ShardIndexWriter(compressed=self.compress)
+
+    def _can_append(self, path: Path, shard: dict) -> bool:
+        """文件存在、没有写满，并且需要索引时索引文件也存在。"""
+        if (not path.exists()) or (path.stat().st_size < shard["size"]):
+            return False
+        if self.index and (not index_path_for(path).exists()):
+            return False
+        if shard["size"] >= self.file_size_limit:
+            return False
+        return (self.file_records_limit is None) or (shard["records"] < self.file_records_limit)
+
+    def _open_append(self, path: Path, shard: dict):
+        """继续写入之前没有写满的文件。
+
+        atomic 为 True 时新的记录写入临时文件，写完后才拼接到原文件末尾并替换索引：
+        中断或 abort 时原来的文件与索引保持不变。原文件不会被复制，只需要读取其索引。
+        """
+        if path.stat().st_size > shard["size"]:
+            # 上一次拼接没有完成，原文件末尾多出的数据不在 shard 与索引中
+            os.truncate(path, shard["size"])
+        if self.index:
+            self._index_writer = ShardIndexWriter.load(index_path_for(path))
+        if self.atomic:
+            path = self._tmp_path(path)
+            self._raw_fp = _CountingFile(open(path, "wb"), shard["size"])
+        else:
+            self._raw_fp = _CountingFile(open(path, "ab"), shard["size"])
+        self.file_size_current = shard["size"]
+        self.raw_size_current = shard["raw_size"]
+        self.file_records_current = shard["records"]
+        self._input_start = self.file_records_current
+        if self.compress:
+            self._open_gzip_block()
+        else:
+            self.fp = self._raw_fp
+
+    def _open_gzip_block(self):
+        """在当前文件中开始一个新的 gzip 块（member）。多个块拼接仍然是合法的 gzip 文件。"""
+        self._block_offset = self._raw_fp.bytes_written
+        self._block_raw_size = 0
+        self._synced_raw_size = self.raw_size_current
+        self.fp = gzip.GzipFile(
+            filename=self.filepath_current.name, mode="wb", fileobj=self._raw_fp,
+            compresslevel=self.compresslevel)
 
     def close(self):
+        self.end_input()
+        if self.fp is not None:
+            self._close_file()
+            if self._owns_stats:
+                self.stats.finish()
+
+    def _close_file(self):
+        if self.fp is not None:
+            self.fp.close()
+            if self.fp is not self._raw_fp:
+                # GzipFile 不会关闭外部传入的 fileobj
+                self._raw_fp.close()
+            self.stats.compressed_bytes += self._raw_fp.bytes_written - self.file_size_current
+            if self.atomic and self._appending:
+                # 先拼接记录再替换索引：索引中的记录总是在文件中
+                self._publish_append()
+            if self._index_writer is not None:
+                index_path = index_path_for(self.filepath_current)
+                if self.atomic:
+                    self._index_writer.save(self._tmp_path(index_path))
+                    os.replace(self._tmp_path(index_path), index_path)
+                else:
+                    self._index_writer.save(index_path)
+                self._index_writer = None
+            if self.atomic and (not self._appending):
+                os.replace(self._tmp_path(self.filepath_current), self.filepath_current)
+            shard = {
+                "path": self.filepath_current.name,
+                "records": self.file_records_current,
+                "size": self._raw_fp.bytes_written,
+                "raw_size": self.raw_size_current,
+            }
+            self.shards.append(shard)
+            logger.info(
+                f"Finished {shard['path']}: {shard['records']} records, {shard['size']} bytes")
+            self.fp = None
+            self._raw_fp = None
+            self._commit_manifest(shard)
+        self.file_size_current = 0
+        self.raw_size_current = 0
+        self.file_records_current = 0
+
+    def _publish_append(self):
+        """把追加写入的新记录（临时文件）拼接到原文件末尾。"""
+        tmp_path = self._tmp_path(self.filepath_current)
+        with open(tmp_path, "rb") as src, open(self.filepath_current, "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        tmp_path.unlink()
+
+    def abort(self):
+        """放弃当前正在写入的文件，以及还没有写完的输入文件记录。"""
         if self.fp is not None:
             self.fp.close()
+            if self.fp is not self._raw_fp:
+                self._raw_fp.close()
+            if self.atomic:
+                self._tmp_path(self.filepath_current).unlink(missing_ok=True)
             self.fp = None
-            self.file_size_current = 0
+            self._raw_fp = None
+            self._index_writer = None
+        self.input_current = None
+        self._input_segments = []
+        self._inputs_pending = []
+        self._inputs_failed = []
+        self.file_size_current = 0
+        self.raw_size_current = 0
+        self.file_records_current = 0
+
+    def begin_input(self, input_path):
+        """开始写入一个输入文件的记录。"""
+        if self.input_current is not None:
+            self.end_input()
+        self.input_current = input_path
+        self._input_segments = []
+        self._input_start = self.file_records_current
+        # 开始转换时的指纹：转换过程中输入改变时，下一次运行会重新转换
+        self._input_fingerprint = (
+            self.manifest.fingerprint(input_path) if self.manifest is not None else None)
+
+    def end_input(self, done: bool = True):
+        """结束当前输入文件。所在文件写完后，此输入文件才会记录到 manifest。
+
+        done 为 False 时（比如转换出错）不记录此输入文件，继续运行时会重新处理。
+        """
+        if self.input_current is None:
+            return
+        self._end_input_segment()
+        if done:
+            self._inputs_pending.append(
+                (self.input_current, self._input_segments, self._input_fingerprint))
+        elif self._input_segments:
+            self._inputs_failed.append((self.input_current, self._input_segments))
+        self.input_current = None
+        self._input_segments = []
+
+    def _end_input_segment(self):
+        """记录当前输入文件在当前文件中的行号范围。"""
+        if (self.input_current is None) or (self.fp is None):
+            return
+        if self.file_records_current > self._input_start:
+            self._input_segments.append({
+                "shard": self.filepath_current.name,
+                "start": self._input_start,
+                "end": self.file_records_current,
+            })
+        self._input_start = self.file_records_current
+
+    def _commit_manifest(self, shard: dict):
+        """文件写完后，将其与已经结束的输入文件记录到 manifest。"""
+        if self.manifest is None:
+            return
+        self.manifest.add_shard(shard)
+        for input_path, segments, fingerprint in self._inputs_pending:
+            self.manifest.add_input(input_path, segments, fingerprint)
+        self._inputs_pending = []
+        for input_path, segments in self._inputs_failed:
+            self.manifest.set_partial(input_path, [dict(segment) for segment in segments])
+        self._inputs_failed = []
+        # 正在写入的输入已经有记录写入完整的文件：中断后继续运行时先删除这些记录
+        if self.input_current is not None:
+            self.manifest.set_partial(
+                self.input_current, [dict(segment) for segment in self._input_segments])
+        self.manifest.save()
+
+    @staticmethod
+    def _tmp_path(path: Path) -> Path:
+        return path.with_name(path.name + ".tmp")
 
     def is_full(self):
-        return self.file_size_current >= self.file_size_limit
+        if self.file_size_current >= self.file_size_limit:
+            return True
+        if self.file_records_limit is None:
+            return False
+        return self.file_records_current >= self.file_records_limit
 
     def write(self, data, force=False):
         if self.is_full() and (not force):
             self.open_next_file()
 
+        start = time.perf_counter()
         data = self._convert_obj_to_bytes(data)
-        self.file_size_current += self.fp.write(data)
+        size = self.fp.write(data)
+        self.raw_size_current += size
+        self._block_raw_size += size
+        # 只读取计数，不强制 flush：压缩数据由 zlib 按块输出
+        self.stats.compressed_bytes += self._raw_fp.bytes_written - self.file_size_current
+        self.file_size_current = self._raw_fp.bytes_written
+        self.stats.raw_bytes += size
+        seconds = time.perf_counter() - start
+        self.stats.write_seconds += seconds
+        profiling.record("write", seconds)
 
     def writeline(self, data):
-        self.write(data)
-        self.write(b"\n", force=True)
+        data, key = self._serialize(data)
+        self._write_records([data + b"\n"], [key])
 
-    def _convert_obj_to_bytes(self, data):
+    def write_many(self, records):
+        """批量写入多条记录，每条记录占一行。
+
+        记录不会被拆分到两个文件中：加上一条记录会超过当前文件的限制时，先写入缓冲区中的记录，
+        这条记录写入下一个文件。
+        """
+        self._write_serialized(self._serialize(data) for data in records)
 
-        if type(data) is bytes:
-            return data
-        elif type(data) is str:
-            return data.encode()
+    def write_batch(self, batch: RecordBatch):
+        """写入一个 RecordBatch，使用其中的键建立索引。"""
+        self._write_serialized(
+            self._serialized_key(data, key) for data, key in batch.unpack_keyed())
+
+    def _write_serialized(self, records: Iterable[Tuple[bytes, str]]):
+        buffer = []
+        keys = []
+        buffer_size = 0
+        for data, key in records:
+            data += b"\n"
+            if buffer and (not self._fits(buffer_size + len(data), len(buffer) + 1)):
+                self._write_records(buffer, keys)
+                buffer = []
+                keys = []
+                buffer_size = 0
+            buffer.append(data)
+            keys.append(key)
+            buffer_size += len(data)
+            if buffer_size >= self.write_buffer_size:
+                self._write_records(buffer, keys)
+                buffer = []
+                keys = []
+                buffer_size = 0
+        if buffer:
+            self._write_records(buffer, keys)
+
+    def _estimated_size(self, size):
+        """再写入 size 字节（压缩前）后当前文件大小的上限。
+
+        gzip 文件中 zlib 还没有输出的数据与 size 按不压缩计算。压缩率随数据变化，按之前的压缩率估计可能偏小；
+        还没有输出的数据中的一部分可能已经计入 file_size_current，因此上限可能偏大，flush 后是准确的。
+        """
+        if not self.compress:
+            return self.file_size_current + size
+        pending = self.raw_size_current - self._synced_raw_size + size
+        return self.file_size_current + int(pending * _GZIP_MAX_RATIO) + _GZIP_TRAILER_SIZE
+
+    def _fits(self, size, records):
+        """当前文件是否还可以写入 size 字节、records 条记录。"""
+        if (self.file_records_limit is not None) and (self.file_records_current + records > self.file_records_limit):
+            return False
+        if self._estimated_size(size) <= self.file_size_limit:
+            return True
+        if self.compress and (self.raw_size_current > self._synced_raw_size):
+            # 上限超过限制：输出 zlib 中缓冲的数据，按准确的大小再判断一次
+            self._sync_gzip()
+            return self._estimated_size(size) <= self.file_size_limit
+        return False
+
+    def _sync_gzip(self):
+        self.fp.flush()
+        self.stats.compressed_bytes += self._raw_fp.bytes_written - self.file_size_current
+        self.file_size_current = self._raw_fp.bytes_written
+        self._synced_raw_size = self.raw_size_current
+
+    def _serialize(self, data):
+        """序列化一条记录。建立索引时同时取出记录的键。"""
+        start = time.perf_counter()
+        serialized = isinstance(data, (bytes, str))
+        data, key = serialize_keyed(data, self.index_key if self.index else None)
+        seconds = time.perf_counter() - start
+        self.stats.serialize_seconds += seconds
+        if not serialized:
+            # 已经序列化的记录（例如 run_conversion 的 ordered 模式）在子进程中计时
+            profiling.record("serialize", seconds)
+        return self._serialized_key(data, key)
+
+    def _serialized_key(self, data: bytes, key: Optional[str]) -> Tuple[bytes, str]:
+        """已经序列化的记录没有键时，建立索引需要从 JSON 中解析。"""
+        if not self.index:
+            return data, ""
+        if key is None:
+            key = key_from_json(data, self.index_key)
+        return data, key
+
+    def _write_records(self, buffer, keys):
+        """将多条以换行结尾的记录一次写入同一个文件。写入后会超过限制时先切换到下一个文件。"""
+        if self.is_full() or (
+                (self.file_records_current > 0) and (not self._fits(sum(map(len, buffer)), len(buffer)))):
+            self.open_next_file()
+        if self._index_writer is not None:
+            self._index_records(buffer, keys)
+        self.write(b"".join(buffer), force=True)
+        self.file_records_current += len(buffer)
+        self.stats.records += len(buffer)
+        self.stats.maybe_report()
+
+    def _index_records(self, buffer, keys):
+        if self.compress:
+            if self._block_raw_size >= self.index_block_size:
+                self.fp.close()
+                self.stats.compressed_bytes += self._raw_fp.bytes_written - self.file_size_current
+                self.file_size_current = self._raw_fp.bytes_written
+                self._open_gzip_block()
+            block_offset = self._block_offset
+            offset = self._block_raw_size
         else:
-            data_str = json.dumps(data, ensure_ascii=False)
-            return data_str.encode()
+            block_offset = 0
+            offset = self.raw_size_current
+        for data, key in zip(buffer, keys):
+            if self.compress:
+                self._index_writer.add(block_offset, offset, data[:-1], key)
+            else:
+                self._index_writer.add(offset, 0, data[:-1], key)
+            offset += len(data)
+
+    def _convert_obj_to_bytes(self, data):
+        return serialize_record(data)
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, valce, traceback):
-        self.close()
+        if type is None:
+            self.close()
+        else:
+            self.abort()
 
     def __del__(self):
-        self.close()
+        # 输入文件没有正常结束（比如程序异常退出），不保留当前文件
+        if getattr(self, "input_current", None) is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def update_writer_kwargs(writer_kwargs: dict, options: Optional[dict] = None) -> dict:
+    """用 options（例如命令行参数）覆盖 SizeLimitedFileWriter 的参数，返回新的字典。
+
+    options 中设置了 compresslevel 而 filename_fmt 不是 .gz 时，输出改为 gzip 压缩（加上 .gz）。
+    """
+    writer_kwargs = dict(writer_kwargs)
+    options = {key: val for key, val in (options or {}).items() if val is not None}
+    writer_kwargs.update(options)
+    filename_fmt = writer_kwargs.get("filename_fmt", "{}.jsonl")
+    if ("compresslevel" in options) and (not filename_fmt.endswith(".gz")):
+        writer_kwargs["filename_fmt"] = filename_fmt + ".gz"
+    return writer_kwargs
+
+
+def _write_queue_item(writer: SizeLimitedFileWriter, data):
+    """写入队列中的一项：RecordBatch 或者单条记录。"""
+    if isinstance(data, RecordBatch):
+        writer.write_batch(data)
+    else:
+        writer.writeline(data)
 
 
 def writer_worker_for_thread(writer: SizeLimitedFileWriter, queue: Queue):
-    """用于多线程。"""
+    """用于多线程。
+
+    队列中可以是单条记录，也可以是 RecordBatchSender 发送的 RecordBatch。"""
     while True:
+        start = time.perf_counter()
         data = queue.get()
+        writer.stats.queue_wait_seconds += time.perf_counter() - start
         if data is None:
             break
-        if isinstance(data, BaseModel):
-            data = data.model_dump(by_alias=True)
-        writer.writeline(data)
+        _write_queue_item(writer, data)
 
 
 def writer_worker(writer_kwargs: dict, queue: Queue):
+    """用于多进程/线程。
+
+    队列中可以是单条记录，也可以是 RecordBatchSender 发送的 RecordBatch。"""
     writer = SizeLimitedFileWriter(**writer_kwargs)
-    """用于多进程/线程。"""
     while True:
+        start = time.perf_counter()
         data = queue.get()
+        writer.stats.queue_wait_seconds += time.perf_counter() - start
         if data is None:
             break
-        if isinstance(data, BaseModel):
-            data = data.model_dump(by_alias=True)
-        writer.writeline(data)
+        _write_queue_item(writer, data)
     writer.close()
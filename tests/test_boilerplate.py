@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+from mnbvc.utils.boilerplate import BoilerplateStripper, Rule, format_date
+
+HEADER = "欢迎访问:   www.txtsk.com.cn"
+FOOTER = "更多免费txt电子书，欢迎您到www.txtsk.com.cn下载"
+
+
+def _txtsk(text):
+    """原来的 preprocessing_txtsk。"""
+    header_idx = text.find(HEADER)
+    if header_idx != -1:
+        text = text[header_idx + len(HEADER):].strip()
+    footer_idx = text.find(FOOTER)
+    if footer_idx != -1:
+        text = text[:footer_idx].strip()
+    return text
+
+
+@pytest.mark.parametrize("text", [
+    f"  头部\n{HEADER}\n  正文  \n{FOOTER}\n尾部",
+    f"{HEADER}\n正文\n",
+    f"\n正文\n{FOOTER}",
+    "\n  没有页眉与页脚的正文  \n",
+])
+def test_strip_unmatched(text):
+    rules = [Rule("header", HEADER), Rule("footer", FOOTER)]
+    stripper = BoilerplateStripper(rules, strip_unmatched=False)
+    assert stripper.strip(text) == (_txtsk(text), {})
+    # 默认总是去掉首尾的空白
+    assert BoilerplateStripper(rules).strip(text)[0] == _txtsk(text).strip()
+
+
+def test_rules():
+    stripper = BoilerplateStripper([
+        Rule("inline", "| 注册 | 登陆 |"),
+        Rule("footer", "| 设为首页 |"),
+        Rule("attribute", r"创建时间：(\d+)-(\d+)-(\d+)", regex=True,
+             name="create_time", region="footer", convert=format_date),
+        Rule("attribute", r"作者：(\w+)", regex=True, name="author", region="body"),
+    ])
+    text = "| 注册 | 登陆 |第一段 作者：张三\n| 注册 | 登陆 |第二段\n| 设为首页 | 创建时间：2023-1-11"
+    assert stripper.strip(text) == ("第一段 作者：张三\n第二段", {"create_time": "20230111", "author": "张三"})
+    with pytest.raises(Exception, match="Unknown boilerplate rule kind"):
+        BoilerplateStripper([Rule("missing", "x")])
+
+
+def test_longest_literal():
+    stripper = BoilerplateStripper([Rule("inline", "ab"), Rule("inline", "abc"), Rule("inline", "ac")])
+    assert re.fullmatch(stripper._regex, "abc")
+    assert stripper.strip("xabcyacz") == ("xyz", {})
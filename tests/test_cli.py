@@ -0,0 +1,81 @@
+import gzip
+import json
+import logging
+import os
+
+import pytest
+
+from mnbvc import cli
+from mnbvc.utils import memory
+
+
+def _main_with_writer(input_folder, output_folder=None, workers=4, resume=True, writer_options=None):
+    pass
+
+
+def _main_without_writer(input_path, limit=None):
+    pass
+
+
+def _kwargs(main, argv):
+    parser = cli.build_parser()
+    args = parser.parse_args(argv)
+    return cli.get_main_kwargs(parser, main, args)
+
+
+def test_main_kwargs():
+    argv = ["cmb", "--input", "in", "--output", "out", "--workers", "2", "--no-resume",
+            "--compress-level", "6", "--shard-size", "100"]
+    assert _kwargs(_main_with_writer, argv) == {
+        "input_folder": "in", "output_folder": "out", "workers": 2, "resume": False,
+        "writer_options": {"compresslevel": 6, "file_size_limit_mb": 100.0},
+    }
+    # 没有指定的参数不传入，使用样例中的默认值；--input 对应 input_path
+    assert _kwargs(_main_with_writer, ["cmb"]) == {}
+    assert _kwargs(_main_without_writer, ["newsdialog", "--input", "a.json", "--limit", "3"]) == {
+        "input_path": "a.json", "limit": 3}
+
+
+@pytest.mark.parametrize("argv", [
+    ["newsdialog", "--workers", "2"],
+    ["newsdialog", "--resume"],
+    ["newsdialog", "--shard-size", "1"],
+    ["cmb", "--compress-level", "0"],
+    ["missing"],
+])
+def test_invalid_arguments(argv, capsys):
+    # 样例不支持的参数报错，而不是被忽略
+    with pytest.raises(SystemExit):
+        _kwargs(_main_without_writer, argv)
+
+
+@pytest.fixture
+def restore_logger():
+    """样例的 main 会给 mnbvc.utils 的 logger 增加日志文件并设置等级，测试结束后恢复。"""
+    logger = logging.getLogger("mnbvc.utils")
+    handlers, level = list(logger.handlers), logger.level
+    yield
+    for handler in logger.handlers[len(handlers):]:
+        handler.close()
+    logger.handlers = handlers
+    logger.setLevel(level)
+
+
+def test_run(tmp_path, monkeypatch, restore_logger):
+    # run 会设置环境变量，测试结束后恢复
+    monkeypatch.setenv(memory.ENV_VAR, "")
+    input_path = tmp_path / "news_dialogue.json"
+    dialogs = [
+        {"id": f"NPR-{idx}", "date": "2020-01-02", "url": "u", "summary": "s", "program": "p",
+         "utt": ["a", "b"], "speaker": ["x", "y"]}
+        for idx in range(5)
+    ]
+    input_path.write_text(json.dumps(dialogs))
+    output = tmp_path / "output"
+    assert cli.run([
+        "newsdialog", "--input", str(input_path), "--output", str(output), "--log", str(tmp_path / "log.txt"),
+        "--workers", "1", "--limit", "3", "--compress-level", "1", "--memory-limit", "512",
+    ]) == 0
+    assert os.environ[memory.ENV_VAR] == "512.0"
+    with gzip.open(output / "000000.jsonl.gz", "rt", encoding="utf-8") as fp:
+        assert [json.loads(line)["ID"] for line in fp] == [0, 1, 2]
@@ -0,0 +1,109 @@
+import codecs
+
+import pytest
+
+from mnbvc.utils import decoding
+from mnbvc.utils.decoding import EncodingDetector
+
+
+@pytest.fixture
+def passes(monkeypatch):
+    """统计读取整个文件的次数。"""
+    calls = []
+    iter_decoded_chunks = decoding.iter_decoded_chunks
+
+    def counting(path, encoding, *args, **kwargs):
+        calls.append(encoding)
+        return iter_decoded_chunks(path, encoding, *args, **kwargs)
+
+    monkeypatch.setattr(decoding, "iter_decoded_chunks", counting)
+    return calls
+
+
+def _detector():
+    return EncodingDetector(sample_size=16, large_file_size=32, chunk_size=7, use_chardet=False)
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "GB18030"])
+def test_read_large(tmp_path, passes, encoding):
+    text = "中文文本，用于测试按块解码。\n" * 10
+    path = tmp_path / "a.txt"
+    path.write_bytes(text.encode(encoding))
+    result = _detector().read_text(path)
+    assert (result.text, result.encoding, result.replacements) == (text, encoding, 0)
+    assert len(passes) == 1
+
+
+def test_read_large_replace(tmp_path, passes):
+    # 开头是 GB18030，之后有无法解码的字节：utf-8 不会用于尝试整个文件
+    data = "中文文本".encode("GB18030") * 5 + b"\xff" + "结束".encode("GB18030")
+    path = tmp_path / "a.txt"
+    path.write_bytes(data)
+    result = _detector().read_text(path)
+    assert result.encoding == "GB18030"
+    assert result.replacements == 1
+    assert result.text == "中文文本" * 5 + "�" + "结束"
+    assert passes == ["GB18030"]
+
+
+def test_read_large_fallback(tmp_path, passes):
+    # 开头同时是合法的 utf-8 与 GB18030，之后才出现不是 utf-8 的字节
+    data = b"ascii only prefix " * 3 + "中文".encode("GB18030")
+    path = tmp_path / "a.txt"
+    path.write_bytes(data)
+    detector = _detector()
+    result = detector.read_text(path)
+    assert (result.text, result.encoding, result.replacements) == (data.decode("GB18030"), "GB18030", 0)
+    assert passes == ["utf-8", "GB18030"]
+    assert detector.fallbacks == 1
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "GB18030"])
+def test_iter_lines(tmp_path, encoding):
+    text = "第一行\n\n中文文本，用于测试按块解码。\r\n" * 5 + "最后一行没有换行"
+    path = tmp_path / "a.txt"
+    path.write_bytes(text.encode(encoding))
+    detector = _detector()
+    chunks = list(detector.iter_text(path))
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    assert list(detector.iter_lines(path)) == text.split("\n")
+
+
+def test_iter_text_replace(tmp_path, caplog):
+    bad = tmp_path / "bad.txt"
+    bad.write_bytes("中文文本".encode("GB18030") * 5 + b"\xff" + "结束".encode("GB18030"))
+    good = tmp_path / "good.txt"
+    good.write_bytes("中文文本".encode("GB18030") * 10)
+    detector = _detector()
+    # 交替读取两个文件：替换的字节数分别统计
+    bad_chunks, good_chunks = detector.iter_text(bad), detector.iter_text(good)
+    texts = {"bad": [], "good": []}
+    for bad_chunk, good_chunk in zip(bad_chunks, good_chunks):
+        texts["bad"].append(bad_chunk)
+        texts["good"].append(good_chunk)
+    texts["bad"].extend(bad_chunks)
+    texts["good"].extend(good_chunks)
+    assert "".join(texts["bad"]) == "中文文本" * 5 + "�" + "结束"
+    assert "".join(texts["good"]) == "中文文本" * 10
+    assert detector.replaced_files == 1
+    assert [record.getMessage() for record in caplog.records] == [
+        f"Replaced 1 undecodable bytes in {bad} (GB18030)"]
+
+
+def test_detect_folder_cache(tmp_path):
+    detector = EncodingDetector(candidates=("utf-8", "GB18030"), use_chardet=False)
+    gbk = tmp_path / "gbk"
+    gbk.mkdir()
+    (gbk / "a.txt").write_bytes("中文文本".encode("GB18030"))
+    (gbk / "b.txt").write_bytes("中文".encode("utf-8"))
+    (gbk / "c.txt").write_bytes(b"ascii")
+    (gbk / "d.txt").write_bytes(codecs.BOM_UTF8 + "中文".encode("utf-8"))
+    assert detector.read_text(gbk / "a.txt") == ("中文文本", "GB18030", 0)
+    assert detector.folder_encodings == {str(gbk): "GB18030"}
+    # utf-8 总是先于缓存的编码尝试，ASCII 与 BOM 不改变缓存
+    assert detector.read_text(gbk / "b.txt").encoding == "utf-8"
+    assert detector.detect(gbk / "c.txt") == "utf-8"
+    assert detector.read_text(gbk / "d.txt") == ("中文", "utf-8-sig", 0)
+    assert detector.folder_encodings == {str(gbk): "GB18030"}
+    assert detector.to_dict()["files"] == 3
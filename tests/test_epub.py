@@ -0,0 +1,83 @@
+import zipfile
+
+import pytest
+
+from mnbvc.utils.epub import EpubReader
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+OPF = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title> 测试书 </dc:title>
+    <dc:date>2020-01-02</dc:date>
+  </metadata>
+  <manifest>
+    <item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>
+    <item id="c1" href="Text/chapter%201.html" media-type="application/xhtml+xml"/>
+    <item id="c2" href="Text/c2.html" media-type="application/xhtml+xml"/>
+    <item id="missing" href="Text/missing.html" media-type="application/xhtml+xml"/>
+    <item id="img" href="Images/a.png" media-type="image/png"/>
+  </manifest>
+  <spine toc="ncx">
+    <itemref idref="c2"/>
+    <itemref idref="c1"/>
+    <itemref idref="missing"/>
+    <itemref idref="unknown"/>
+  </spine>
+</package>"""
+
+NCX = """<?xml version="1.0" encoding="utf-8"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <navMap>
+    <navPoint id="p1"><navLabel><text>第一章</text></navLabel><content src="Text/chapter%201.html#top"/>
+      <navPoint id="p1-1"><navLabel><text>第一节</text></navLabel><content src="Text/chapter%201.html#s1"/></navPoint>
+    </navPoint>
+    <navPoint id="p2"><navLabel><text>第二章</text></navLabel><content src="Text/c2.html"/></navPoint>
+  </navMap>
+</ncx>"""
+
+
+@pytest.fixture
+def epub_path(tmp_path):
+    path = tmp_path / "book.epub"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip")
+        zf.writestr("META-INF/container.xml", CONTAINER)
+        zf.writestr("OEBPS/content.opf", OPF)
+        zf.writestr("OEBPS/toc.ncx", NCX)
+        zf.writestr("OEBPS/Text/chapter 1.html", "<p>一</p>")
+        zf.writestr("OEBPS/Text/c2.html", "<p>二</p>")
+        zf.writestr("OEBPS/Images/a.png", b"\x89PNG")
+    return path
+
+
+def test_epub_reader(epub_path):
+    with EpubReader(epub_path) as book:
+        assert book.title == "测试书"
+        assert book.get_metadata("date") == ["2020-01-02"]
+        assert book.get_metadata("creator") == []
+        assert book.manifest["c1"].path == "OEBPS/Text/chapter 1.html"
+        assert book.toc == [
+            ("第一章", "OEBPS/Text/chapter 1.html"),
+            ("第一节", "OEBPS/Text/chapter 1.html"),
+            ("第二章", "OEBPS/Text/c2.html"),
+        ]
+        assert book.read(book.toc[0][1]) == "<p>一</p>".encode()
+        # 按 spine 的顺序，跳过不在压缩包中的文件与不在 manifest 中的 idref
+        assert book.spine == ["OEBPS/Text/c2.html", "OEBPS/Text/chapter 1.html", "OEBPS/Text/missing.html"]
+        assert list(book.iter_spine()) == [
+            ("OEBPS/Text/c2.html", "<p>二</p>".encode()),
+            ("OEBPS/Text/chapter 1.html", "<p>一</p>".encode()),
+        ]
+
+
+def test_missing_rootfile(tmp_path):
+    path = tmp_path / "bad.epub"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("META-INF/container.xml", "<container><rootfiles/></container>")
+    with pytest.raises(Exception, match="Cannot find OPF file"):
+        EpubReader(path)
@@ -0,0 +1,29 @@
+import pytest
+
+from mnbvc.utils.html_text import extract_article
+
+HTML = """<?xml version="1.0" encoding="utf-8"?>
+<html><body>
+<h1> 标题 </h1>
+<p>第一段 &amp; 实体<br/>第二段</p>
+<div>  <img src="a.png"/> 图片后的文字 </div>
+<pre>def f():
+    return 1</pre>
+<p>尾<b>部</b></p>
+</body></html>"""
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_extract_article(backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    article = extract_article(HTML, backend=backend)
+    assert article.texts == [
+        "标题", "第一段 & 实体", "第二段", "图片后的文字", "def f():\n    return 1", "尾部",
+    ]
+    assert article.img_count == 1
+
+
+def test_unknown_backend():
+    with pytest.raises(Exception, match="Unknown HTML backend"):
+        extract_article("<p>a</p>", backend="missing")
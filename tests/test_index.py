@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from mnbvc.utils.index import ShardIndex, ShardIndexWriter, index_path_for
+from mnbvc.utils.manifest import compact_shard
+from mnbvc.utils.writer import RecordBatch, SizeLimitedFileWriter
+
+
+def _record(idx):
+    return {"文件名": f"file{idx}.txt", "是否待查文件": False, "段落": "段" * (idx % 7), "idx": idx}
+
+
+def _check(path, indices):
+    with ShardIndex(path) as index:
+        assert len(index) == len(indices)
+        for pos, idx in enumerate(indices):
+            assert json.loads(index.read_record(pos)) == _record(idx)
+            assert index.entry(pos).key == f"file{idx}.txt"
+            assert index.find(f"file{idx}.txt") == pos
+        assert index.find("missing") == -1
+        with pytest.raises(IndexError):
+            index.entry(len(indices))
+
+
+@pytest.mark.parametrize("filename_fmt", ["{}.jsonl", "{}.jsonl.gz"])
+def test_index(tmp_path, filename_fmt):
+    # 很小的块：gzip 文件中有多个块
+    with SizeLimitedFileWriter(
+        tmp_path, filename_fmt=filename_fmt, index=True, index_block_size=64, stats_interval=None,
+    ) as writer:
+        writer.write_many(_record(idx) for idx in range(10))
+        records = [json.dumps(_record(idx), ensure_ascii=False).encode() for idx in range(10, 20)]
+        writer.write_batch(RecordBatch.pack(records))
+    _check(tmp_path / filename_fmt.format("000"), list(range(20)))
+
+
+def test_index_header(tmp_path):
+    writer = ShardIndexWriter(compressed=True)
+    writer.add(0, 0, b"x", "key")
+    writer.save(tmp_path / "000.jsonl.gz.idx")
+    # 20 字节的文件头与 32 字节的条目，之后为键
+    assert (tmp_path / "000.jsonl.gz.idx").stat().st_size == 20 + 32 + 3
+    loaded = ShardIndexWriter.load(tmp_path / "000.jsonl.gz.idx")
+    assert (loaded.count, loaded.flags, bytes(loaded.keys)) == (1, writer.flags, b"key")
+    assert loaded.entries == writer.entries
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+@pytest.mark.parametrize("filename_fmt", ["{}.jsonl", "{}.jsonl.gz"])
+def test_index_after_append(tmp_path, filename_fmt, atomic):
+    kwargs = dict(filename_fmt=filename_fmt, index=True, index_block_size=64, atomic=atomic, stats_interval=None)
+    with SizeLimitedFileWriter(tmp_path, **kwargs) as writer:
+        writer.write_many(_record(idx) for idx in range(5))
+    with SizeLimitedFileWriter(tmp_path, append_shard=writer.shards[-1], **kwargs) as writer:
+        writer.write_many(_record(idx) for idx in range(5, 12))
+    assert [shard["path"] for shard in writer.shards] == [filename_fmt.format("000")]
+    assert writer.shards[0]["records"] == 12
+    _check(tmp_path / filename_fmt.format("000"), list(range(12)))
+
+
+@pytest.mark.parametrize("filename_fmt", ["{}.jsonl", "{}.jsonl.gz"])
+def test_index_after_compaction(tmp_path, filename_fmt):
+    with SizeLimitedFileWriter(
+        tmp_path, filename_fmt=filename_fmt, index=True, index_block_size=64, stats_interval=None,
+    ) as writer:
+        writer.write_many(_record(idx) for idx in range(12))
+    path = tmp_path / filename_fmt.format("000")
+    shard = compact_shard(path, [(0, 2), (5, 8)])
+    assert shard["records"] == 7
+    assert shard["size"] == path.stat().st_size
+    _check(path, [2, 3, 4, 8, 9, 10, 11])
+    assert compact_shard(path, [(0, 7)]) is None
+    assert not path.exists()
+    assert not index_path_for(path).exists()
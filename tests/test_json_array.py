@@ -0,0 +1,68 @@
+import io
+import json
+
+import pytest
+
+from mnbvc.utils.json_array import imap_json_array, iter_json_array
+
+SAMPLES = [
+    '[12.5, -3, 1e10, 2.5E-3, 0, -0.125, 7]',
+    '[ {"a": [1, 2.75, {"b": "x,]"}]}, "中文", true, false, null , 123456789 ]',
+    '[1.5e+2,{"k":-12.0e-1},[3.25,[4e2]],"s",-7]',
+    '[]',
+    '  [ 42 ]  ',
+]
+
+
+class _SplitReader(io.StringIO):
+    """第一次 read 返回 text[:offset]，之后按 chunk_size 读取，模拟在任意位置被截断的块。"""
+
+    def __init__(self, text: str, offset: int):
+        super().__init__(text)
+        self.offset = offset
+        self.first = True
+
+    def read(self, size=-1):
+        if self.first:
+            self.first = False
+            return super().read(self.offset)
+        return super().read(size)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_split_at_every_offset(text):
+    expected = json.loads(text)
+    for offset in range(1, len(text) + 1):
+        items = list(iter_json_array(_SplitReader(text, offset), chunk_size=len(text)))
+        assert items == expected, offset
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7])
+def test_small_chunks(tmp_path, chunk_size, use_mmap):
+    for idx, text in enumerate(SAMPLES):
+        path = tmp_path / f"{idx}.json"
+        path.write_text(text, encoding="utf-8")
+        items = list(iter_json_array(path, chunk_size=chunk_size, use_mmap=use_mmap))
+        assert items == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ['[1, 2', '[12.x]', '[1] 2', '{"a": 1}'])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size=2))
+
+
+def _square(item):
+    return item * item
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_imap(tmp_path, ordered):
+    path = tmp_path / "a.json"
+    path.write_text(json.dumps(list(range(100))))
+    results = list(imap_json_array(path, _square, workers=2, ordered=ordered, batch_size=7, chunk_size=16))
+    if not ordered:
+        results.sort()
+    assert results == [idx * idx for idx in range(100)]
+    assert list(imap_json_array(path, _square, workers=2, batch_size=7, limit=10)) == [idx * idx for idx in range(10)]
@@ -0,0 +1,39 @@
+import gzip
+import json
+
+import pytest
+
+from mnbvc.utils.jsonl import JsonlRecordConverter, iter_jsonl, iter_work_item_lines
+from mnbvc.utils.scheduler import WorkItem, split_byte_ranges
+
+RECORDS = [{"idx": idx, "text": "中文" * (idx % 5)} for idx in range(50)]
+
+
+@pytest.fixture
+def jsonl_path(tmp_path):
+    path = tmp_path / "a.jsonl"
+    # 中间有空行，最后一行没有换行
+    lines = [json.dumps(record, ensure_ascii=False) for record in RECORDS]
+    lines.insert(10, "")
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_byte_ranges(jsonl_path, chunk_size):
+    # 范围不与换行（甚至字符）对齐，每一行只属于一个范围
+    items = split_byte_ranges(jsonl_path, jsonl_path.stat().st_size, chunk_size)
+    records = [data for item in items for data in iter_work_item_lines(item)]
+    assert records == RECORDS
+
+
+def test_gzip_and_groups(tmp_path, jsonl_path):
+    gz_path = tmp_path / "b.jsonl.gz"
+    with gzip.open(gz_path, "wt", encoding="utf-8") as fp:
+        fp.write("".join(json.dumps(record) + "\n" for record in RECORDS[:3]))
+    assert list(iter_jsonl(gz_path)) == RECORDS[:3]
+    item = WorkItem((str(gz_path), str(jsonl_path)), 0)
+    converter = JsonlRecordConverter(lambda data: data["idx"] if data["idx"] % 2 == 0 else None)
+    assert list(converter(item)) == [0, 2] + list(range(0, 50, 2))
+    with pytest.raises(Exception):
+        list(iter_work_item_lines(WorkItem((str(jsonl_path),), 0, "row_groups", 0, 1)))
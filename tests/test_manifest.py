@@ -0,0 +1,232 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from mnbvc.utils.index import ShardIndex
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.pool import WriterPool
+from mnbvc.utils.writer import SizeLimitedFileWriter
+
+
+def _read(path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def _read_all(folder, pattern="*.jsonl*"):
+    records = []
+    for path in sorted(folder.glob(pattern)):
+        if path.suffix in (".jsonl", ".gz"):
+            records.extend(_read(path))
+    return records
+
+
+@pytest.mark.parametrize("filename_fmt", ["{}.jsonl", "{}.jsonl.gz"])
+def test_atomic_publish(tmp_path, filename_fmt):
+    writer = SizeLimitedFileWriter(tmp_path, filename_fmt=filename_fmt, stats_interval=None)
+    path = tmp_path / filename_fmt.format("000")
+    writer.writeline({"idx": 0})
+    # 写完之前只有临时文件
+    assert not path.exists()
+    assert path.with_name(path.name + ".tmp").exists()
+    writer.close()
+    assert path.exists()
+    assert not path.with_name(path.name + ".tmp").exists()
+    assert _read(path) == [{"idx": 0}]
+    assert writer.shards[0]["size"] == path.stat().st_size
+
+
+def test_abort(tmp_path):
+    writer = SizeLimitedFileWriter(tmp_path, file_records_limit=2, stats_interval=None)
+    for idx in range(3):
+        writer.writeline({"idx": idx})
+    writer.abort()
+    # 写完的文件保留，没有写完的文件被删除
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["000.jsonl"]
+    assert _read(tmp_path / "000.jsonl") == [{"idx": 0}, {"idx": 1}]
+
+
+def test_resume_removes_partial_segment(tmp_path):
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    done, broken = inputs / "done.txt", inputs / "broken.txt"
+    done.write_text("done")
+    broken.write_text("broken")
+    output = tmp_path / "output"
+    manifest_path = output / "manifest.json"
+
+    manifest = RunManifest(manifest_path)
+    writer = SizeLimitedFileWriter(output, file_records_limit=2, manifest=manifest, stats_interval=None)
+    writer.begin_input(done)
+    writer.writeline({"input": "done", "idx": 0})
+    writer.end_input()
+    writer.begin_input(broken)
+    for idx in range(3):
+        writer.writeline({"input": "broken", "idx": idx})
+    # 中断：000.jsonl 已经写完，其中有 broken 的一条记录
+    writer.abort()
+    saved = RunManifest.load(manifest_path)
+    assert saved["partial"] == {str(broken): [{"shard": "000.jsonl", "start": 1, "end": 2}]}
+    assert list(saved["inputs"]) == [str(done)]
+
+    manifest = RunManifest(manifest_path, resume=True)
+    assert manifest.refresh([done, broken]) == []
+    assert manifest.partial == {}
+    assert _read(output / "000.jsonl") == [{"input": "done", "idx": 0}]
+    assert manifest.shards["000.jsonl"]["records"] == 1
+    assert manifest.is_done(done) and (not manifest.is_done(broken))
+
+    writer = SizeLimitedFileWriter(output, file_records_limit=2, manifest=manifest, stats_interval=None)
+    writer.begin_input(broken)
+    for idx in range(3):
+        writer.writeline({"input": "broken", "idx": idx})
+    writer.end_input()
+    writer.close()
+    # 继续运行时跳过已经写完的文件名，每条记录只出现一次
+    assert _read_all(output) == [{"input": "done", "idx": 0}] + [
+        {"input": "broken", "idx": idx} for idx in range(3)]
+    saved = RunManifest.load(manifest_path)
+    assert saved["partial"] == {}
+    assert saved["inputs"][str(broken)] == [
+        {"shard": "001.jsonl", "start": 0, "end": 2},
+        {"shard": "002.jsonl", "start": 0, "end": 1},
+    ]
+    assert saved["records"] == 4
+
+
+def test_failed_input_is_partial(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    writer = SizeLimitedFileWriter(tmp_path, manifest=manifest, stats_interval=None)
+    writer.begin_input("failed")
+    writer.writeline({"idx": 0})
+    writer.end_input(done=False)
+    writer.close()
+    assert manifest.partial == {"failed": [{"shard": "000.jsonl", "start": 0, "end": 1}]}
+    assert not manifest.is_done("failed")
+    manifest = RunManifest(tmp_path / "manifest.json", resume=True)
+    manifest.refresh(["failed"])
+    # 只有失败输入的记录：整个文件被删除
+    assert manifest.shards == {}
+    assert not (tmp_path / "000.jsonl").exists()
+
+
+def _convert(output, paths, manifest, **kwargs):
+    """每个输入写入两条记录，跳过已经完成的输入。"""
+    writer = SizeLimitedFileWriter(output, manifest=manifest, stats_interval=None, **kwargs)
+    for path in paths:
+        if manifest.is_done(path):
+            continue
+        writer.begin_input(path)
+        text = path.read_text()
+        writer.write_many({"input": path.name, "text": text, "idx": idx} for idx in range(2))
+        writer.end_input()
+    writer.close()
+
+
+@pytest.fixture
+def converted(tmp_path):
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    paths = []
+    for name in "abc":
+        path = inputs / f"{name}.txt"
+        path.write_text(name)
+        paths.append(path)
+    output = tmp_path / "output"
+    manifest = RunManifest(output / "manifest.json")
+    _convert(output, paths, manifest, filename_fmt="{}.jsonl.gz", index=True)
+    return output, paths
+
+
+def test_refresh_unchanged(converted):
+    output, paths = converted
+    manifest = RunManifest(output / "manifest.json", resume=True)
+    mtime = (output / "000.jsonl.gz").stat().st_mtime_ns
+    assert manifest.refresh(paths) == []
+    assert (output / "000.jsonl.gz").stat().st_mtime_ns == mtime
+    assert all(manifest.is_done(path) for path in paths)
+
+
+@pytest.mark.parametrize("hash_inputs", [False, True])
+def test_refresh_modified(converted, hash_inputs):
+    output, paths = converted
+    paths[0].write_text("changed")
+    manifest = RunManifest(output / "manifest.json", resume=True, hash_inputs=hash_inputs)
+    assert manifest.refresh(paths) == [str(paths[0])]
+    # a 的记录被删除，b、c 的行号相应减小
+    assert [record["input"] for record in _read(output / "000.jsonl.gz")] == ["b.txt"] * 2 + ["c.txt"] * 2
+    assert manifest.inputs[str(paths[1])] == [{"shard": "000.jsonl.gz", "start": 0, "end": 2}]
+    assert manifest.inputs[str(paths[2])] == [{"shard": "000.jsonl.gz", "start": 2, "end": 4}]
+    assert manifest.shards["000.jsonl.gz"]["records"] == 4
+    assert manifest.shards["000.jsonl.gz"]["size"] == (output / "000.jsonl.gz").stat().st_size
+    with ShardIndex(output / "000.jsonl.gz") as index:
+        assert len(index) == 4
+        assert json.loads(index.read_record(2))["input"] == "c.txt"
+
+    _convert(output, paths, manifest, filename_fmt="{}.jsonl.gz", index=True)
+    records = _read_all(output)
+    assert sorted((record["input"], record["text"], record["idx"]) for record in records) == [
+        ("a.txt", "changed", 0), ("a.txt", "changed", 1),
+        ("b.txt", "b", 0), ("b.txt", "b", 1), ("c.txt", "c", 0), ("c.txt", "c", 1),
+    ]
+    assert RunManifest.load(output / "manifest.json")["records"] == 6
+
+
+def test_refresh_touched_with_hash(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("a")
+    output = tmp_path / "output"
+    _convert(output, [path], RunManifest(output / "manifest.json", hash_inputs=True))
+    # 内容相同，只改变了修改时间
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    manifest = RunManifest(output / "manifest.json", resume=True, hash_inputs=True)
+    assert manifest.refresh([path]) == []
+    assert manifest.is_done(path)
+
+
+def test_refresh_removed(converted):
+    output, paths = converted
+    paths[1].unlink()
+    manifest = RunManifest(output / "manifest.json", resume=True)
+    assert manifest.refresh([paths[0], paths[2]]) == [str(paths[1])]
+    assert [record["input"] for record in _read(output / "000.jsonl.gz")] == ["a.txt"] * 2 + ["c.txt"] * 2
+    assert manifest.inputs[str(paths[2])] == [{"shard": "000.jsonl.gz", "start": 2, "end": 4}]
+    assert str(paths[1]) not in manifest.fingerprints
+
+
+def test_refresh_missing_shard(converted):
+    output, paths = converted
+    (output / "000.jsonl.gz").unlink()
+    manifest = RunManifest(output / "manifest.json", resume=True)
+    assert manifest.refresh(paths) == sorted(str(path) for path in paths)
+    assert manifest.shards == {} and manifest.inputs == {}
+
+
+def _write_task(writer, task):
+    for idx in range(task):
+        writer.writeline({"task": task, "idx": idx})
+
+
+def test_pool_rerun_removes_previous_shards(tmp_path):
+    kwargs = dict(output_folder=tmp_path, file_records_limit=1, index=True, stats_interval=None)
+    WriterPool(2, **kwargs).run(_write_task, [3, 2])
+    assert len(list(tmp_path.glob("*.jsonl"))) == 5
+    manifest = WriterPool(2, **kwargs).run(_write_task, [1])
+    # 上一次运行的输出文件与索引都被删除，只剩下这一次（每个进程一个文件）的输出
+    names = {"manifest.json"} | {name for shard in manifest.shards for name in (shard, shard + ".idx")}
+    assert {path.name for path in tmp_path.iterdir()} == names
+    assert sorted(manifest.shards) == ["000.jsonl", "001.jsonl"]
+    assert _read_all(tmp_path) == [{"task": 1, "idx": 0}]
+
+
+def test_pool_stats_per_rank(tmp_path):
+    output = tmp_path / "output"
+    WriterPool(2, output_folder=output, stats_interval=None, stats_path=tmp_path / "stats.json").run(
+        _write_task, [3, 2])
+    stats = [json.loads((tmp_path / f"stats.{rank}.json").read_text()) for rank in range(2)]
+    assert [item["name"] for item in stats] == [f"{output}.0", f"{output}.1"]
+    assert sum(item["records"] for item in stats) == 5
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from mnbvc.utils import memory
+from mnbvc.utils.memory import AdaptiveBatchSize, ByteBoundedQueue, MemoryBudget
+
+
+def test_budget_from_env(monkeypatch):
+    monkeypatch.setenv(memory.ENV_VAR, "800")
+    budget = MemoryBudget(workers=4)
+    assert budget.limit == 800 << 20
+    assert budget.per_worker == 200 << 20
+
+
+def test_unlimited_budget():
+    # 没有设置预算并且无法得到可用内存时不限制
+    budget = MemoryBudget(workers=2)
+    budget.limit = None
+    assert budget.per_worker is None
+    assert budget.usage() == 0
+    assert not budget.is_near()
+    assert not budget.check()
+
+
+def test_adaptive_batch_size(monkeypatch):
+    usage = [0.0]
+    budget = MemoryBudget(limit=1600 << 20, workers=1)
+    monkeypatch.setattr(budget, "usage", lambda: usage[0])
+    batch_size = AdaptiveBatchSize(4096, minimum=512, budget=budget)
+    assert batch_size() == 4096
+    # 超过 HIGH_WATERMARK 时减半，不小于 minimum
+    usage[0] = 0.9
+    assert [batch_size() for _ in range(4)] == [2048, 1024, 512, 512]
+    # 在两个水位之间保持不变，低于 LOW_WATERMARK 时逐步恢复
+    usage[0] = 0.6
+    assert batch_size() == 512
+    usage[0] = 0.1
+    assert [batch_size() for _ in range(4)] == [1024, 2048, 4096, 4096]
+    # 一批最多占 worker 预算的 BATCH_FRACTION：每行 1 MB 时最多 100 行，但不小于 minimum
+    assert batch_size(row_bytes=1 << 20) == 512
+    assert AdaptiveBatchSize(4096, minimum=1, budget=budget)(row_bytes=1 << 20) == 100
+
+
+def test_byte_bounded_queue():
+    queue = ByteBoundedQueue(10)
+    queue.put(b"12345678")
+    assert queue.bytes() == 8
+    blocked = threading.Thread(target=queue.put, args=(b"1234",))
+    blocked.start()
+    # 超过 max_bytes：put 阻塞，直到取出数据
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    assert queue.get() == b"12345678"
+    blocked.join(5)
+    assert not blocked.is_alive()
+    assert queue.bytes() == 4
+    assert queue.get() == b"1234"
+
+
+def test_byte_bounded_queue_oversized():
+    queue = ByteBoundedQueue(10)
+    # 单条数据超过 max_bytes 时在队列为空时放入；结束标记 None 计为 0 字节，不会被阻塞
+    queue.put(b"x" * 100)
+    queue.put(None)
+    assert queue.bytes() == 100
+    assert queue.get() == b"x" * 100
+    assert queue.get() is None
+    assert queue.bytes() == 0
+    with pytest.raises(Exception):
+        ByteBoundedQueue(0)
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from mnbvc.utils.manifest import RunManifest
+from mnbvc.utils.pool import WriterPool
+
+
+def _write_or_die(writer, task):
+    if task == "die":
+        os._exit(1)
+    if task == "slow":
+        time.sleep(60)
+    writer.writeline({"task": task})
+
+
+def _run_with_timeout(pool, tasks, timeout=30):
+    """在线程中运行 pool.run，超时则测试失败而不是一直等待。"""
+    result = {}
+
+    def run():
+        try:
+            result["manifest"] = pool.run(_write_or_die, tasks)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "WriterPool.run did not return after a worker died"
+    return result
+
+
+def test_dead_worker(tmp_path):
+    pool = WriterPool(3, output_folder=tmp_path, stats_interval=None)
+    start = time.monotonic()
+    result = _run_with_timeout(pool, ["a", "slow", "die", "b", "c"])
+    assert "Writer pool workers failed" in str(result["error"])
+    # 其他进程被终止，不会等到 slow 任务结束
+    assert time.monotonic() - start < 30
+    # 已经合并 manifest 分片
+    assert (tmp_path / "manifest.json").exists()
+    assert not list(tmp_path.glob("manifest.*.json"))
+
+
+def test_no_failure(tmp_path):
+    result = _run_with_timeout(WriterPool(2, output_folder=tmp_path, stats_interval=None), ["a", "b", "c"])
+    assert "error" not in result
+    assert result["manifest"].to_dict()["records"] == 3
+
+
+@pytest.mark.parametrize("world_size", [1, 3])
+def test_only_failure_raises(tmp_path, world_size):
+    result = _run_with_timeout(WriterPool(world_size, output_folder=tmp_path, stats_interval=None), ["die"])
+    assert "error" in result
+
+
+# 第一次运行时，写入 CRASH_AFTER 条记录后在写入一半的文件中被终止（子进程 fork 时继承）
+CRASH_AFTER = None
+
+
+def _write_task(writer, task):
+    global CRASH_AFTER
+    for idx in range(task):
+        if CRASH_AFTER is not None:
+            if CRASH_AFTER == 0:
+                os._exit(1)
+            CRASH_AFTER -= 1
+        writer.writeline({"task": task, "idx": idx})
+
+
+def _records(folder):
+    records = []
+    for path in sorted(folder.glob("*.jsonl")):
+        with open(path, "r") as fp:
+            records.extend(json.loads(line) for line in fp)
+    return records
+
+
+def test_resume_after_kill(tmp_path):
+    global CRASH_AFTER
+    tasks = [1, 2, 5, 4]
+    kwargs = dict(output_folder=tmp_path, file_records_limit=2, stats_interval=None)
+    # 1、2 完成，5 写入 3 条记录后被终止：001.jsonl 中有 5 的一条记录，002.jsonl 还没有写完
+    CRASH_AFTER = 6
+    try:
+        with pytest.raises(Exception, match="Writer pool workers failed"):
+            WriterPool(1, resume=True, **kwargs).run(_write_task, tasks)
+    finally:
+        CRASH_AFTER = None
+    assert (tmp_path / "002.jsonl.tmp").exists()
+    saved = RunManifest.load(tmp_path / "manifest.json")
+    assert sorted(saved["inputs"]) == ["1", "2"]
+    assert saved["partial"] == {"5": [{"shard": "001.jsonl", "start": 1, "end": 2}]}
+
+    manifest = WriterPool(1, resume=True, **kwargs).run(_write_task, tasks)
+    expected = [{"task": task, "idx": idx} for task in sorted(tasks) for idx in range(task)]
+    # 每条记录只出现一次
+    assert sorted(_records(tmp_path), key=lambda record: (record["task"], record["idx"])) == expected
+    assert manifest.to_dict()["records"] == len(expected)
+    assert manifest.partial == {}
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,87 @@
+import json
+import os
+import types
+from multiprocessing import Process
+
+import pytest
+
+from mnbvc import cli
+from mnbvc.utils import profiling
+
+
+@pytest.fixture
+def profile_folder(tmp_path):
+    folder = tmp_path / "profile"
+    profiling.enable(folder)
+    yield folder
+    profiling.disable()
+
+
+@profiling.timed("decorated")
+def _decorated(value):
+    return value + 1
+
+
+def _child():
+    # fork 出来的子进程只保存自己的统计
+    profiling.record("child", 1.0)
+    profiling.flush()
+
+
+def test_profiling(profile_folder):
+    with profiling.stage("parse"):
+        pass
+    profiling.record("write", 0.5)
+    assert _decorated(1) == 2
+    with profiling.source("dataset"):
+        assert list(profiling.timed_iter("convert", iter([1, 2]))) == [1, 2]
+    process = Process(target=_child)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    profiling.flush()
+
+    assert len(list(profile_folder.glob("profile.*.json"))) == 2
+    report = profiling.write_report(profile_folder)
+    assert report["processes"] == 2
+    stages = report["stages"]
+    assert {name: stats["count"] for name, stats in stages.items()} == {
+        "child": 1, "write": 1, "convert": 3, "parse": 1, "decorated": 1}
+    # 按总耗时从大到小
+    assert list(stages)[:2] == ["child", "write"]
+    assert stages["write"]["p50"] == stages["write"]["max"] == 0.5
+    # timed_iter 每次 next（包括最后的 StopIteration）计时，只记录在来源中
+    assert report["sources"] == {"dataset": {"convert": {"count": 3, "total": stages["convert"]["total"]}}}
+    assert json.loads((profile_folder / "report.json").read_text()) == report
+    text = (profile_folder / "report.txt").read_text()
+    assert "processes: 2" in text and "[dataset]" in text
+
+
+def test_disabled(tmp_path):
+    assert not profiling.is_enabled()
+    assert profiling.stage("parse") is profiling.stage("write")
+    profiling.record("write", 1.0)
+    assert _decorated(1) == 2
+    profiling.flush()
+    assert profiling.ENV_VAR not in os.environ
+    assert profiling.merge_profiles(tmp_path) == {"processes": 0, "stages": {}, "sources": {}}
+
+
+def test_cli_profile(tmp_path, monkeypatch):
+    def main(input_folder=None):
+        with profiling.stage("convert"):
+            pass
+
+    monkeypatch.setattr(cli, "load_converter", lambda name: types.SimpleNamespace(main=main))
+    folder = tmp_path / "profile"
+    folder.mkdir()
+    (folder / "profile.1.json").write_text("{}")
+    try:
+        assert cli.run(["cmb", "--profile", str(folder)]) == 0
+    finally:
+        profiling.disable()
+    # 上一次运行的统计被删除，保存了主进程的 cProfile 与合并后的报告
+    assert (folder / "main.prof").exists()
+    report = json.loads((folder / "report.json").read_text())
+    assert report["processes"] == 1
+    assert report["stages"]["convert"]["count"] == 1
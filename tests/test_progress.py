@@ -0,0 +1,78 @@
+import io
+from multiprocessing import Process
+
+import pytest
+
+from mnbvc.utils import progress
+from mnbvc.utils.progress import ProgressCounters, ProgressMonitor, count_records
+from mnbvc.utils.scheduler import WorkItem
+
+
+def _work(counters, slot):
+    reporter = counters.reporter(slot, flush_interval=3600)
+    records = [{"段落": [1, 2, 3]}, {"段落数": 2}, {"其他": 1}]
+    for _ in count_records(records * 100, reporter):
+        pass
+    # 还没有到 flush_interval：本地累加，没有写入共享内存中自己的一行
+    width = len(progress.FIELDS)
+    assert counters.array[slot * width: (slot + 1) * width] == [0.0] * width
+    reporter.add(inputs=1, input_size=10, output_bytes=100)
+    reporter.flush()
+
+
+def test_counters_across_processes():
+    counters = ProgressCounters(3)
+    processes = [Process(target=_work, args=(counters, slot)) for slot in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert counters.totals() == {
+        "inputs": 3, "input_size": 30, "documents": 900, "paragraphs": 1500, "output_bytes": 300}
+    with pytest.raises(Exception, match="Slot must be"):
+        counters.reporter(3)
+
+
+def test_count_records_reports_on_error():
+    counters = ProgressCounters(1)
+    reporter = counters.reporter(0)
+
+    def records():
+        yield {"段落数": 4}
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        list(count_records(records(), reporter))
+    reporter.flush()
+    assert counters.totals()["documents"] == 1
+    assert counters.totals()["paragraphs"] == 4
+
+
+def test_input_size(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"x" * 5)
+    assert progress.input_size(path) == 5
+    assert progress.input_size(WorkItem((str(path),), 7)) == 7
+    assert progress.input_size(tmp_path / "missing.txt") == 1
+
+
+def test_monitor(tmp_path):
+    counters = ProgressCounters(2)
+    counters.set_total([WorkItem(("a",), 300), WorkItem(("b",), 100)])
+    reporter = counters.reporter(1)
+    reporter.add(inputs=1, input_size=100, documents=5, paragraphs=50, output_bytes=2048)
+    reporter.flush()
+    output = io.StringIO()
+    monitor = ProgressMonitor(counters, desc="test", file=output)
+    snapshot = monitor.snapshot()
+    assert snapshot["inputs"] == 1 and snapshot["total_inputs"] == 2 and snapshot["total_size"] == 400
+    # 剩余 300 的输入，按目前处理输入大小的速度估计
+    assert snapshot["eta"] == pytest.approx(300 / snapshot["input_size_per_second"])
+    line = monitor.format(snapshot)
+    assert line.startswith("[test] |  25.0% | 1/2 inputs")
+    assert "5 docs" in line and "50 paragraphs" in line and "2.0 KB out" in line
+    # 不是终端时每次输出一行
+    with monitor:
+        pass
+    assert output.getvalue().count("\n") == 1
@@ -0,0 +1,108 @@
+import gzip
+import json
+import logging
+
+import pytest
+
+from mnbvc.utils import writer as writer_module
+from mnbvc.utils.index import ShardIndex
+from mnbvc.utils.routing import RoutingWriter
+
+
+def _read_route(folder, route):
+    records = []
+    for path in sorted(folder.glob(f"{route}_*.jsonl.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as fp:
+            records.extend(json.loads(line) for line in fp)
+    return records
+
+
+def _check_index(folder, route):
+    for path in sorted(folder.glob(f"{route}_*.jsonl.gz")):
+        with gzip.open(path, "rb") as fp:
+            lines = fp.read().splitlines()
+        with ShardIndex(path) as index:
+            assert len(index) == len(lines)
+            for idx, line in enumerate(lines):
+                assert index.read_record(idx) == line
+                assert index.find(json.loads(line)["文件名"]) == idx
+
+
+@pytest.fixture
+def no_copy(monkeypatch):
+    """禁止复制整个文件，并统计拼接时复制的字节数。"""
+    copied = []
+
+    def copyfile(*args, **kwargs):
+        raise AssertionError("published shard copied")
+
+    def copyfileobj(fsrc, fdst, *args, **kwargs):
+        data = fsrc.read()
+        copied.append(len(data))
+        fdst.write(data)
+
+    monkeypatch.setattr(writer_module.shutil, "copyfile", copyfile)
+    monkeypatch.setattr(writer_module.shutil, "copyfileobj", copyfileobj)
+    return copied
+
+
+def test_alternating_routes(tmp_path, no_copy):
+    routes = ["a", "b", "c"]
+    with RoutingWriter(
+        tmp_path, filename_fmt="{route}_{}.jsonl.gz", max_open=2, index=True, stats_interval=None,
+    ) as writer:
+        for idx in range(30):
+            route = routes[idx % 3]
+            writer.writeline({"文件名": f"{route}{idx}", "idx": idx}, route=route)
+    for route in routes:
+        records = _read_route(tmp_path, route)
+        assert [record["idx"] for record in records] == list(range(routes.index(route), 30, 3))
+        # 每次重新打开都继续同一个文件
+        assert len(list(tmp_path.glob(f"{route}_*.jsonl.gz"))) == 1
+        _check_index(tmp_path, route)
+    assert not list(tmp_path.glob("*.tmp"))
+    assert writer.route_stats["a"]["records"] == 10
+
+
+def test_reopen_many_times(tmp_path, no_copy):
+    max_reopen = 4
+    with RoutingWriter(
+        tmp_path, filename_fmt="{route}_{}.jsonl.gz", max_open=1, max_reopen=max_reopen,
+        index=True, stats_interval=None,
+    ) as writer:
+        for idx in range(100):
+            route = "ab"[idx % 2]
+            writer.writeline({"文件名": f"{route}{idx}", "idx": idx}, route=route)
+    for route in "ab":
+        records = _read_route(tmp_path, route)
+        assert [record["idx"] for record in records] == list(range("ab".index(route), 100, 2))
+        # 一个文件最多重新打开 max_reopen 次，之后使用下一个文件编号
+        shards = sorted(tmp_path.glob(f"{route}_*.jsonl.gz"))
+        assert len(shards) == 50 // (max_reopen + 1)
+        _check_index(tmp_path, route)
+    # 每次重新打开只拼接新的数据：复制的总量不超过输出的大小
+    total = sum(path.stat().st_size for path in tmp_path.glob("*.jsonl.gz"))
+    assert len(no_copy) == 100 - 50 // (max_reopen + 1) * 2
+    assert sum(no_copy) < total
+
+
+def test_truncate_interrupted_append(tmp_path):
+    with RoutingWriter(tmp_path, filename_fmt="{route}_{}.jsonl.gz", max_open=1, stats_interval=None) as writer:
+        writer.writeline({"idx": 0}, route="a")
+        writer.writeline({"idx": 1}, route="b")
+        # 模拟拼接中断：原文件末尾多出不在文件信息中的数据
+        with open(tmp_path / "a_000.jsonl.gz", "ab") as fp:
+            fp.write(b"garbage")
+        writer.writeline({"idx": 2}, route="a")
+    assert [record["idx"] for record in _read_route(tmp_path, "a")] == [0, 2]
+
+
+def test_stats_reported_once(tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="mnbvc.utils.stats")
+    stats_path = tmp_path / "stats.json"
+    with RoutingWriter(tmp_path, max_open=1, stats_interval=3600, stats_path=stats_path) as writer:
+        for idx in range(10):
+            writer.writeline({"idx": idx}, route="ab"[idx % 2])
+    # 淘汰 writer 时不输出统计，close 时输出一次所有路由合计的统计
+    assert len(caplog.records) == 1
+    assert json.loads(stats_path.read_text())["records"] == 10
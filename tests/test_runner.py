@@ -0,0 +1,106 @@
+import json
+import time
+from multiprocessing import Pool
+
+import pytest
+
+from mnbvc.utils import writer as writer_module
+from mnbvc.utils.runner import bounded_imap, run_conversion
+
+
+def _slow_square(item):
+    # 前面的任务更慢：无序时先返回后面的结果
+    time.sleep(0.02 * (8 - item) if item < 8 else 0)
+    return item * item
+
+
+def _fail(item):
+    if item == 3:
+        raise ValueError("bad item")
+    return item
+
+
+class _Counted:
+    """记录已经被取出的输入数量。"""
+
+    def __init__(self, items):
+        self.items = items
+        self.taken = 0
+
+    def __iter__(self):
+        for item in self.items:
+            self.taken += 1
+            yield item
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_bounded_imap(ordered):
+    inputs = _Counted(range(20))
+    with Pool(4) as pool:
+        results = []
+        for result in bounded_imap(pool, _slow_square, inputs, window=3, ordered=ordered):
+            # 取出第 n 个结果时最多提交了 n + window 个任务
+            assert inputs.taken <= len(results) + 3
+            results.append(result)
+    if ordered:
+        assert results == [item * item for item in range(20)]
+    else:
+        assert results != [item * item for item in range(20)]
+        assert sorted(results) == [item * item for item in range(20)]
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_bounded_imap_error(ordered):
+    with Pool(2) as pool:
+        with pytest.raises(ValueError, match="bad item"):
+            list(bounded_imap(pool, _fail, range(10), window=2, ordered=ordered))
+
+
+def test_bounded_imap_max_bytes():
+    inputs = _Counted(range(40))
+    in_flight = []
+    with Pool(2) as pool:
+        # 每个结果 10 字节，max_bytes 为 20：返回结果之后同时提交的任务从 8 个减少到 2 个
+        results = bounded_imap(pool, _slow_square, inputs, window=8, max_bytes=20, size_of=lambda result: 10)
+        for idx, result in enumerate(results):
+            assert result == idx * idx
+            in_flight.append(inputs.taken - idx)
+    assert max(in_flight) == 8
+    assert max(in_flight[10:-2]) <= 2
+
+
+def _convert(item):
+    for idx in range(item):
+        yield {"item": item, "idx": idx}
+
+
+def _read_all(folder):
+    records = []
+    for path in sorted(folder.glob("*.jsonl")):
+        with open(path, "r") as fp:
+            records.extend(json.loads(line) for line in fp)
+    return records
+
+
+def test_ordered_abort(tmp_path, monkeypatch):
+    kwargs = dict(output_folder=tmp_path, file_records_limit=1, stats_interval=None)
+    write_batch = writer_module.SizeLimitedFileWriter.write_batch
+    calls = []
+
+    def failing(self, batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        write_batch(self, batch)
+
+    monkeypatch.setattr(writer_module.SizeLimitedFileWriter, "write_batch", failing)
+    with pytest.raises(KeyboardInterrupt):
+        run_conversion([2, 3], _convert, kwargs, workers=2, ordered=True, show_progress=False)
+    # 没有写完的文件被删除，写完的文件与 manifest 保留
+    assert not list(tmp_path.glob("*.tmp"))
+    assert sorted(path.name for path in tmp_path.glob("*.jsonl")) == ["000.jsonl"]
+    monkeypatch.setattr(writer_module.SizeLimitedFileWriter, "write_batch", write_batch)
+
+    summary = run_conversion([2, 3], _convert, kwargs, workers=2, ordered=True, resume=True, show_progress=False)
+    assert summary == {"inputs": 2, "failed": [], "records": 5}
+    assert _read_all(tmp_path) == [{"item": item, "idx": idx} for item in (2, 3) for idx in range(item)]
@@ -0,0 +1,77 @@
+import pytest
+
+from mnbvc.utils.scheduler import FileGroupConverter, WorkItem, schedule, split_byte_ranges
+
+
+def _make(folder, sizes, suffix=".txt"):
+    paths = []
+    for idx, size in enumerate(sizes):
+        path = folder / f"{idx:03d}{suffix}"
+        path.write_bytes(b"x" * size)
+        paths.append(path)
+    return paths
+
+
+def test_split_byte_ranges(tmp_path):
+    items = split_byte_ranges(tmp_path / "a.jsonl", 25, 10)
+    assert [(item.unit, item.start, item.end, item.size) for item in items] == [
+        ("bytes", 0, 10, 10), ("bytes", 10, 20, 10), ("bytes", 20, 25, 5)]
+    assert str(items[1]) == f"{tmp_path / 'a.jsonl'}#bytes=10-20"
+
+
+def test_schedule(tmp_path):
+    large = _make(tmp_path, [250], suffix=".jsonl")[0]
+    unsplittable = tmp_path / "b.txt"
+    unsplittable.write_bytes(b"x" * 150)
+    (tmp_path / "small").mkdir()
+    small = _make(tmp_path / "small", [10] * 25)
+    items = schedule([large, unsplittable] + small, chunk_size=100, small_file_size=20)
+    # jsonl 按字节拆分，txt 不拆分；小文件合并成约 chunk_size 的任务
+    assert [(item.unit, item.size, len(item.paths)) for item in items] == [
+        ("file", 150, 1), ("bytes", 100, 1), ("bytes", 100, 1), ("file", 100, 10), ("file", 100, 10),
+        ("bytes", 50, 1), ("file", 50, 5)]
+    assert [path for item in items if item.unit == "file" for path in item.paths][1:] == [
+        str(path) for path in small[:10] + small[10:20] + small[20:]]
+    # 同样的输入得到同样的键，合并的任务的键包含文件数量
+    assert str(items[3]).startswith(f"{small[0]}#files=10-")
+    assert [str(item) for item in items] == [
+        str(item) for item in schedule([large, unsplittable] + small, chunk_size=100, small_file_size=20)]
+
+
+def test_schedule_options(tmp_path):
+    paths = _make(tmp_path, [10] * 5 + [300], suffix=".jsonl")
+    items = schedule(paths, chunk_size=100, small_file_size=20, max_group_files=2, splitters={})
+    assert [(item.unit, item.size, len(item.paths)) for item in items] == [
+        ("file", 300, 1), ("file", 20, 2), ("file", 20, 2), ("file", 10, 1)]
+
+
+def test_split_parquet(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "a.parquet"
+    pq.write_table(pa.table({"text": [f"row {idx}" * 50 for idx in range(100)]}), path, row_group_size=10)
+    size = path.stat().st_size
+    items = schedule([path], chunk_size=size // 3, small_file_size=0)
+    # 连续的 row group 合并成约 chunk_size 的任务，覆盖所有 row group
+    assert all(item.unit == "row_groups" for item in items)
+    ranges = sorted((item.start, item.end) for item in items)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 10
+    assert all(prev[1] == nxt[0] for prev, nxt in zip(ranges, ranges[1:]))
+    assert 2 <= len(items) <= 4
+
+
+def _convert(path):
+    if path.endswith("bad.txt"):
+        yield "partial"
+        raise ValueError("bad file")
+    yield path
+
+
+def test_file_group_converter(tmp_path, caplog):
+    item = WorkItem(("a.txt", "bad.txt", "c.txt"), 0)
+    assert list(FileGroupConverter(_convert, skip_errors=True)(item)) == ["a.txt", "c.txt"]
+    assert "Error converting bad.txt" in caplog.text
+    with pytest.raises(ValueError):
+        list(FileGroupConverter(_convert)(item))
+    with pytest.raises(Exception, match="only whole files"):
+        list(FileGroupConverter(_convert)(WorkItem(("a.jsonl",), 10, "bytes", 0, 10)))
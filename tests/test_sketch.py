@@ -0,0 +1,89 @@
+import random
+from collections import Counter
+
+from mnbvc.utils import sketch
+from mnbvc.utils.sketch import LineCounter, RepeatedLineCollector, document_lines, find_repeated_lines
+
+
+def make_documents(count: int, seed: int = 0) -> list:
+    """每个文档有几行只出现一次的行，所有文档都有页脚，每 4 个文档有一行广告，每 10 个文档有一行页眉。"""
+    rng = random.Random(seed)
+    documents = []
+    for idx in range(count):
+        lines = [f"unique line {idx}-{j}-{rng.random()}" for j in range(5)]
+        lines.append("footer: all rights reserved")
+        if idx % 4 == 0:
+            lines.append("advertisement: download more books")
+        if idx % 10 == 0:
+            lines.append("header: welcome to the site")
+        rng.shuffle(lines)
+        documents.append(lines)
+    return documents
+
+
+def exact_counts(documents: list, min_count: int) -> dict:
+    counts = Counter(line for document in documents for line in document_lines(document, 5))
+    return {line: count for line, count in counts.items() if count >= min_count}
+
+
+def read_document(document):
+    yield document
+
+
+def test_exact_when_candidates_fit():
+    documents = make_documents(500)
+    boilerplate = find_repeated_lines(documents, min_count=20, read_documents=read_document, workers=1)
+    assert boilerplate.lines == exact_counts(documents, 20)
+    assert boilerplate.documents == 500
+
+
+def test_candidates_bounded_when_sketch_saturates():
+    documents = make_documents(4000)
+    counter = LineCounter(width=16, depth=2)
+    for document in documents:
+        counter.add_document(document)
+    counter.flush()
+    # sketch 太小，所有的行都是候选行
+    assert counter.sketch.estimate(["unique line 0-0"]).min() >= 20
+
+    capacity = 64
+    total = RepeatedLineCollector(counter.sketch, min_count=20, capacity=capacity)
+    for start in range(0, len(documents), 500):
+        collector = RepeatedLineCollector(counter.sketch, min_count=20, capacity=capacity)
+        for idx, document in enumerate(documents[start:start + 500]):
+            collector.add_document(document)
+            if idx % 50 == 0:
+                collector.flush()
+                assert len(collector.counts) <= capacity
+        total.merge(collector)
+        assert len(total.counts) <= capacity
+        assert len(total.errors) <= capacity
+
+    lines = total.lines()
+    expected = exact_counts(documents, 20)
+    assert set(lines) == set(expected)
+    for line, count in lines.items():
+        assert count <= expected[line]
+    assert lines["footer: all rights reserved"] == 4000
+
+
+def test_find_repeated_lines_capacity():
+    documents = make_documents(4000)
+    boilerplate = find_repeated_lines(
+        documents, min_count=20, read_documents=read_document, workers=1, width=16, depth=2, capacity=64)
+    assert set(boilerplate.lines) == set(exact_counts(documents, 20))
+
+
+def test_read_large_files_by_line(tmp_path, monkeypatch):
+    paths = []
+    for idx in range(30):
+        path = tmp_path / f"{idx}.txt"
+        path.write_text(f"重复的页眉行\n正文 {idx}\n重复的页脚行\n", encoding="utf-8")
+        paths.append(path)
+    expected = find_repeated_lines(paths, min_count=20, workers=1).lines
+    assert set(expected) == {"重复的页眉行", "重复的页脚行"}
+    # 所有文件都按大文件逐行读取
+    monkeypatch.setattr(sketch._decoding, "large_file_size", 0)
+    monkeypatch.setattr(sketch._decoding, "chunk_size", 5)
+    assert not isinstance(next(sketch.read_text_document(paths[0])), str)
+    assert find_repeated_lines(paths, min_count=20, workers=1).lines == expected
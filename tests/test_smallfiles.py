@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from mnbvc.utils.smallfiles import iter_file_batches, iter_file_contents, walk_files
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ["b/2.txt", "b/1.json", "a/c/3.txt", "a/0.txt", ".hidden/4.txt", "a/.5.txt", "6.bin"]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path
+
+
+def test_walk_files(tree):
+    names = [os.path.relpath(path, tree) for path in walk_files(tree)]
+    assert names == ["6.bin", "a/0.txt", "a/c/3.txt", "b/1.json", "b/2.txt"]
+    names = [os.path.relpath(path, tree) for path in walk_files(tree, suffixes=(".txt",), skip_hidden=False)]
+    assert names == [".hidden/4.txt", "a/.5.txt", "a/0.txt", "a/c/3.txt", "b/2.txt"]
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_iter_file_contents(tree, ordered):
+    paths = list(walk_files(tree)) + [str(tree / "missing.txt")]
+    results = list(iter_file_contents(paths, threads=3, prefetch=2, ordered=ordered))
+    if not ordered:
+        results.sort(key=lambda small_file: paths.index(small_file.path))
+    assert [small_file.path for small_file in results] == paths
+    assert [small_file.data for small_file in results[:-1]] == [
+        os.path.relpath(path, tree).encode() for path in paths[:-1]]
+    # 读取失败的文件返回异常，不影响其他文件
+    assert results[-1].data is None
+    assert isinstance(results[-1].error, FileNotFoundError)
+
+
+def test_iter_file_batches(tree):
+    paths = list(walk_files(tree))
+    batches = list(iter_file_batches(paths, batch_size=2, threads=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [small_file.path for batch in batches for small_file in batch] == paths
@@ -0,0 +1,115 @@
+import gzip
+import json
+import random
+from multiprocessing import Process
+
+import pytest
+
+from mnbvc.utils.memory import ByteBoundedQueue
+from mnbvc.utils.writer import RecordBatch, RecordBatchSender, SizeLimitedFileWriter, writer_worker
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_record_batch():
+    records = [b'{"a": 1}', b"", "中文".encode()]
+    batch = RecordBatch.pack(records, ["key", None, "键"])
+    assert list(batch.unpack_keyed()) == [(b'{"a": 1}', "key"), (b"", None), ("中文".encode(), "键")]
+    assert list(RecordBatch.pack(records).unpack()) == records
+
+
+class _ListQueue(list):
+    put = list.append
+
+
+def test_sender_batches():
+    queue = _ListQueue()
+    with RecordBatchSender(queue, batch_size=20, index_key="id") as sender:
+        for idx in range(5):
+            sender.send({"id": f"r{idx}", "text": "x"})
+    # 每条记录约 24 字节，超过 batch_size 就发送一批；退出时发送剩下的记录
+    assert [len(list(batch.unpack())) for batch in queue] == [1] * 5
+    queue = _ListQueue()
+    with RecordBatchSender(queue, batch_size=1 << 20, index_key="id") as sender:
+        for idx in range(5):
+            sender.send({"id": f"r{idx}", "text": "x"})
+        assert queue == []
+    assert len(queue) == 1
+    assert [key for _, key in queue[0].unpack_keyed()] == [f"r{idx}" for idx in range(5)]
+
+
+def test_writer_worker(tmp_path):
+    queue = ByteBoundedQueue(64)
+    writer_kwargs = dict(output_folder=tmp_path, index=True, stats_interval=None)
+    process = Process(target=writer_worker, args=(writer_kwargs, queue))
+    process.start()
+    with RecordBatchSender(queue, batch_size=32, index_key="文件名") as sender:
+        for idx in range(50):
+            sender.send({"文件名": f"{idx}.txt", "idx": idx})
+    queue.put({"文件名": "single.txt", "idx": 50})
+    # 结束标记：写入进程写完后关闭文件并退出
+    queue.put(None)
+    process.join(30)
+    assert process.exitcode == 0
+    assert [record["idx"] for record in _read(tmp_path / "000.jsonl")] == list(range(51))
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def _records(count, seed=0):
+    # 一半是随机的十六进制（压缩率约 0.5），一半是重复的文字
+    rng = random.Random(seed)
+    return [
+        {"idx": idx, "text": "%x" % rng.getrandbits(rng.randint(8, 4000)) if idx % 2 else "重复的文字" * rng.randint(1, 200)}
+        for idx in range(count)
+    ]
+
+
+def _read_shards(folder, pattern):
+    shards = []
+    for path in sorted(folder.glob(pattern)):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as fp:
+            shards.append([json.loads(line) for line in fp])
+    return shards
+
+
+@pytest.mark.parametrize("compresslevel", [1, 9])
+@pytest.mark.parametrize("write_buffer_size", [1, 1 << 20])
+def test_gzip_size_limit(tmp_path, compresslevel, write_buffer_size):
+    limit = 64 << 10
+    records = _records(2000)
+    with SizeLimitedFileWriter(
+        tmp_path, filename_fmt="{}.jsonl.gz", file_size_limit_mb=limit / (1 << 20), compresslevel=compresslevel,
+        write_buffer_size=write_buffer_size, stats_interval=None,
+    ) as writer:
+        writer.write_many(records)
+    sizes = [path.stat().st_size for path in sorted(tmp_path.glob("*.jsonl.gz"))]
+    assert len(sizes) > 3
+    assert [shard["size"] for shard in writer.shards] == sizes
+    # 每个文件都不超过限制，并且除了最后一个文件都接近写满
+    assert max(sizes) <= limit
+    assert min(sizes[:-1]) > limit * 0.9
+    assert [record for shard in _read_shards(tmp_path, "*.jsonl.gz") for record in shard] == records
+
+
+@pytest.mark.parametrize("filename_fmt", ["{}.jsonl", "{}.jsonl.gz"])
+@pytest.mark.parametrize("limits", [dict(file_size_limit_mb=0.02), dict(file_records_limit=7)])
+def test_write_many_same_as_writeline(tmp_path, filename_fmt, limits):
+    records = _records(500)
+    kwargs = dict(filename_fmt=filename_fmt, write_buffer_size=4096, stats_interval=None, **limits)
+    with SizeLimitedFileWriter(tmp_path / "many", **kwargs) as writer:
+        writer.write_many(records[:100])
+        writer.write_many(records[100:])
+    with SizeLimitedFileWriter(tmp_path / "lines", **kwargs) as writer:
+        for record in records:
+            writer.writeline(record)
+    pattern = filename_fmt.format("*")
+    many = _read_shards(tmp_path / "many", pattern)
+    assert len(many) > 3
+    assert many == _read_shards(tmp_path / "lines", pattern)
+    if filename_fmt.endswith(".jsonl"):
+        for path in (tmp_path / "many").glob(pattern):
+            assert path.read_bytes() == (tmp_path / "lines" / path.name).read_bytes()